@@ -0,0 +1,4 @@
+"""
+Benchmarks for the simulation, they don't need PyGame and must be run from the
+`src` directory, for example: `python -m bench.broadphase`.
+"""
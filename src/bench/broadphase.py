@@ -0,0 +1,88 @@
+from typing import List, Type
+import random
+import time
+
+from stage import Stage
+from entity.player import PlayerColor
+from entity.effect import EffectType
+from entity.hitbox import Hitbox
+from entity.bullet import Bullet
+from entity import Entity
+
+
+PASSIVE_COUNTS = (0, 100, 200, 400, 800, 1600)
+TICKS = 200
+
+
+class LinearIndex:
+
+    """ Drop-in replacement for the spatial grids that scans every entity, used as a reference. """
+
+    def __init__(self, stage: Stage, kind: Type[Entity]):
+        self._stage = stage
+        self._kind = kind
+        self._version = 0
+
+    def update(self, _entity: Entity):
+        self._version += 1
+
+    def remove(self, _entity: Entity):
+        self._version += 1
+
+    def get_version(self) -> int:
+        # Like `StaticWorld`, so that the floors index can be replaced too.
+        return self._version
+
+    def query(self, _box: Hitbox) -> List[Entity]:
+        return [entity for entity in self._stage.get_entities() if isinstance(entity, self._kind)]
+
+
+def build_stage(passive_count: int, linear: bool) -> Stage:
+
+    rand = random.Random(passive_count)
+    stage = Stage.new_example_stage()
+    if linear:
+        stage._grids = {kind: LinearIndex(stage, kind) for kind in stage._grids}
+
+    for player_idx, color in enumerate(list(PlayerColor)[:4]):
+        stage.add_player(player_idx, color)
+
+    # Passive entities scattered over the stage, effects with no duration never die.
+    width, height = stage.get_size()
+    for _ in range(passive_count):
+        stage.add_effect(EffectType.SMOKE, 0, rand.uniform(0, width), rand.uniform(0, height))
+
+    return stage
+
+
+def fire_bullets(stage: Stage):
+    """ Keep a gatling burst alive by firing a bullet from every player each tick. """
+    for player in stage.get_players().values():
+        to_left = player.get_x() > stage.get_size()[0] / 2
+        bullet = stage.add_entity(Bullet, player, 0.0, -0.4 if to_left else 0.4)
+        bullet.set_position(player.get_x(), player.get_y() + 4.0)
+
+
+def run_ticks(stage: Stage, ticks: int) -> float:
+    start = time.perf_counter()
+    for _ in range(ticks):
+        fire_bullets(stage)
+        stage.update()
+    return (time.perf_counter() - start) / ticks
+
+
+def main():
+
+    print("Average tick time over {} ticks (4 players firing bullets)".format(TICKS))
+    print("{:>9} | {:>12} | {:>12} | {:>8}".format("passive", "linear (µs)", "grid (µs)", "speedup"))
+
+    for count in PASSIVE_COUNTS:
+        linear_time = run_ticks(build_stage(count, True), TICKS)
+        grid_time = run_ticks(build_stage(count, False), TICKS)
+        print("{:>9} | {:>12.1f} | {:>12.1f} | {:>7.1f}x".format(
+            count, linear_time * 1e6, grid_time * 1e6, linear_time / grid_time
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Memory benchmark of the entities: bytes allocated per entity of each kind and
+attribute access throughput with 10k live entities in a stage.
+Usage: `python -m bench.memory [--count N] [--output FILE]`
+"""
+
+from typing import Callable, Dict, List, Tuple
+import tracemalloc
+import argparse
+import platform
+import json
+import time
+
+from stage import Stage
+from entity.player import Player, PlayerColor, IncarnationType
+from entity.effect import Effect, EffectType
+from entity.bullet import Bullet
+from entity.floor import Floor
+from entity.item import Item
+from entity import Entity
+
+
+# Kind name -> (constructor, arguments builder from the stage)
+KINDS: Dict[str, Tuple[Callable[..., Entity], Callable[[Stage], tuple]]] = {
+    "Player": (Player, lambda stage: (0, PlayerColor.RED)),
+    "Item": (Item, lambda stage: (IncarnationType.CORN,)),
+    "Bullet": (Bullet, lambda stage: (stage.get_player(0), 1.0, 0.4)),
+    "Effect": (Effect, lambda stage: (EffectType.SMOKE, 1.0)),
+    "Floor": (Floor, lambda stage: ())
+}
+
+
+def _new_stage() -> Stage:
+    stage = Stage(2000, 13)
+    stage.add_spawn_point(1, 5)
+    stage.add_player(0, PlayerColor.RED)
+    return stage
+
+
+def measure_bytes(name: str, count: int) -> Tuple[float, float]:
+
+    """
+    Return the bytes allocated per entity of the given kind, for the entity
+    objects alone and for entities added to a stage (buckets and broadphase).
+    """
+
+    constructor, args_builder = KINDS[name]
+
+    stage = _new_stage()
+    args = args_builder(stage)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    entities = [constructor(stage, *args) for _ in range(count)]
+    object_bytes = (tracemalloc.get_traced_memory()[0] - start) / count
+    tracemalloc.stop()
+    del entities
+
+    stage = _new_stage()
+    args = args_builder(stage)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        stage.add_entity(constructor, *args).set_position(1 + (i % 1998), 6)
+    stage_bytes = (tracemalloc.get_traced_memory()[0] - start) / count
+    tracemalloc.stop()
+
+    return object_bytes, stage_bytes
+
+
+def measure_access(count: int, rounds: int) -> float:
+
+    """
+    Return the millions of attribute reads per second over all live motion
+    entities of a stage, reading position, velocity and hitbox like the physics.
+    """
+
+    stage = _new_stage()
+    for i in range(count):
+        stage.add_entity(Item, IncarnationType.CORN).set_position(1 + (i % 1998), 6)
+
+    entities: List[Item] = list(stage.get_entities_of(Item))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for entity in entities:
+            hitbox = entity._hitbox
+            _ = entity._x, entity._y, entity._vel_x, entity._vel_y, entity._on_ground, \
+                hitbox._min_x, hitbox._min_y, hitbox._max_x, hitbox._max_y
+    duration = time.perf_counter() - start
+
+    # 10 attribute reads per entity and round (hitbox included).
+    return count * rounds * 10 / duration / 1e6
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measure entities memory footprint and attribute access throughput.")
+    parser.add_argument("--count", type=int, default=10000, help="number of live entities (default: 10000)")
+    parser.add_argument("--rounds", type=int, default=50, help="attribute access rounds (default: 50)")
+    parser.add_argument("--output", default=None, help="results file, the run is appended as a JSON line")
+    args = parser.parse_args()
+
+    results = {}
+
+    print("{:>8} | {:>14} | {:>14}".format("kind", "object (B)", "in stage (B)"))
+    for name in KINDS:
+        object_bytes, stage_bytes = measure_bytes(name, args.count)
+        results[name] = {"object_bytes": round(object_bytes, 1), "stage_bytes": round(stage_bytes, 1)}
+        print("{:>8} | {:>14.1f} | {:>14.1f}".format(name, object_bytes, stage_bytes))
+
+    access = measure_access(args.count, args.rounds)
+    print("Attribute access with {} live entities: {:.1f} M reads/s".format(args.count, access))
+
+    if args.output is not None:
+        with open(args.output, "at") as fp:
+            fp.write(json.dumps({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "count": args.count,
+                "kinds": results,
+                "access_mreads_per_second": round(access, 1)
+            }) + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Cross-check and benchmark of the array-backed motion engine against the
+per-object integration, over the benchmark suite scenarios.
+Usage: `python -m bench.motion [--scenario NAME]`
+"""
+
+from typing import List, Optional, Tuple
+import argparse
+import random
+import time
+
+from stage import Stage
+from entity.motion import MotionEngine
+from bench.suite import Scenario, SCENARIOS
+from headless import apply_script
+
+
+def _state(stage: Stage) -> List[Tuple[float, ...]]:
+    return [(entity.get_x(), entity.get_y(), getattr(entity, "_vel_x", 0.0), getattr(entity, "_vel_y", 0.0))
+            for entity in stage.get_entities()]
+
+
+def run(scenario: Scenario, engine: Optional[MotionEngine]) -> Tuple[float, List[list]]:
+
+    random.seed(scenario.name)
+    stage = scenario.setup()
+    stage.set_seed(scenario.get_seed())
+    stage.set_motion_engine(engine)
+
+    states = []
+    duration = 0.0
+    for _ in range(scenario.ticks):
+        start = time.perf_counter()
+        apply_script(stage, scenario.script)
+        stage.update()
+        duration += time.perf_counter() - start
+        states.append(_state(stage))
+
+    return duration, states
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Cross-check the motion engine against per-object integration.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS.keys(), help="scenario to run (default: all)")
+    args = parser.parse_args()
+
+    engines = [("object", None), ("loop", lambda: MotionEngine(vectorized=False))]
+    if MotionEngine.is_vectorization_available():
+        engines.append(("numpy", lambda: MotionEngine(vectorized=True)))
+    else:
+        print("NumPy is not available, only the loop engine is checked.")
+
+    for name in (args.scenario or SCENARIOS.keys()):
+
+        scenario = SCENARIOS[name]
+        reference_duration, reference_states = run(scenario, None)
+        print("{:>14} | object: {:>8.0f} ticks/s".format(name, scenario.ticks / reference_duration), end="")
+
+        for engine_name, engine_constructor in engines[1:]:
+            duration, states = run(scenario, engine_constructor())
+            diverged_at = next((tick for tick, (a, b) in enumerate(zip(reference_states, states)) if a != b), None)
+            print(" | {}: {:>8.0f} ticks/s, {}".format(
+                engine_name, scenario.ticks / duration,
+                "identical" if diverged_at is None else "diverged at tick {}".format(diverged_at)
+            ), end="")
+
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark of stage snapshots: time of `Stage.save_state` and `Stage.load_state`
+in a 4 players match, and check that a restored stage simulates the same
+ticks again exactly (same packed state, same random generator state).
+Usage: `python -m bench.state [--iterations N] [--rollback TICKS] [--output FILE]`
+"""
+
+from typing import Dict, List
+from time import perf_counter_ns
+import argparse
+import platform
+import random
+import json
+import time
+
+from stage import Stage
+from headless import apply_script, script_brawl, new_stage
+
+
+def _percentile(values: List[int], ratio: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))] / 1000
+
+
+def _run(stage: Stage, ticks: int, inputs: List[Dict[int, int]]):
+    """ Run ticks with the brawl script, appending the commands of each tick to `inputs`. """
+    stage.set_input_callback(lambda _tick, tick_inputs: inputs.append(dict(tick_inputs)))
+    for _ in range(ticks):
+        apply_script(stage, script_brawl)
+        stage.update()
+    stage.set_input_callback(None)
+
+
+def _replay(stage: Stage, inputs: List[Dict[int, int]]):
+    for tick_inputs in inputs:
+        for player_idx, commands in tick_inputs.items():
+            stage.set_input(player_idx, commands)
+        stage.update()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measure stage snapshot and restore times.")
+    parser.add_argument("--players", type=int, default=4, help="number of players (default: 4)")
+    parser.add_argument("--warmup", type=int, default=600, help="ticks simulated before measuring (default: 600)")
+    parser.add_argument("--iterations", type=int, default=2000, help="snapshots and restores measured (default: 2000)")
+    parser.add_argument("--rollback", type=int, default=8, help="ticks simulated between a snapshot and its restore (default: 8)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the stage and script (default: 1)")
+    parser.add_argument("--output", default=None, help="results file, the run is appended as a JSON line")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    stage = new_stage(args.players, args.seed)
+    _run(stage, args.warmup, [])
+
+    save_times = []
+    load_times = []
+    rollback_times = []
+    mismatches = 0
+    size = 0
+
+    for _ in range(args.iterations):
+
+        start = perf_counter_ns()
+        state = stage.save_state()
+        save_times.append(perf_counter_ns() - start)
+        size = len(state.data)
+
+        # Simulate some ticks, then restore the state and simulate them again.
+        inputs: List[Dict[int, int]] = []
+        _run(stage, args.rollback, inputs)
+        expected = stage.save_state()
+
+        start = perf_counter_ns()
+        stage.load_state(state)
+        load_times.append(perf_counter_ns() - start)
+        _replay(stage, inputs)
+        rollback_times.append(perf_counter_ns() - start)
+
+        actual = stage.save_state()
+        if actual.data != expected.data or actual.random_state != expected.random_state:
+            mismatches += 1
+
+        if stage.is_finished():
+            random.seed(args.seed + len(save_times))
+            stage = new_stage(args.players, args.seed + len(save_times))
+            _run(stage, args.warmup, [])
+
+    results = {
+        "save_us": round(sum(save_times) / len(save_times) / 1000, 1),
+        "save_p99_us": round(_percentile(save_times, 0.99), 1),
+        "load_us": round(sum(load_times) / len(load_times) / 1000, 1),
+        "load_p99_us": round(_percentile(load_times, 0.99), 1),
+        "rollback_us": round(sum(rollback_times) / len(rollback_times) / 1000, 1),
+        "state_bytes": size,
+        "mismatches": mismatches
+    }
+
+    print("Save state: {save_us} us (p99 {save_p99_us} us), {state_bytes} bytes".format(**results))
+    print("Load state: {load_us} us (p99 {load_p99_us} us)".format(**results))
+    print("Load and resimulate {} ticks: {} us".format(args.rollback, results["rollback_us"]))
+    print("Resimulated ticks: {}".format("identical" if mismatches == 0 else "{} mismatches".format(mismatches)))
+
+    if args.output is not None:
+        with open(args.output, "at") as fp:
+            fp.write(json.dumps({
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "players": args.players,
+                "rollback_ticks": args.rollback,
+                **results
+            }) + "\n")
+
+
+if __name__ == '__main__':
+    main()
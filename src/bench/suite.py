@@ -0,0 +1,253 @@
+"""
+Benchmark suite driving `Stage.update` over named stress scenarios, each run
+is appended to a JSON lines results file so that runs can be compared.
+Usage: `python -m bench.suite [--scenario NAME] [--output FILE]`
+"""
+
+from typing import Callable, Dict, List, Optional
+import argparse
+import platform
+import random
+import json
+import time
+import zlib
+
+from stage import Stage
+from entity.player import Player, PlayerColor, PlayerInput, IncarnationType
+from entity.floor import Floor
+from entity.item import Item
+from headless import PlayerScript, script_idle, script_walk, apply_script, new_stage
+from bot import BotScript, Bot
+
+
+class Scenario:
+
+    __slots__ = "name", "description", "ticks", "setup", "script"
+
+    def __init__(self, name: str, description: str, ticks: int, setup: Callable[[], Stage], script: PlayerScript):
+        self.name = name
+        self.description = description
+        self.ticks = ticks
+        self.setup = setup
+        self.script = script
+
+    def get_seed(self) -> int:
+        """ Seed of the stage random generator, derived from the name so that runs are reproducible. """
+        return zlib.crc32(self.name.encode())
+
+
+class ScenarioResult:
+
+    __slots__ = "scenario", "ticks", "duration", "latencies", "peak_entities"
+
+    def __init__(self, scenario: Scenario):
+        self.scenario = scenario
+        self.ticks = 0
+        self.duration = 0.0
+        self.latencies: List[int] = []
+        self.peak_entities = 0
+
+    def get_percentile(self, percentile: float) -> float:
+        """ Return the tick latency percentile in microseconds. """
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index] / 1000
+
+    def to_json(self) -> dict:
+        return {
+            "scenario": self.scenario.name,
+            "ticks": self.ticks,
+            "ticks_per_second": round(self.ticks / self.duration, 1),
+            "p50_us": round(self.get_percentile(50), 1),
+            "p99_us": round(self.get_percentile(99), 1),
+            "peak_entities": self.peak_entities
+        }
+
+
+# Scenarios setup and scripts
+
+def _setup_idle_farmers() -> Stage:
+    return new_stage(4)
+
+
+def _setup_corn_gatling() -> Stage:
+    stage = new_stage(4)
+    for player in stage.get_players().values():
+        player.load_incarnation(IncarnationType.CORN)
+    return stage
+
+
+def _script_corn_gatling(stage: Stage, player: Player) -> int:
+    """ Keep every corn alive and firing its gatling in both directions. """
+    player.set_hp(player.get_max_hp())
+    if player.get_incarnation_type() != IncarnationType.CORN:
+        player.load_incarnation(IncarnationType.CORN)
+    if not player.is_in_special_action():
+        player.set_turned_to_left(stage.get_tick() % 2 == 0)
+        player.block_heavy_action_for(0)
+        return PlayerInput.HEAVY_ACTION
+    return PlayerInput.NONE
+
+
+def _setup_bots() -> Stage:
+    stage = new_stage(16, stage_source="crowd")
+    # Players never die, so that all the bots play until the end of the scenario.
+    for player in stage.get_players().values():
+        player.set_hp(1e9)
+    return stage
+
+
+def _setup_grab_throw() -> Stage:
+    return new_stage(4)
+
+
+def _script_grab_throw(stage: Stage, player: Player) -> int:
+    """
+    Odd players sleep, even players walk to the next player and grab it. The
+    throw sets the velocity of the sleeper in the update of the grabber, which
+    comes first in the tick.
+    """
+    player.set_hp(player.get_max_hp())
+    if player.get_player_index() % 2:
+        if player.get_incarnation_type() is None:
+            player.load_incarnation(IncarnationType.POTATO)
+        return PlayerInput.DOWN if not player.is_sleeping() and player.is_on_ground() else PlayerInput.NONE
+    dx = stage.get_player(player.get_player_index() + 1).get_x() - player.get_x()
+    if abs(dx) > 0.3:
+        return PlayerInput.LEFT if dx < 0 else PlayerInput.RIGHT
+    return PlayerInput.DOWN
+
+
+def _setup_many_items() -> Stage:
+    stage = new_stage(4)
+    rand = random.Random(0)
+    incarnation_types = list(IncarnationType)
+    floors = stage.get_exposed_floors()
+    for _ in range(400):
+        hitbox = rand.choice(floors).get_hitbox()
+        x = rand.uniform(hitbox.get_min_x(), hitbox.get_max_x())
+        stage.add_entity(Item, rand.choice(incarnation_types)).set_position(x, hitbox.get_max_y() + rand.uniform(0, 8))
+    return stage
+
+
+def _setup_wide_stage() -> Stage:
+
+    width, height = 2000, 13
+    stage = Stage(width, height)
+
+    stage.set_terrain(1, 3, b"K" * (width - 2), b"#" * (width - 2))
+    stage.add_entity(Floor).set_box(1, 2, width - 1, 4)
+    for x in range(8, width - 8, 12):
+        stage.add_entity(Floor).set_box(x, 7 + (x // 12) % 3, x + 4, 8 + (x // 12) % 3)
+
+    colors = list(PlayerColor)
+    for player_idx in range(4):
+        stage.add_spawn_point(width * (player_idx + 1) / 5, 5)
+        stage.add_player(player_idx, colors[player_idx])
+
+    return stage
+
+
+def _setup_many_platforms() -> Stage:
+
+    width, height = 200, 13
+    stage = Stage(width, height)
+
+    stage.add_entity(Floor).set_box(1, 2, width - 1, 4)
+    for i in range(400):
+        x = 30 + i * 0.4
+        stage.add_entity(Floor).set_box(x, 7 + i % 5, x + 1, 8 + i % 5)
+
+    colors = list(PlayerColor)
+    for player_idx in range(4):
+        stage.add_spawn_point(6 + player_idx * 6, 5)
+        stage.add_player(player_idx, colors[player_idx])
+        stage.get_player(player_idx).load_incarnation(IncarnationType.CORN)
+
+    return stage
+
+
+SCENARIOS: Dict[str, Scenario] = {scenario.name: scenario for scenario in (
+    Scenario("idle_farmers", "Four idle farmers on the example stage", 3000, _setup_idle_farmers, script_idle),
+    Scenario("corn_gatling", "Four corns firing the gatling continuously", 3000, _setup_corn_gatling, _script_corn_gatling),
+    Scenario("grab_throw", "Two farmers grabbing and throwing sleeping potatoes", 1500, _setup_grab_throw, _script_grab_throw),
+    Scenario("many_items", "Four walking farmers and 400 items", 1500, _setup_many_items, script_walk),
+    Scenario("wide_stage", "Four walking farmers on a 2000 tiles wide stage", 1500, _setup_wide_stage, script_walk),
+    Scenario("many_platforms", "Four corns firing the gatling on a stage with 400 platforms", 1500, _setup_many_platforms, _script_corn_gatling),
+    Scenario("bots", "Sixteen immortal bots fighting on the example stage", 1500, _setup_bots, BotScript(Bot, 0)),
+)}
+
+
+def run_scenario(scenario: Scenario) -> ScenarioResult:
+
+    random.seed(scenario.name)
+    stage = scenario.setup()
+    stage.set_seed(scenario.get_seed())
+    script = scenario.script
+    result = ScenarioResult(scenario)
+    latencies = result.latencies
+    perf_counter_ns = time.perf_counter_ns
+
+    for _ in range(scenario.ticks):
+        start = perf_counter_ns()
+        apply_script(stage, script)
+        stage.update()
+        latencies.append(perf_counter_ns() - start)
+        result.peak_entities = max(result.peak_entities, len(stage.get_entities()))
+
+    result.ticks = scenario.ticks
+    result.duration = sum(latencies) / 1e9
+    return result
+
+
+def load_last_results(path: str) -> Dict[str, dict]:
+    """ Return the last recorded result of each scenario in the given results file. """
+    results = {}
+    try:
+        with open(path, "rt") as fp:
+            for line in fp:
+                run = json.loads(line)
+                for result in run["results"]:
+                    results[result["scenario"]] = result
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the stage benchmark scenarios.")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS.keys(),
+                        help="scenario to run, can be repeated (default: all)")
+    parser.add_argument("--output", default="bench_results.jsonl",
+                        help="results file, each run is appended as a JSON line (default: bench_results.jsonl)")
+    parser.add_argument("--label", default=None, help="label stored with the run, to identify it later")
+    args = parser.parse_args()
+
+    previous = load_last_results(args.output)
+    results = []
+
+    print("{:>14} | {:>10} | {:>10} | {:>10} | {:>6} | {:>8}".format(
+        "scenario", "ticks/s", "p50 (µs)", "p99 (µs)", "peak", "vs last"))
+
+    for name in (args.scenario or SCENARIOS.keys()):
+        data = run_scenario(SCENARIOS[name]).to_json()
+        results.append(data)
+        last: Optional[dict] = previous.get(name)
+        diff = "" if last is None else "{:+.1f}%".format((data["ticks_per_second"] / last["ticks_per_second"] - 1) * 100)
+        print("{:>14} | {:>10.0f} | {:>10.1f} | {:>10.1f} | {:>6} | {:>8}".format(
+            name, data["ticks_per_second"], data["p50_us"], data["p99_us"], data["peak_entities"], diff))
+
+    with open(args.output, "at") as fp:
+        fp.write(json.dumps({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "label": args.label,
+            "python": platform.python_version(),
+            "results": results
+        }) + "\n")
+
+    print("Results appended to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
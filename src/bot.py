@@ -0,0 +1,291 @@
+"""
+Bots playing like humans: each tick, a bot reads the stage around its player
+and returns the commands (`PlayerInput` flags) a human would press, so bots
+drive players through `Stage.set_input` like the keyboard and their matches
+can be recorded, replayed and played online.
+Difficulty levels are subclasses of `Bot` registered in `DIFFICULTIES`.
+"""
+
+from typing import Dict, Optional, Type
+import random
+
+from entity.player import Player, PlayerInput, IncarnationType
+from entity.hitbox import Hitbox
+from entity.item import Item
+from entity import Entity
+from stage import Stage
+
+
+# Commands as plain integers, the operators of `PlayerInput` flags are slow.
+UP, DOWN, LEFT, RIGHT, ACTION, HEAVY_ACTION = (int(flag) for flag in (
+    PlayerInput.UP, PlayerInput.DOWN, PlayerInput.LEFT, PlayerInput.RIGHT, PlayerInput.ACTION, PlayerInput.HEAVY_ACTION))
+
+# Goals of a bot between two decisions.
+GOAL_NONE = 0
+GOAL_FIGHT = 1
+GOAL_ITEM = 2
+GOAL_GRAB = 3
+
+# Horizontal distance to an opponent under which the action of each incarnation (None for the farmer) hits it.
+ATTACK_RANGES: Dict[Optional[IncarnationType], float] = {
+    None: 1.2,
+    IncarnationType.POTATO: 1.2,
+    IncarnationType.CARROT: 1.2,
+    IncarnationType.CORN: 8.0
+}
+
+# Vertical distance to an opponent under which attacks hit it.
+ATTACK_HEIGHT = 1.2
+# Horizontal distance to a target on an upper floor from which the bot jumps toward it.
+JUMP_DISTANCE = 2.0
+# Horizontal distance to a sleeping opponent under which it can be grabbed.
+GRAB_RANGE = 0.8
+
+
+class Bot:
+
+    """
+    Bot of a player. The stage is only read when the bot takes a decision,
+    every `REACTION_TICKS` ticks (plus a random part), to pick its goal: an
+    opponent to fight, an item to pick or a sleeping opponent to grab. Each
+    tick in between, it only steers toward the goal, so a bot costs a few
+    attribute reads per tick. Subclasses tune the class constants, or
+    override `think` and `steer` for other behaviors.
+    """
+
+    __slots__ = "_random", "_view", "_goal", "_target", "_goal_tick", "_ignored", "_ticks", "_next_think_tick", "_last_x", "_moving"
+
+    # Ticks between two decisions, the reaction time of the bot.
+    REACTION_TICKS = 12
+    # Half width and half height of the view box around the player, where items and sleepers are seen.
+    VIEW_RANGE = 8.0
+    # Chance to press the action each tick when an opponent is in range.
+    ACTION_CHANCE = 0.5
+    # Chance to press the heavy action each tick when an opponent is in range.
+    HEAVY_ACTION_CHANCE = 0.03
+    # Pick items to get an incarnation.
+    PICK_ITEMS = True
+    # Grab sleeping opponents, they are not hit by attacks.
+    GRAB_SLEEPERS = True
+    # Sleep to regenerate below this hp ratio (only with an incarnation), never if 0.
+    SLEEP_HP_RATIO = 0.0
+    # Wake up above this hp ratio.
+    WAKE_HP_RATIO = 0.8
+    # Wake up when an opponent is closer than this distance, before being grabbed.
+    WAKE_DISTANCE = 2.5
+    # Ticks after which an item or a sleeper not reached is ignored, it may be out of reach.
+    GIVE_UP_TICKS = 240
+
+    def __init__(self, seed: Optional[int] = None):
+        # Own generator: bots must not consume the stage random generator.
+        self._random = random.Random(seed)
+        self._view = Hitbox(0, 0, 0, 0)
+        self._goal = GOAL_NONE
+        self._target: Optional[Entity] = None
+        self._goal_tick = 0
+        self._ignored: Optional[Entity] = None
+        # Ticks played by the bot, the stage may be a mirror that is never updated (see `net.mirror`).
+        self._ticks = 0
+        self._next_think_tick = 0
+        self._last_x = 0.0
+        self._moving = False
+
+    def get_goal(self) -> int:
+        return self._goal
+
+    def get_commands(self, stage: Stage, player: Player) -> int:
+        """ Return the commands of the player for the next tick. """
+        self._ticks += 1
+        if self._ticks >= self._next_think_tick:
+            self._next_think_tick = self._ticks + self.REACTION_TICKS + self._random.randrange(self.REACTION_TICKS // 2 + 1)
+            commands = self.think(stage, player)
+        else:
+            target = self._target
+            if target is not None and target.is_dead():
+                self._goal, self._target = GOAL_NONE, None
+            commands = 0
+        if not player.is_sleeping():
+            commands |= self.steer(player)
+        self._last_x = player.get_x()
+        self._moving = bool(commands & (LEFT | RIGHT))
+        return commands
+
+    def think(self, stage: Stage, player: Player) -> int:
+
+        """ Choose the goal of the bot, return the commands not given by steering (sleeping or waking up). """
+
+        x, y = player.get_x(), player.get_y()
+        tick = self._ticks
+        previous_goal, previous_target = self._goal, self._target
+        if previous_goal in (GOAL_ITEM, GOAL_GRAB) and tick - self._goal_tick > self.GIVE_UP_TICKS:
+            self._ignored = previous_target
+
+        opponent: Optional[Player] = None
+        opponent_dist = 0.0
+        sleeper: Optional[Player] = None
+        sleeper_dist = 0.0
+        for other in stage.get_entities_of(Player):
+            if other is player or other.is_dead():
+                continue
+            dist = abs(other.get_x() - x) + abs(other.get_y() - y)
+            if other.is_sleeping():
+                if other is not self._ignored and (sleeper is None or dist < sleeper_dist):
+                    sleeper, sleeper_dist = other, dist
+            elif opponent is None or dist < opponent_dist:
+                opponent, opponent_dist = other, dist
+
+        self._goal, self._target = GOAL_NONE, None
+
+        if player.is_sleeping():
+            if player.get_hp_ratio() >= self.WAKE_HP_RATIO or (opponent is not None and opponent_dist < self.WAKE_DISTANCE):
+                return UP
+            return 0
+
+        if player.has_incarnation() and player.get_hp_ratio() < self.SLEEP_HP_RATIO \
+                and (opponent is None or opponent_dist > self.WAKE_DISTANCE) and player.is_on_ground():
+            return DOWN
+
+        if self.GRAB_SLEEPERS and sleeper is not None and sleeper_dist < self.VIEW_RANGE:
+            self._goal, self._target = GOAL_GRAB, sleeper
+        elif self.PICK_ITEMS and not player.has_incarnation():
+            item = self._find_item(stage, player)
+            if item is not None and (opponent is None or abs(item.get_x() - x) < opponent_dist):
+                self._goal, self._target = GOAL_ITEM, item
+
+        if self._goal == GOAL_NONE and opponent is not None:
+            self._goal, self._target = GOAL_FIGHT, opponent
+
+        if self._goal != previous_goal or self._target is not previous_target:
+            self._goal_tick = tick
+
+        return 0
+
+    def _find_item(self, stage: Stage, player: Player) -> Optional[Item]:
+        x, y = player.get_x(), player.get_y()
+        view_range = self.VIEW_RANGE
+        self._view.set_positions(x - view_range, y - view_range, x + view_range, y + view_range)
+        nearest: Optional[Item] = None
+        nearest_dist = 0.0
+        for item in stage.foreach_colliding_entity(self._view, kinds=(stage.ITEM_KIND,)):
+            if item is self._ignored:
+                continue
+            dist = abs(item.get_x() - x)
+            if nearest is None or dist < nearest_dist:
+                nearest, nearest_dist = item, dist
+        return nearest
+
+    def steer(self, player: Player) -> int:
+
+        """ Return the commands moving the player toward its target, and using it when in range. """
+
+        target = self._target
+        if target is None:
+            return 0
+
+        goal = self._goal
+        dx = target.get_x() - player.get_x()
+        dy = target.get_y() - player.get_y()
+
+        if goal == GOAL_FIGHT:
+            reach = ATTACK_RANGES[player.get_incarnation_type()]
+        elif goal == GOAL_GRAB:
+            reach = GRAB_RANGE
+        else:
+            reach = 0.0  # Walk over items to pick them.
+
+        commands = 0
+        to_left = dx < 0
+
+        if abs(dx) > reach or (goal == GOAL_ITEM and abs(dy) > 1.0):
+            on_ground = player.is_on_ground()
+            if dy > 1.0 and on_ground and abs(dx) < JUMP_DISTANCE:
+                # Target on an upper floor, step aside to jump on it instead of under it.
+                return RIGHT if to_left else LEFT
+            commands |= LEFT if to_left else RIGHT
+            if on_ground and (dy > 1.0 or (self._moving and player.get_x() == self._last_x)):
+                # Target on an upper floor, or blocked by a wall.
+                commands |= UP
+            return commands
+
+        if player.get_turned_to_left() != to_left and goal != GOAL_GRAB:
+            # Turn toward the target before attacking.
+            return LEFT if to_left else RIGHT
+
+        if goal == GOAL_FIGHT:
+            if abs(dy) < ATTACK_HEIGHT:
+                rand = self._random.random()
+                if rand < self.HEAVY_ACTION_CHANCE and player.can_act_heavy():
+                    commands |= HEAVY_ACTION
+                elif rand < self.ACTION_CHANCE and player.can_act():
+                    commands |= ACTION
+            elif dy > ATTACK_HEIGHT and player.is_on_ground():
+                commands |= UP
+        elif goal == GOAL_GRAB and player.is_on_ground() and next(player.foreach_down_sleeping_players(), None) is not None:
+            # Only with a sleeper under us, the down action would make us sleep otherwise.
+            commands |= DOWN
+            self._goal, self._target = GOAL_NONE, None
+
+        return commands
+
+
+class EasyBot(Bot):
+
+    """ Slow bot hitting rarely, it never grabs sleepers nor sleeps. """
+
+    __slots__ = ()
+
+    REACTION_TICKS = 30
+    ACTION_CHANCE = 0.1
+    HEAVY_ACTION_CHANCE = 0.0
+    GRAB_SLEEPERS = False
+
+
+class HardBot(Bot):
+
+    """ Fast bot using its heavy action often, and sleeping to regenerate when hurt. """
+
+    __slots__ = ()
+
+    REACTION_TICKS = 4
+    ACTION_CHANCE = 1.0
+    HEAVY_ACTION_CHANCE = 0.1
+    SLEEP_HP_RATIO = 0.3
+
+
+# Bot classes by difficulty name.
+DIFFICULTIES: Dict[str, Type[Bot]] = {
+    "easy": EasyBot,
+    "normal": Bot,
+    "hard": HardBot
+}
+
+
+class BotScript:
+
+    """
+    Player script (see `headless.PlayerScript`) giving each player its own
+    bot, created on its first tick. Bots of a seeded script are seeded from
+    it and their player index, so runs are reproducible. Bots are created
+    again when the script is called with another stage, so a script can be
+    reused for several runs.
+    """
+
+    __slots__ = "_bot_type", "_seed", "_stage", "_bots"
+
+    def __init__(self, bot_type: Type[Bot], seed: Optional[int] = None):
+        self._bot_type = bot_type
+        self._seed = seed
+        self._stage: Optional[Stage] = None
+        self._bots: Dict[int, Bot] = {}
+
+    def get_bot(self, player_idx: int) -> Bot:
+        bot = self._bots.get(player_idx)
+        if bot is None:
+            bot = self._bots[player_idx] = self._bot_type(None if self._seed is None else self._seed * 64 + player_idx)
+        return bot
+
+    def __call__(self, stage: Stage, player: Player) -> int:
+        if stage is not self._stage:
+            self._stage = stage
+            self._bots.clear()
+        return self.get_bot(player.get_player_index()).get_commands(stage, player)
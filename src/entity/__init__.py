@@ -1,22 +1,25 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, Dict, Iterator, List, Tuple, Type
+import struct
 
 from entity.hitbox import Hitbox
 import stage
 
 
-_UID_COUNTER = 0
-def _new_uid() -> int:
-    global _UID_COUNTER
-    _UID_COUNTER += 1
-    return _UID_COUNTER
+class Entity(ABC):
 
+    __slots__ = "_uid", "_stage", "_x", "_y", "_hitbox", "_dead"
 
-class Entity(ABC):
+    # True for short-lived entities that the stage reuses once dead, see `recycle`.
+    POOLED = False
+
+    # Layout of the state given by `get_state`, subclasses append their own fields.
+    # uid, x, y, hitbox (min x, min y, max x, max y), dead
+    STATE = struct.Struct("<Q6d?")
 
     def __init__(self, entity_stage: 'stage.Stage'):
 
-        self._uid = _new_uid()
+        self._uid = entity_stage.new_entity_uid()
 
         self._stage: 'stage.Stage' = entity_stage
         self._x: float = 0.0
@@ -54,13 +57,60 @@ class Entity(ABC):
         self._x = x
         self._y = y
         self._setup_box_pos(x, y)
+        self._stage.update_entity_cell(self)
 
     def move_position(self, dx: float, dy: float):
         self._hitbox.move(dx, dy)
         self._reset_pos_to_box()
+        self._stage.update_entity_cell(self)
 
     def set_dead(self):
         self._dead = True
+        # Suspended entities must be updated once more to be removed.
+        self._stage.resume_entity(self)
+
+    def recycle(self, *args, **kwargs):
+        """
+        Reset a dead pooled entity as if it was just constructed with these
+        arguments (without the stage), it gets a new UID.
+        """
+        self._uid = self._stage.new_entity_uid()
+        self._x = 0.0
+        self._y = 0.0
+        self._hitbox.set_positions(0, 0, 0, 0)
+        self._dead = False
+
+    # State
+
+    @classmethod
+    def new_for_state(cls, entity_stage: 'stage.Stage') -> 'Entity':
+        """ Construct an entity of this class with default arguments, its state is then set by `load_state`. """
+        return cls(entity_stage)
+
+    def get_state(self) -> tuple:
+        """ Return the values of the state of this entity, packed with `STATE`. """
+        hitbox = self._hitbox
+        return self._uid, self._x, self._y, hitbox._min_x, hitbox._min_y, hitbox._max_x, hitbox._max_y, self._dead
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, 'Entity']):
+        """
+        Set the state from values in the order of `get_state`. Entities
+        referenced by UID in the state are taken from `entities`.
+        """
+        self._uid = next(values)
+        self._x = next(values)
+        self._y = next(values)
+        self._hitbox.set_positions(next(values), next(values), next(values), next(values))
+        self._dead = next(values)
+
+    def save_state(self, out: bytearray):
+        """ Append the packed state of this entity to the buffer. """
+        out += self.STATE.pack(*self.get_state())
+
+    def load_state(self, data, offset: int, entities: Dict[int, 'Entity']) -> int:
+        """ Load the state packed by `save_state` at the offset, return the offset of the next state. """
+        self.set_state(iter(self.STATE.unpack_from(data, offset)), entities)
+        return offset + self.STATE.size
 
     # Physics
 
@@ -79,9 +129,18 @@ class MotionEntity(Entity, ABC):
     """
     Abstract subclass of Entity that can move
     """
+
+    __slots__ = "_vel_x", "_vel_y", "_vel_integrated", "_vel_pass_x", "_vel_pass_y", "_vel_next_x", "_vel_next_y", \
+                "_no_clip", "_cached_hitbox", "_cached_obstacles", "_on_ground", "_turned_to_left"
+
     GROUND_FRICTION = 0.82
     AIR_FRICTION = 0.95
     NATURAL_GRAVITY = 0.02
+    # False for entities that never integrate their natural velocity.
+    NATURAL_MOTION = True
+
+    # vel x, vel y, vel integrated, no clip, on ground, turned to left
+    STATE = struct.Struct(Entity.STATE.format + "2d4?")
 
     def __init__(self, entity_stage: 'stage.Stage') -> None:
 
@@ -89,10 +148,16 @@ class MotionEntity(Entity, ABC):
 
         self._vel_x: float = 0.0
         self._vel_y: float = 0.0
+        self._vel_integrated: bool = False
+        # Velocity seen by the last pass of the motion engine, and the velocity it integrated from it.
+        self._vel_pass_x: float = 0.0
+        self._vel_pass_y: float = 0.0
+        self._vel_next_x: float = 0.0
+        self._vel_next_y: float = 0.0
         self._no_clip: bool = False
 
         self._cached_hitbox = Hitbox(0, 0, 0, 0)
-        self._cached_hitboxes: List[Hitbox] = []
+        self._cached_obstacles: List[Entity] = []
 
         self._on_ground: bool = False
         self._turned_to_left: bool = False
@@ -124,25 +189,71 @@ class MotionEntity(Entity, ABC):
         self._vel_x += ddx
         self._vel_y += ddy
 
+    def set_integrated_velocity(self, dx: float, dy: float):
+        """
+        Set the velocity integrated by the stage's motion engine from the current
+        one, it is only used by the next motion update if the velocity is unchanged.
+        """
+        self._vel_pass_x = self._vel_x
+        self._vel_pass_y = self._vel_y
+        self._vel_next_x = dx
+        self._vel_next_y = dy
+        self._vel_integrated = True
+
     def set_no_clip(self, no_clip: bool):
         self._no_clip = no_clip
 
     def set_turned_to_left(self, turned_to_left: bool) -> None:
         self._turned_to_left = turned_to_left
 
+    def recycle(self, *args, **kwargs):
+        super().recycle()
+        self._vel_x = 0.0
+        self._vel_y = 0.0
+        self._vel_integrated = False
+        self._no_clip = False
+        self._on_ground = False
+        self._turned_to_left = False
+
+    def get_state(self) -> tuple:
+        return (*super().get_state(), self._vel_x, self._vel_y, self._vel_integrated, self._no_clip,
+                self._on_ground, self._turned_to_left)
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, Entity]):
+        super().set_state(values, entities)
+        self._vel_x = next(values)
+        self._vel_y = next(values)
+        self._vel_integrated = next(values)
+        self._no_clip = next(values)
+        self._on_ground = next(values)
+        self._turned_to_left = next(values)
+
     # OTHER METHODS
 
     def update(self) -> None:
         self.update_motion()
 
     def update_motion(self) -> None:
-        self.update_natural_velocity()
+        if self._vel_integrated:
+            self._vel_integrated = False
+            if self._vel_x == self._vel_pass_x and self._vel_y == self._vel_pass_y:
+                self._vel_x = self._vel_next_x
+                self._vel_y = self._vel_next_y
+            else:
+                # Velocity changed since the pass, by another entity (a throw) or by
+                # a gameplay event, the integration of the engine is outdated.
+                self.update_natural_velocity()
+        else:
+            self.update_natural_velocity()
         self.move_position(self._vel_x, self._vel_y)
 
     def update_natural_velocity(self) -> None:
         self._vel_x *= self.GROUND_FRICTION if self._on_ground else self.AIR_FRICTION
         self._vel_y = self._vel_y * self.AIR_FRICTION - self.NATURAL_GRAVITY
 
+    def _entity_bound_box_kinds(self) -> Tuple[Type[Entity], ...]:
+        return stage.Stage.HARD_KINDS
+
     def _entity_bound_box_predicate(self, entity: Entity) -> bool:
         return entity.has_hard_hitbox()
 
@@ -154,34 +265,77 @@ class MotionEntity(Entity, ABC):
         """
         Moves the entity and its hitbox following its actual velocity,
         taking care of other hitboxes onto the stage.
+
+        The hitbox is swept along the move, the first obstacle hit (by time of
+        impact, then y-axis first, then UID) stops the move on its axis and the
+        remaining move slides along the other axis. The post predicate is only
+        called for obstacles actually reached, and those it rejects are crossed.
         """
 
         if self._no_clip:
             super().move_position(dx, dy)
             return
 
-        self._cached_hitbox.set_from(self._hitbox)
+        hitbox = self._hitbox
+        self._cached_hitbox.set_from(hitbox)
         self._cached_hitbox.expand(dx, dy)
 
-        self._cached_hitboxes.clear()
+        obstacles = self._cached_obstacles
+        obstacles.extend(self._stage.foreach_colliding_entity(self._cached_hitbox,
+                                                              kinds=self._entity_bound_box_kinds(),
+                                                              predicate=self._entity_bound_box_predicate))
+
+        remaining_x, remaining_y = dx, dy
+        moved_x, moved_y = 0.0, 0.0
+        blocked_down = False
+
+        while remaining_x != 0 or remaining_y != 0:
+
+            impacts = []
+            for entity in obstacles:
+                impact = entity._hitbox.calc_sweep(hitbox, remaining_x, remaining_y)
+                if impact is not None:
+                    impacts.append((impact[0], not impact[1], entity._uid, entity))
+            impacts.sort()
+
+            blocker = None
+            for impact in impacts:
+                if self._entity_bound_box_post_predicate(impact[3]):
+                    blocker = impact
+                    break
+                obstacles.remove(impact[3])
+                if self._dead:
+                    break
+
+            if self._dead:
+                break
+
+            if blocker is None:
+                step_x, step_y = remaining_x, remaining_y
+                remaining_x, remaining_y = 0.0, 0.0
+            elif blocker[1]:
+                # Stopped on the x-axis, exactly against the obstacle.
+                box = blocker[3]._hitbox
+                step_x = box._min_x - hitbox._max_x if remaining_x > 0 else box._max_x - hitbox._min_x
+                step_y = remaining_y * blocker[0]
+                remaining_x, remaining_y = 0.0, remaining_y - step_y
+            else:
+                box = blocker[3]._hitbox
+                step_x = remaining_x * blocker[0]
+                step_y = box._min_y - hitbox._max_y if remaining_y > 0 else box._max_y - hitbox._min_y
+                blocked_down = blocked_down or remaining_y < 0
+                remaining_x, remaining_y = remaining_x - step_x, 0.0
 
-        for entity in self._stage.foreach_colliding_entity(self._cached_hitbox, predicate=self._entity_bound_box_predicate):
-            if self._entity_bound_box_post_predicate(entity):
-                self._cached_hitboxes.append(entity._hitbox)
+            hitbox.move(step_x, step_y)
+            moved_x += step_x
+            moved_y += step_y
 
-        if dx != 0:
-            for box in self._cached_hitboxes:
-                dx = box.calc_offset_x(self._hitbox, dx)
-            self._hitbox.move(dx, 0)
+        obstacles.clear()
 
         if dy != 0:
-            down = dy < 0
-            for box in self._cached_hitboxes:
-                dy = box.calc_offset_y(self._hitbox, dy)
-            self._on_ground = down and dy == 0
-            self._hitbox.move(0, dy)
+            self._on_ground = blocked_down
 
-        self._cached_hitboxes.clear()
+        dx, dy = moved_x, moved_y
 
         # We cancel moves that are too short to avoid useless processing and then keep fluidity
         if dx != 0:
@@ -197,3 +351,4 @@ class MotionEntity(Entity, ABC):
         self._vel_y = dy
 
         self._reset_pos_to_box()
+        self._stage.update_entity_cell(self)
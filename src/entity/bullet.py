@@ -1,3 +1,6 @@
+from typing import Any, Dict, Iterator, Tuple, Type
+import struct
+
 from entity import MotionEntity, Entity
 from entity import player
 import stage
@@ -5,9 +8,15 @@ import stage
 
 class Bullet(MotionEntity):
 
+    __slots__ = "_owner", "_damage"
+
     NATURAL_GRAVITY = 0
     GROUND_FRICTION = 1
     AIR_FRICTION = 1
+    POOLED = True
+
+    # owner uid, damage
+    STATE = struct.Struct(MotionEntity.STATE.format + "Qd")
 
     def __init__(self, entity_stage: 'stage.Stage', owner: 'player.Player', damage: float, dx: float):
         super().__init__(entity_stage)
@@ -15,11 +24,32 @@ class Bullet(MotionEntity):
         self._damage = damage
         self.set_velocity(dx, 0)
 
+    def recycle(self, owner: 'player.Player', damage: float, dx: float):
+        super().recycle()
+        self._owner = owner
+        self._damage = damage
+        self.set_velocity(dx, 0)
+
+    @classmethod
+    def new_for_state(cls, entity_stage: 'stage.Stage') -> 'Bullet':
+        return cls(entity_stage, None, 0.0, 0.0)
+
+    def get_state(self) -> tuple:
+        return (*super().get_state(), self._owner.get_uid(), self._damage)
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, Entity]):
+        super().set_state(values, entities)
+        self._owner = entities[next(values)]
+        self._damage = next(values)
+
     def update(self):
         super().update()
         if abs(self._vel_x) < 0.1 or self._x < -1 or self._x > self._stage.get_size()[0] + 1:
             self.set_dead()
 
+    def _entity_bound_box_kinds(self) -> Tuple[Type[Entity], ...]:
+        return (*stage.Stage.HARD_KINDS, player.Player)
+
     def _entity_bound_box_predicate(self, entity: Entity) -> bool:
         return super()._entity_bound_box_predicate(entity) or (
                 isinstance(entity, player.Player) and entity != self._owner and not self._owner.is_sleeping()
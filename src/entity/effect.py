@@ -1,7 +1,8 @@
+from typing import Any, Dict, Iterator
 from entity import Entity
 from enum import Enum, auto
+import struct
 import stage
-import time
 
 
 class EffectType(Enum):
@@ -13,14 +14,43 @@ class EffectType(Enum):
 
 class Effect(Entity):
 
+    __slots__ = "_effect_type", "_live_until"
+
+    POOLED = True
+
+    # effect type, live until
+    STATE = struct.Struct(Entity.STATE.format + "Bd")
+
     def __init__(self, entity_stage: 'stage.Stage', effect_type: EffectType, duration: float):
         super().__init__(entity_stage)
         self._effect_type = effect_type
-        self._live_until = 0 if duration == 0 else time.monotonic() + duration
+        self._live_until = 0 if duration == 0 else self._stage.get_time() + duration
+
+    def recycle(self, effect_type: EffectType, duration: float):
+        super().recycle()
+        self._effect_type = effect_type
+        self._live_until = 0 if duration == 0 else self._stage.get_time() + duration
+
+    @classmethod
+    def new_for_state(cls, entity_stage: 'stage.Stage') -> 'Effect':
+        return cls(entity_stage, EffectType.SMOKE, 0)
+
+    def get_state(self) -> tuple:
+        return (*super().get_state(), self._effect_type.value, self._live_until)
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, Entity]):
+        super().set_state(values, entities)
+        self._effect_type = EffectType(next(values))
+        self._live_until = next(values)
 
     def update(self):
-        if self._live_until != 0 and time.monotonic() >= self._live_until:
+        if self._live_until == 0:
+            self._stage.suspend_entity(self)
+        elif self._stage.get_time() >= self._live_until:
             self.set_dead()
+        else:
+            # Nothing to do until the end of the effect.
+            self._stage.suspend_entity(self, self._live_until)
 
     def get_effect_type(self) -> EffectType:
         return self._effect_type
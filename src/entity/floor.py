@@ -3,12 +3,23 @@ import stage
 
 
 class Floor(MotionEntity):
+
+    __slots__ = ()
+
+    NATURAL_MOTION = False
+
     def __init__(self, entity_stage: 'stage.Stage') -> None:
         MotionEntity.__init__(self, entity_stage)
 
     def update(self) -> None:
         pass
 
+    def set_box(self, min_x: float, min_y: float, max_x: float, max_y: float):
+        """ Set the hitbox of this floor, use this instead of modifying the hitbox directly. """
+        self._hitbox.set_positions(min_x, min_y, max_x, max_y)
+        self._reset_pos_to_box()
+        self._stage.update_entity_cell(self)
+
     @classmethod
     def has_hard_hitbox(cls) -> bool:
         return True
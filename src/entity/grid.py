@@ -0,0 +1,115 @@
+from typing import Dict, Tuple, List
+from math import floor
+
+from entity.hitbox import Hitbox
+import entity
+
+
+CellRange = Tuple[int, int, int, int]
+
+
+class SpatialGrid:
+
+    """
+    Uniform grid used as a broadphase for collisions queries. Each entity is
+    referenced in every cell overlapped by its hitbox, so a query only needs
+    to look at the cells overlapped by the queried box.
+    """
+
+    __slots__ = "_cell_size", "_cells", "_ranges"
+
+    def __init__(self, cell_size: float = 4.0):
+        self._cell_size = cell_size
+        # Each cell is a dict (uid -> entity) for O(1) insertion and removal.
+        self._cells: Dict[Tuple[int, int], Dict[int, 'entity.Entity']] = {}
+        self._ranges: Dict[int, CellRange] = {}
+
+    def get_cell_size(self) -> float:
+        return self._cell_size
+
+    def _calc_range(self, box: Hitbox) -> CellRange:
+        size = self._cell_size
+        return (
+            floor(box.get_min_x() / size),
+            floor(box.get_min_y() / size),
+            floor(box.get_max_x() / size),
+            floor(box.get_max_y() / size)
+        )
+
+    def update(self, target: 'entity.Entity'):
+
+        """
+        Insert the entity in the grid or move it to the cells overlapped by
+        its current hitbox. Nothing is done if the cells are unchanged.
+        """
+
+        uid = target.get_uid()
+        new_range = self._calc_range(target.get_hitbox())
+        old_range = self._ranges.get(uid)
+
+        if old_range == new_range:
+            return
+
+        if old_range is not None:
+            self._unlink(uid, old_range)
+
+        min_cx, min_cy, max_cx, max_cy = new_range
+        cells = self._cells
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cells[(cx, cy)] = cell = {}
+                cell[uid] = target
+
+        self._ranges[uid] = new_range
+
+    def remove(self, target: 'entity.Entity'):
+        uid = target.get_uid()
+        old_range = self._ranges.pop(uid, None)
+        if old_range is not None:
+            self._unlink(uid, old_range)
+
+    def _unlink(self, uid: int, cell_range: CellRange):
+        min_cx, min_cy, max_cx, max_cy = cell_range
+        cells = self._cells
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                cell = cells[(cx, cy)]
+                del cell[uid]
+                if not len(cell):
+                    del cells[(cx, cy)]
+
+    def query(self, box: Hitbox) -> List['entity.Entity']:
+
+        """
+        Return entities whose cells are overlapped by the given box, this is
+        only a broadphase and hitboxes must still be checked by the caller.
+        Entities are sorted by UID, which is also their insertion order in
+        the stage, so results are the same as a linear scan.
+        """
+
+        min_cx, min_cy, max_cx, max_cy = self._calc_range(box)
+        cells = self._cells
+
+        if min_cx == max_cx and min_cy == max_cy:
+            cell = cells.get((min_cx, min_cy))
+            if cell is None:
+                return []
+            return [cell[uid] for uid in sorted(cell)]
+
+        found: Dict[int, 'entity.Entity'] = {}
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                cell = cells.get((cx, cy))
+                if cell is not None:
+                    found.update(cell)
+
+        return [found[uid] for uid in sorted(found)]
+
+    def clear(self):
+        self._cells.clear()
+        self._ranges.clear()
+
+    def __len__(self) -> int:
+        return len(self._ranges)
@@ -1,3 +1,5 @@
+from typing import Optional, Tuple
+from math import inf
 
 class Hitbox:
 
@@ -5,6 +7,8 @@ class Hitbox:
     Class that defines a rectangular hitbox with absolute position
     """
 
+    __slots__ = "_min_x", "_min_y", "_max_x", "_max_y"
+
     def __init__(self, min_x: float, min_y: float, max_x: float, max_y: float) -> None:
         self._min_x: float = min_x
         self._min_y: float = min_y
@@ -89,6 +93,15 @@ class Hitbox:
         else:
             self._min_y += y
 
+    def union(self, other_hitbox: 'Hitbox') -> None:
+        """
+        Expands the hitbox to also contain the other hitbox
+        """
+        self._min_x = min(self._min_x, other_hitbox._min_x)
+        self._min_y = min(self._min_y, other_hitbox._min_y)
+        self._max_x = max(self._max_x, other_hitbox._max_x)
+        self._max_y = max(self._max_y, other_hitbox._max_y)
+
     def intersects(self, other_hitbox: 'Hitbox') -> bool:
         return (
                 self._min_x < other_hitbox._max_x and
@@ -136,3 +149,44 @@ class Hitbox:
                     offset_y = d
 
         return offset_y
+
+    def calc_sweep(self, other_hitbox: 'Hitbox', offset_x: float, offset_y: float) -> Optional[Tuple[float, bool]]:
+
+        """
+        Sweep the other hitbox along the offset (x,y) against this one.
+        Returns the time of impact as a fraction of the offset in [0, 1] and
+        True if the impact is on the y-axis (preferred on ties), or None if the
+        other hitbox doesn't hit this one. Hitboxes already overlapping are ignored.
+        """
+
+        if offset_x > 0.0:
+            entry_x = (self._min_x - other_hitbox._max_x) / offset_x
+            exit_x = (self._max_x - other_hitbox._min_x) / offset_x
+        elif offset_x < 0.0:
+            entry_x = (self._max_x - other_hitbox._min_x) / offset_x
+            exit_x = (self._min_x - other_hitbox._max_x) / offset_x
+        elif other_hitbox._max_x > self._min_x and other_hitbox._min_x < self._max_x:
+            entry_x, exit_x = -inf, inf
+        else:
+            return None
+
+        if offset_y > 0.0:
+            entry_y = (self._min_y - other_hitbox._max_y) / offset_y
+            exit_y = (self._max_y - other_hitbox._min_y) / offset_y
+        elif offset_y < 0.0:
+            entry_y = (self._max_y - other_hitbox._min_y) / offset_y
+            exit_y = (self._min_y - other_hitbox._max_y) / offset_y
+        elif other_hitbox._max_y > self._min_y and other_hitbox._min_y < self._max_y:
+            entry_y, exit_y = -inf, inf
+        else:
+            return None
+
+        if entry_y >= entry_x:
+            entry, y_axis = entry_y, True
+        else:
+            entry, y_axis = entry_x, False
+
+        if entry < 0.0 or entry > 1.0 or entry >= min(exit_x, exit_y):
+            return None
+
+        return entry, y_axis
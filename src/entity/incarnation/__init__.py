@@ -1,5 +1,7 @@
+from typing import Any, Iterator
 from abc import ABC, abstractmethod
 from entity import player
+import struct
 
 
 __all__ = ["Incarnation", "Farmer", "Potato", "Corn", "Carrot"]
@@ -7,9 +9,20 @@ __all__ = ["Incarnation", "Farmer", "Potato", "Corn", "Carrot"]
 
 class Incarnation(ABC):
 
+    __slots__ = "_owner",
+
+    # Layout of the state given by `get_state`, saved with the owner's state.
+    STATE = struct.Struct("<")
+
     def __init__(self, owner_player: 'player.Player') -> None:
         self._owner = owner_player
 
+    def get_state(self) -> tuple:
+        return ()
+
+    def set_state(self, values: Iterator[Any]):
+        pass
+
     # GETTERS
     @staticmethod
     def get_duration() -> float:
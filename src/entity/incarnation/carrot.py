@@ -1,6 +1,7 @@
+from typing import Any, Iterator
 from entity.incarnation import Incarnation
 from entity import player
-from time import monotonic
+import struct
 
 
 class Carrot(Incarnation):
@@ -8,14 +9,27 @@ class Carrot(Incarnation):
     """
     Implementation of the incarnation Carrot, the epeeist. Inherits from incarnation
     """
+
+    __slots__ = "_remaining_thrusts", "_next_thrust_time"
+
     COOLDOWN_THRUST = 0.4
     NUMBER_THRUST = 7
 
+    # remaining thrusts, next thrust time
+    STATE = struct.Struct("<id")
+
     def __init__(self, owner_player: 'player.Player'):
         Incarnation.__init__(self, owner_player)
         self._remaining_thrusts: int = 0
         self._next_thrust_time: float = 0
 
+    def get_state(self) -> tuple:
+        return self._remaining_thrusts, self._next_thrust_time
+
+    def set_state(self, values: Iterator[Any]):
+        self._remaining_thrusts = next(values)
+        self._next_thrust_time = next(values)
+
     # GETTER
     @staticmethod
     def get_name() -> str:
@@ -39,20 +53,20 @@ class Carrot(Incarnation):
 
     def heavy_action(self):
         self._remaining_thrusts = Carrot.NUMBER_THRUST
-        self._next_thrust_time = monotonic() + 0.4
+        self._next_thrust_time = self._owner.get_stage().get_time() + 0.4
         self._owner.set_special_action(True, False)
         self._owner.block_jump_for(Carrot.COOLDOWN_THRUST * Carrot.NUMBER_THRUST)
         # self._owner.block_moves_for(Carrot.COOLDOWN_THRUST * Carrot.NUMBER_THRUST)
         self._owner.push_animation("carrot:thrust")
 
     def special_action(self):
-        if self._remaining_thrusts > 0 and self._next_thrust_time <= monotonic():
+        if self._remaining_thrusts > 0 and self._next_thrust_time <= self._owner.get_stage().get_time():
             if self._remaining_thrusts == 1:
                 self._owner.front_attack(1.7, (13, 15), 3, 3)
                 # self._owner.get_stage().add_effect(EffectType.SMOKE, 1, self._owner.get_x(), self._owner.get_y())
             else:
                 self._owner.front_attack(1.7, (8, 10), 0, 0, given_imune=0.0)
-                self._next_thrust_time = monotonic() + Carrot.COOLDOWN_THRUST
+                self._next_thrust_time = self._owner.get_stage().get_time() + Carrot.COOLDOWN_THRUST
             self._remaining_thrusts -= 1
 
         if self._remaining_thrusts <= 0:
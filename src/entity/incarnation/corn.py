@@ -1,8 +1,8 @@
+from typing import Any, Iterator
 from entity.incarnation import Incarnation
 from entity.bullet import Bullet
 from entity import player
-import random
-import time
+import struct
 
 
 class Corn(Incarnation):
@@ -11,12 +11,25 @@ class Corn(Incarnation):
     Implementation of the incarnation Corn, the range attacker. Inherits from incarnation
     """
 
+    __slots__ = "_remaining_bullets", "_next_shot_time", "_shot_interval"
+
+    # remaining bullets, next shot time, shot interval
+    STATE = struct.Struct("<i2d")
+
     def __init__(self, owner_player: 'player.Player'):
         super().__init__(owner_player)
         self._remaining_bullets: int = 0
         self._next_shot_time: float = 0.0
         self._shot_interval: float = 0.0
 
+    def get_state(self) -> tuple:
+        return self._remaining_bullets, self._next_shot_time, self._shot_interval
+
+    def set_state(self, values: Iterator[Any]):
+        self._remaining_bullets = next(values)
+        self._next_shot_time = next(values)
+        self._shot_interval = next(values)
+
     # GETTER
 
     @staticmethod
@@ -44,23 +57,23 @@ class Corn(Incarnation):
         return 10.0
 
     def action(self):
-        self._shot_bullet(random.uniform(5.0, 8.0))
+        self._shot_bullet(self._owner.get_stage().get_random().uniform(5.0, 8.0))
         self._owner.push_animation("corn:shot")
 
     def heavy_action(self):
         self._owner.push_animation("corn:gatling")
         self._remaining_bullets = 30
-        self._next_shot_time = time.monotonic() + 0.4
+        self._next_shot_time = self._owner.get_stage().get_time() + 0.4
         self._shot_interval = 0.05
         self._owner.set_special_action(True)
 
     def special_action(self):
 
         if self._remaining_bullets > 0:
-            if self._next_shot_time == 0 or time.monotonic() >= self._next_shot_time:
-                self._shot_bullet(random.uniform(1.0, 1.2))
+            if self._next_shot_time == 0 or self._owner.get_stage().get_time() >= self._next_shot_time:
+                self._shot_bullet(self._owner.get_stage().get_random().uniform(1.0, 1.2))
                 self._remaining_bullets -= 1
-                self._next_shot_time = time.monotonic() + self._shot_interval
+                self._next_shot_time = self._owner.get_stage().get_time() + self._shot_interval
 
         if self._remaining_bullets <= 0:
             self._owner.set_special_action(False)
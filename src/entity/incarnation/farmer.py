@@ -8,6 +8,8 @@ class Farmer(Incarnation):
     Implementation of the incarnation Farmer, the classic incarnation. Inherits from incarnation
     """
 
+    __slots__ = ()
+
     def __init__(self, owner_player: 'player.Player') -> None:
         super().__init__(owner_player)
 
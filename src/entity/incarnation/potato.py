@@ -1,7 +1,6 @@
 from entity.incarnation import Incarnation
 from entity.effect import EffectType
 from entity import player
-import random
 
 
 class Potato(Incarnation):
@@ -10,6 +9,8 @@ class Potato(Incarnation):
     Implementation of the incarnation Potato, the solid attacker. Inherits from incarnation
     """
 
+    __slots__ = ()
+
     def __init__(self, owner_player: 'player.Player'):
         Incarnation.__init__(self, owner_player)
 
@@ -46,5 +47,5 @@ class Potato(Incarnation):
         self._owner.set_velocity(-0.25 if self._owner.get_turned_to_left() else 0.25, self._owner.get_vel_y())
         self._owner.block_moves_for(0.5)
         self._owner.front_attack(0, (15.0, 16.0), -2, 2)
-        if random.random() < 0.08:
+        if self._owner.get_stage().get_random().random() < 0.08:
             self._owner.get_stage().add_effect(EffectType.BIG_GROUND_DUST, 1, self._owner.get_x(), self._owner.get_y())
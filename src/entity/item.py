@@ -1,11 +1,17 @@
 from entity.player import Player, IncarnationType
-from entity import MotionEntity
-from typing import cast
+from entity import MotionEntity, Entity
+from typing import Any, Dict, Iterator, cast
+import struct
 import stage
 
 
 class Item(MotionEntity):
 
+    __slots__ = "_incarnation_type",
+
+    # incarnation type
+    STATE = struct.Struct(MotionEntity.STATE.format + "B")
+
     def __init__(self, entity_stage: 'stage.Stage', incarnation_type: IncarnationType) -> None:
         super().__init__(entity_stage)
         self._incarnation_type = incarnation_type
@@ -16,11 +22,26 @@ class Item(MotionEntity):
     def get_incarnation_type(self) -> IncarnationType:
         return self._incarnation_type
 
+    @classmethod
+    def new_for_state(cls, entity_stage: 'stage.Stage') -> 'Item':
+        return cls(entity_stage, IncarnationType.POTATO)
+
+    def get_state(self) -> tuple:
+        return (*super().get_state(), self._incarnation_type.value)
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, Entity]):
+        super().set_state(values, entities)
+        self._incarnation_type = IncarnationType(next(values))
+
     def update(self) -> None:
 
         super().update()
 
-        for target_player in self._stage.foreach_colliding_entity(self._hitbox, predicate=Player.is_player):
+        for target_player in self._stage.foreach_colliding_entity(self._hitbox, kinds=(Player,)):
             if cast(Player, target_player).load_incarnation(self._incarnation_type):
                 self.set_dead()
-                break
+                return
+
+        if self._on_ground and self._vel_x == 0 and self._vel_y == 0:
+            # Resting on the ground, players pick the item when touching it (see `Player.update`).
+            self._stage.suspend_entity(self)
@@ -0,0 +1,164 @@
+from typing import List, Dict
+from array import array
+
+from entity import MotionEntity
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional, the engine then integrates with a plain loop.
+    numpy = None
+
+
+class MotionEngine:
+
+    """
+    Optional physics engine for a stage. It stores the velocities and friction
+    coefficients of all motion entities in contiguous arrays and integrates
+    their natural velocity (friction and gravity) in one vectorized pass at
+    the beginning of each tick, instead of one call to
+    `update_natural_velocity` per entity. Positions are still moved by each
+    entity in its own update.
+
+    Each entity takes its integrated velocity in its own update, in the stage
+    order, and only if its velocity did not change since the pass: when
+    another entity set it in between (a grab throw, a knockback), the entity
+    integrates it itself. The arithmetic is exactly the one of
+    `MotionEntity.update_natural_velocity`, so results are the ones of the
+    per-object code path; with `check` enabled each pass is cross-checked
+    against it and a `RuntimeError` is raised on the first difference.
+    """
+
+    __slots__ = "_entities", "_slots", "_capacity", "_vectorized", "_check", \
+                "_vel_x", "_vel_y", "_on_ground", \
+                "_ground_friction", "_air_friction", "_gravity"
+
+    COLUMNS = "_vel_x", "_vel_y", "_on_ground", \
+              "_ground_friction", "_air_friction", "_gravity"
+
+    def __init__(self, *, vectorized: bool = True, check: bool = False):
+
+        self._entities: List[MotionEntity] = []
+        self._slots: Dict[int, int] = {}
+        self._capacity = 0
+        self._vectorized = vectorized and numpy is not None
+        self._check = check
+
+        for column in self.COLUMNS:
+            setattr(self, column, None)
+        self._grow(64)
+
+    @staticmethod
+    def is_vectorization_available() -> bool:
+        return numpy is not None
+
+    def is_vectorized(self) -> bool:
+        return self._vectorized
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def _grow(self, capacity: int):
+        for column in self.COLUMNS:
+            old = getattr(self, column)
+            if self._vectorized:
+                new = numpy.zeros(capacity, dtype=numpy.bool_ if column == "_on_ground" else numpy.float64)
+            else:
+                new = array("d", bytes(8 * capacity))
+            if old is not None:
+                new[:self._capacity] = old
+            setattr(self, column, new)
+        self._capacity = capacity
+
+    def register(self, entity: MotionEntity):
+
+        """ Add a motion entity to the engine, its natural velocity will no longer be integrated on its own. """
+
+        uid = entity.get_uid()
+        if uid in self._slots:
+            return
+
+        slot = len(self._entities)
+        if slot >= self._capacity:
+            self._grow(self._capacity * 2)
+
+        self._entities.append(entity)
+        self._slots[uid] = slot
+        self._ground_friction[slot] = entity.GROUND_FRICTION
+        self._air_friction[slot] = entity.AIR_FRICTION
+        self._gravity[slot] = entity.NATURAL_GRAVITY
+
+    def unregister(self, entity: MotionEntity):
+
+        """ Remove an entity from the engine, the last entity is moved to its slot so the arrays stay dense. """
+
+        slot = self._slots.pop(entity.get_uid(), None)
+        if slot is None:
+            return
+
+        last_slot = len(self._entities) - 1
+        last_entity = self._entities.pop()
+
+        if slot != last_slot:
+            self._entities[slot] = last_entity
+            self._slots[last_entity.get_uid()] = slot
+            for column in self.COLUMNS:
+                values = getattr(self, column)
+                values[slot] = values[last_slot]
+
+    def clear(self):
+        """ Remove all entities from the engine. """
+        self._entities.clear()
+        self._slots.clear()
+
+    def integrate(self):
+
+        """
+        Gather the velocities of all entities into the arrays, integrate friction
+        and gravity in one pass and hand the new velocities back to entities.
+        """
+
+        entities = self._entities
+        count = len(entities)
+        if not count:
+            return
+
+        vel_x, vel_y, on_ground = self._vel_x, self._vel_y, self._on_ground
+
+        for i, entity in enumerate(entities):
+            vel_x[i] = entity.get_vel_x()
+            vel_y[i] = entity.get_vel_y()
+            on_ground[i] = entity.is_on_ground()
+
+        if self._check:
+            expected = [self._integrate_object(entity) for entity in entities]
+
+        if self._vectorized:
+            air_friction = self._air_friction[:count]
+            vel_x[:count] *= numpy.where(on_ground[:count], self._ground_friction[:count], air_friction)
+            vel_y[:count] = vel_y[:count] * air_friction - self._gravity[:count]
+            new_vel_x = vel_x[:count].tolist()
+            new_vel_y = vel_y[:count].tolist()
+        else:
+            ground_friction, air_friction, gravity = self._ground_friction, self._air_friction, self._gravity
+            for i in range(count):
+                vel_x[i] *= ground_friction[i] if on_ground[i] else air_friction[i]
+                vel_y[i] = vel_y[i] * air_friction[i] - gravity[i]
+            new_vel_x = vel_x[:count]
+            new_vel_y = vel_y[:count]
+
+        if self._check:
+            for entity, dx, dy, (expected_dx, expected_dy) in zip(entities, new_vel_x, new_vel_y, expected):
+                if dx != expected_dx or dy != expected_dy:
+                    raise RuntimeError("Motion engine integrated ({}, {}) for {}, expected ({}, {}).".format(
+                        dx, dy, entity, expected_dx, expected_dy
+                    ))
+
+        for entity, dx, dy in zip(entities, new_vel_x, new_vel_y):
+            entity.set_integrated_velocity(dx, dy)
+
+    @staticmethod
+    def _integrate_object(entity: MotionEntity):
+        """ Reference per-object integration, same arithmetic as `MotionEntity.update_natural_velocity`. """
+        vel_x = entity.get_vel_x() * (entity.GROUND_FRICTION if entity.is_on_ground() else entity.AIR_FRICTION)
+        vel_y = entity.get_vel_y() * entity.AIR_FRICTION - entity.NATURAL_GRAVITY
+        return vel_x, vel_y
@@ -1,11 +1,11 @@
-from typing import Tuple, cast, Optional, List, Iterable
-from enum import Enum, auto
-import random
-import time
+from typing import Tuple, cast, Optional, List, Iterable, Iterator, Dict, Any
+from enum import Enum, IntFlag, auto
+import struct
 
 from entity.incarnation import Incarnation, Farmer, Potato, Corn, Carrot
 from entity import Entity, MotionEntity
 from entity.effect import EffectType
+from entity.hitbox import Hitbox
 import stage
 
 
@@ -27,6 +27,17 @@ class PlayerColor(Enum):
     CYAN = auto()
 
 
+class PlayerInput(IntFlag):
+    """ Bit flags of the commands of a player for a tick, applied in this order by `Player.apply_input`. """
+    NONE = 0
+    UP = auto()
+    DOWN = auto()
+    LEFT = auto()
+    RIGHT = auto()
+    ACTION = auto()
+    HEAVY_ACTION = auto()
+
+
 class IncarnationType(Enum):
     """ Enumeration des """
     POTATO = auto()
@@ -40,6 +51,12 @@ class Player(MotionEntity):
     Implementation of a player. Inherits from Entity
     """
 
+    __slots__ = "_player_index", "_color", "_max_hp", "_hp", \
+                "_incarnation_type", "_incarnation", "_incarnation_duration", "_incarnation_until", \
+                "_block_moves_until", "_block_action_until", "_block_heavy_action_until", "_block_jump_until", \
+                "_invincible_until", "_sleeping", "_special_action", "_special_action_reset_by_key", \
+                "_grabing", "_animations_queue", "_statistics"
+
     MOVE_VELOCITY = 0.04
     MOVE_AIR_FACTOR = 0.3
     JUMP_VELOCITY = 0.65
@@ -51,6 +68,12 @@ class Player(MotionEntity):
         IncarnationType.CARROT: Carrot
     }
 
+    # player index, color, max hp, hp, incarnation type (0 if none), incarnation duration and until,
+    # block moves, action, heavy action and jump until, invincible until, sleeping, special action,
+    # special action reset by key, grabed player uid (0 if none), grab at, throw at, statistics
+    # (kos, plants collected, damage dealt, damage taken). The incarnation state follows.
+    STATE = struct.Struct(MotionEntity.STATE.format + "HBddB7d3?Q2d4q")
+
     def __init__(self, entity_stage: 'stage.Stage', player_index: int, color: PlayerColor, hp: float = 100.0) -> None:
 
         super().__init__(entity_stage)
@@ -109,22 +132,22 @@ class Player(MotionEntity):
         return self._incarnation_type is not None
 
     def get_incarnation_duration_ratio(self) -> float:
-        return max(0.0, (self._incarnation_until - (0 if self._sleeping else time.monotonic())) / self._incarnation_duration)
+        return max(0.0, (self._incarnation_until - (0 if self._sleeping else self._stage.get_time())) / self._incarnation_duration)
 
     def can_move(self) -> bool:
-        return time.monotonic() >= self._block_moves_until and not self._sleeping
+        return self._stage.get_time() >= self._block_moves_until and not self._sleeping
 
     def can_act(self) -> bool:
-        return time.monotonic() >= self._block_action_until and not self._special_action and not self._sleeping
+        return self._stage.get_time() >= self._block_action_until and not self._special_action and not self._sleeping
 
     def can_act_heavy(self) -> bool:
-        return time.monotonic() >= self._block_heavy_action_until and not self._special_action and not self._sleeping
+        return self._stage.get_time() >= self._block_heavy_action_until and not self._special_action and not self._sleeping
 
     def can_jump(self) -> bool:
-        return time.monotonic() >= self._block_jump_until and not self._sleeping
+        return self._stage.get_time() >= self._block_jump_until and not self._sleeping
 
     def is_purely_invincible(self) -> bool:
-        return time.monotonic() < self._invincible_until
+        return self._stage.get_time() < self._invincible_until
 
     def is_invincible(self) -> bool:
         return self._sleeping or self.is_purely_invincible()
@@ -153,19 +176,19 @@ class Player(MotionEntity):
         self._incarnation = incarnation
 
     def block_moves_for(self, duration: float):
-        self._block_moves_until = time.monotonic() + duration
+        self._block_moves_until = self._stage.get_time() + duration
 
     def block_action_for(self, duration: float):
-        self._block_action_until = time.monotonic() + duration
+        self._block_action_until = self._stage.get_time() + duration
 
     def block_heavy_action_for(self, duration: float):
-        self._block_heavy_action_until = time.monotonic() + duration
+        self._block_heavy_action_until = self._stage.get_time() + duration
 
     def block_jump_for(self, duration: float):
-        self._block_jump_until = time.monotonic() + duration
+        self._block_jump_until = self._stage.get_time() + duration
 
     def set_invincible_for(self, duration: float):
-        self._invincible_until = time.monotonic() + duration
+        self._invincible_until = self._stage.get_time() + duration
 
     def complete_stun_for(self, duration: float):
         self.block_moves_for(duration)
@@ -178,6 +201,25 @@ class Player(MotionEntity):
         self._special_action = special
         self._special_action_reset_by_key = special and reset_by_key
 
+    def set_mirrored_state(self, hp: float, incarnation_type: Optional[IncarnationType], incarnation_ratio: float,
+                           sleeping: bool, special_action: bool, moving: bool, on_ground: bool, turned_to_left: bool):
+        """
+        Set what is displayed of a player in a stage that is not simulated but
+        mirrors another one, without the side effects of gameplay setters.
+        """
+        self._hp = hp
+        if incarnation_type != self._incarnation_type:
+            self._incarnation_type = incarnation_type
+            self._incarnation = Farmer(self) if incarnation_type is None \
+                else self.INCARNATIONS_CONSTRUCTORS[incarnation_type](self)
+        self._incarnation_duration = 1.0
+        self._incarnation_until = incarnation_ratio + (0 if sleeping else self._stage.get_time())
+        self._sleeping = sleeping
+        self._special_action = special_action
+        self._vel_x = 1.0 if moving else 0.0
+        self._on_ground = on_ground
+        self._turned_to_left = turned_to_left
+
     # ADDERS
 
     def add_to_hp(self, number) -> bool:
@@ -204,23 +246,33 @@ class Player(MotionEntity):
     def update(self) -> None:
 
         super().update()
+        rand = self._stage.get_random()
+
+        # Resting items are suspended, we pick them ourselves, only when we can.
+        if self._incarnation_type is None:
+            for item in self._stage.foreach_colliding_entity(self._hitbox, kinds=(stage.Stage.ITEM_KIND,)):
+                if not item.is_dead() and self.load_incarnation(item.get_incarnation_type()):
+                    item.set_dead()
+                    break
 
-        if self._y < -10:
+        min_x, min_y, max_x = self._stage.get_kill_bounds()
+
+        if self._y < min_y:
             self.set_hp(0)
             self.set_dead()
             return
 
-        elif self._x < 1 or self._x > 29:
+        elif self._x < min_x or self._x > max_x:
             self._stage.add_effect(EffectType.SMOKE, 1, self._x, self._y)
             self.set_hp(0)
             self.set_dead()
 
             return
 
-        if self._on_ground and self._vel_x != 0 and random.random() < 0.05:
+        if self._on_ground and self._vel_x != 0 and rand.random() < 0.05:
             self._stage.add_effect(EffectType.SMALL_GROUND_DUST, 1, self._x, self._y)
 
-        if self._incarnation_type is not None and not self._sleeping and time.monotonic() >= self._incarnation_until:
+        if self._incarnation_type is not None and not self._sleeping and self._stage.get_time() >= self._incarnation_until:
             self._incarnation = Farmer(self)
             self._incarnation_type = None
             self._incarnation_duration = 1
@@ -232,28 +284,91 @@ class Player(MotionEntity):
         if self._special_action:
             self._incarnation.special_action()
         elif self._sleeping:
-            if random.random() < 0.003:
-                self._stage.add_effect(EffectType.SLEEPING, 5, self._x + random.uniform(-1, 1), self._y + 0.2 + random.random() * 0.6)
+            if rand.random() < 0.003:
+                self._stage.add_effect(EffectType.SLEEPING, 5, self._x + rand.uniform(-1, 1), self._y + 0.2 + rand.random() * 0.6)
             if self._hp < self._max_hp:
                 self._hp = min(self._hp + Player.REGEN_BY_TICK, self._max_hp)
         elif self._grabing is not None:
             target, grab_at, throw_at = self._grabing
             target = cast(Player, target)
-            now = time.monotonic()
+            now = self._stage.get_time()
             if grab_at != 0:
                 if now >= grab_at:
                     target.add_velocity(0, 0.5)
                     self._grabing = target, 0, throw_at
             elif now >= throw_at:
-                knockback_x = random.uniform(0.1, 0.2)
-                knockback_y = random.uniform(0.9, 1.1)
+                knockback_x = rand.uniform(0.1, 0.2)
+                knockback_y = rand.uniform(0.9, 1.1)
                 target_on_left = target.get_x() < self.get_x()
                 target.add_velocity(-knockback_x if target_on_left else knockback_x, knockback_y)
                 target.push_animation("hit")
                 target.set_invincible_for(0.5)
-                self.remove_hp_to_other(target, random.uniform(17.0, 20.0))
+                self.remove_hp_to_other(target, rand.uniform(17.0, 20.0))
                 self._grabing = None
 
+    # STATE
+
+    @classmethod
+    def new_for_state(cls, entity_stage: 'stage.Stage') -> 'Player':
+        return cls(entity_stage, 0, PlayerColor.VIOLET)
+
+    def get_state(self) -> tuple:
+        grab_uid, grab_at, throw_at = (0, 0.0, 0.0) if self._grabing is None else \
+            (self._grabing[0].get_uid(), self._grabing[1], self._grabing[2])
+        statistics = self._statistics
+        return (*super().get_state(), self._player_index, self._color.value, self._max_hp, self._hp,
+                0 if self._incarnation_type is None else self._incarnation_type.value,
+                self._incarnation_duration, self._incarnation_until,
+                self._block_moves_until, self._block_action_until, self._block_heavy_action_until,
+                self._block_jump_until, self._invincible_until,
+                self._sleeping, self._special_action, self._special_action_reset_by_key,
+                grab_uid, grab_at, throw_at,
+                statistics._kos, statistics._plants_collected, statistics._damage_dealt, statistics._damage_taken)
+
+    def set_state(self, values: Iterator[Any], entities: Dict[int, Entity]):
+
+        super().set_state(values, entities)
+        self._player_index = next(values)
+        self._color = PlayerColor(next(values))
+        self._max_hp = next(values)
+        self._hp = next(values)
+
+        incarnation_type = next(values)
+        self._incarnation_type = None if incarnation_type == 0 else IncarnationType(incarnation_type)
+        constructor = self.INCARNATIONS_CONSTRUCTORS.get(self._incarnation_type, Farmer)
+        if type(self._incarnation) is not constructor:
+            self._incarnation = constructor(self)
+        self._incarnation_duration = next(values)
+        self._incarnation_until = next(values)
+
+        self._block_moves_until = next(values)
+        self._block_action_until = next(values)
+        self._block_heavy_action_until = next(values)
+        self._block_jump_until = next(values)
+        self._invincible_until = next(values)
+        self._sleeping = next(values)
+        self._special_action = next(values)
+        self._special_action_reset_by_key = next(values)
+
+        grab_uid, grab_at, throw_at = next(values), next(values), next(values)
+        self._grabing = None if grab_uid == 0 else (entities[grab_uid], grab_at, throw_at)
+
+        statistics = self._statistics
+        statistics._kos = next(values)
+        statistics._plants_collected = next(values)
+        statistics._damage_dealt = next(values)
+        statistics._damage_taken = next(values)
+
+    def save_state(self, out: bytearray):
+        super().save_state(out)
+        out += self._incarnation.STATE.pack(*self._incarnation.get_state())
+
+    def load_state(self, data, offset: int, entities: Dict[int, Entity]) -> int:
+        offset = super().load_state(data, offset, entities)
+        state = self._incarnation.STATE
+        self._incarnation.set_state(iter(state.unpack_from(data, offset)))
+        return offset + state.size
+
     # MOVES
 
     def _move_side(self, vel) -> None:
@@ -276,7 +391,7 @@ class Player(MotionEntity):
             """self._sleeping = False
             self.complete_stun_for(0.6)
             # On restaure le temps restant
-            self._incarnation_until += time.monotonic()"""
+            self._incarnation_until += self._stage.get_time()"""
         elif self._on_ground and self.can_jump():
             self.add_velocity(0, self.JUMP_VELOCITY)
             self._stage.add_effect(EffectType.BIG_GROUND_DUST, 1, self._x, self._y)
@@ -292,6 +407,21 @@ class Player(MotionEntity):
             self._incarnation.heavy_action()
             self.block_heavy_action_for(self._incarnation.get_heavy_action_cooldown())
 
+    def apply_input(self, commands: int) -> None:
+        """ Apply the commands (`PlayerInput` flags) of a tick, called by the stage at the beginning of the tick. """
+        if commands & PlayerInput.UP:
+            self.move_jump()
+        if commands & PlayerInput.DOWN:
+            self.do_down_action()
+        if commands & PlayerInput.LEFT:
+            self.move_left()
+        if commands & PlayerInput.RIGHT:
+            self.move_right()
+        if commands & PlayerInput.ACTION:
+            self.do_action()
+        if commands & PlayerInput.HEAVY_ACTION:
+            self.do_heavy_action()
+
     def do_down_action(self) -> None:
 
         if not self.can_move() or self._grabing is not None or not self._on_ground:
@@ -303,7 +433,7 @@ class Player(MotionEntity):
             target = cast(Player, target)
             can_sleep = False
             if not target.is_purely_invincible():
-                now = time.monotonic()
+                now = self._stage.get_time()
                 self._grabing = (target, now + 0.5, now + 1)
                 self.complete_stun_for(1)
                 target.set_sleeping(False)
@@ -316,7 +446,7 @@ class Player(MotionEntity):
             self.set_sleeping(True)
             """self._sleeping = True
             # Quand on dors, on défini le "until" au temps restant, afin de le restaurer au reveil
-            self._incarnation_until -= time.monotonic()
+            self._incarnation_until -= self._stage.get_time()
             self.set_invincible_for(2)"""
 
     # ACTIONS FOR INCARNATIONS
@@ -335,7 +465,8 @@ class Player(MotionEntity):
     def front_attack(self, reach: float, damage_range: Tuple[float, float], knockback_x: float, knockback_y: float, *, given_imune: float = 0.5):
 
         """
-        Attack player in the reach range.
+        Attack player in the reach range. The attack is registered to the stage
+        and resolved with all other attacks of the tick, see `apply_hit_request`.
         :param reach: Reach range in the front of the player, negate the reach to indicate both side reach.
         :param damage_range: Range of damage to pick.
         :param knockback_x: Knockback multiplier x-axis
@@ -343,27 +474,37 @@ class Player(MotionEntity):
         :param given_imune: Invincibility to add to target.
         """
 
-        self._cached_hitbox.set_from(self._hitbox)
+        box = self._hitbox.copy()
         if reach < 0:
-            self._cached_hitbox.expand(reach, 0)
-            self._cached_hitbox.expand(-reach, 0)
+            box.expand(reach, 0)
+            box.expand(-reach, 0)
         else:
             reach_offset = self._hitbox.get_width() / 2
             reach = max(0, reach - reach_offset)
-            self._cached_hitbox.expand(-reach if self.get_turned_to_left() else reach, 0)
-            self._cached_hitbox.move(-reach_offset if self.get_turned_to_left() else reach_offset, 0)
+            box.expand(-reach if self.get_turned_to_left() else reach, 0)
+            box.move(-reach_offset if self.get_turned_to_left() else reach_offset, 0)
 
-        for target in self._stage.foreach_colliding_entity(self._cached_hitbox, predicate=Player.is_player):
-            target = cast(Player, target)
-            if target != self and not target.is_invincible():
-                self.remove_hp_to_other(target, random.uniform(*damage_range))
-                knockback_x = random.uniform(0.1, 0.2) * knockback_x
-                knockback_y = random.uniform(0.1, 0.3) * knockback_y
-                if (reach < 0 and target.get_x() < self.get_x()) or (reach >= 0 and self.get_turned_to_left()):
+        self._stage.add_hit_request(HitRequest(self, box, reach < 0, damage_range, knockback_x, knockback_y, given_imune))
+
+    def apply_hit_request(self, request: 'HitRequest', targets: Iterable['Player']):
+
+        """
+        Apply an attack of this player to the targets colliding its box, in the
+        given order. Only called by the stage when resolving hit requests.
+        """
+
+        rand = self._stage.get_random()
+        knockback_x, knockback_y = request.knockback_x, request.knockback_y
+        for target in targets:
+            if target != self and not target.is_dead() and not target.is_invincible():
+                self.remove_hp_to_other(target, rand.uniform(*request.damage_range))
+                knockback_x = rand.uniform(0.1, 0.2) * knockback_x
+                knockback_y = rand.uniform(0.1, 0.3) * knockback_y
+                if (request.both_sides and target.get_x() < request.x) or (not request.both_sides and request.turned_to_left):
                     knockback_x = -knockback_x
                 target.add_velocity(knockback_x, knockback_y)
                 target.push_animation("hit")
-                target.set_invincible_for(given_imune)
+                target.set_invincible_for(request.given_imune)
 
     def foreach_down_sleeping_players(self):
 
@@ -372,19 +513,19 @@ class Player(MotionEntity):
         self._cached_hitbox.set_from(self._hitbox)
         self._cached_hitbox.set_min_y(self._cached_hitbox.get_max_y() - 0.2)
 
-        for target in self._stage.foreach_colliding_entity(self._cached_hitbox, predicate=Player.is_sleeping_player):
+        for target in self._stage.foreach_colliding_entity(self._cached_hitbox, kinds=(Player,), predicate=Player.is_sleeping_player):
             yield target
 
     def set_sleeping(self, sleeping: bool):
         if sleeping:
             self._sleeping = True
             # Quand on dors, on défini le "until" au temps restant, afin de le restaurer au reveil
-            self._incarnation_until -= time.monotonic()
+            self._incarnation_until -= self._stage.get_time()
             self.set_invincible_for(1)
         else:
             self._sleeping = False
             # On restaure le temps restant
-            self._incarnation_until += time.monotonic()
+            self._incarnation_until += self._stage.get_time()
             self.complete_stun_for(0.6)
 
     @staticmethod
@@ -404,7 +545,7 @@ class Player(MotionEntity):
                 self._incarnation = constructor(self)
                 self._incarnation_type = typ
                 self._incarnation_duration = self._incarnation.get_duration()
-                self._incarnation_until = time.monotonic() + self._incarnation_duration
+                self._incarnation_until = self._stage.get_time() + self._incarnation_duration
                 self.set_special_action(False)
                 self.complete_stun_for(1)
                 self.push_animation("player:mutation")
@@ -420,8 +561,33 @@ class Player(MotionEntity):
             return False
 
 
+class HitRequest:
+
+    """
+    Attack registered by `Player.front_attack` during a tick, with the
+    attacker's state at that time. Resolved by the stage at the end of the tick.
+    """
+
+    __slots__ = "attacker", "box", "both_sides", "damage_range", "knockback_x", "knockback_y", "given_imune", \
+                "x", "turned_to_left"
+
+    def __init__(self, attacker: Player, box: Hitbox, both_sides: bool, damage_range: Tuple[float, float],
+                 knockback_x: float, knockback_y: float, given_imune: float):
+        self.attacker = attacker
+        self.box = box
+        self.both_sides = both_sides
+        self.damage_range = damage_range
+        self.knockback_x = knockback_x
+        self.knockback_y = knockback_y
+        self.given_imune = given_imune
+        self.x = attacker.get_x()
+        self.turned_to_left = attacker.get_turned_to_left()
+
+
 class PlayerStatistics:
 
+    __slots__ = "_kos", "_plants_collected", "_damage_dealt", "_damage_taken"
+
     def __init__(self):
 
         self._kos: int = 0
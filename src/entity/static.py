@@ -0,0 +1,99 @@
+from typing import Dict, List
+from math import floor
+
+from entity.hitbox import Hitbox
+import entity
+
+
+class StaticWorld:
+
+    """
+    Collision structure for immovable entities (floors). Entities are stored
+    in columns of fixed width along the x axis, built once from all static
+    entities and only rebuilt when one is added, moved or removed. A query
+    costs O(columns crossed) instead of testing every static entity. The
+    version changes with each of these modifications, so that data derived
+    from static entities can be cached.
+    """
+
+    __slots__ = "_column_width", "_entities", "_dirty", "_version", "_origin", "_columns"
+
+    def __init__(self, column_width: float = 4.0):
+        self._column_width = column_width
+        self._entities: Dict[int, 'entity.Entity'] = {}
+        self._dirty = False
+        self._version = 0
+        self._origin = 0
+        self._columns: List[List['entity.Entity']] = []
+
+    def update(self, target: 'entity.Entity'):
+        """ Add the entity or take its new hitbox into account, the structure is rebuilt lazily. """
+        self._entities[target.get_uid()] = target
+        self._dirty = True
+        self._version += 1
+
+    def remove(self, target: 'entity.Entity'):
+        if self._entities.pop(target.get_uid(), None) is not None:
+            self._dirty = True
+            self._version += 1
+
+    def get_version(self) -> int:
+        return self._version
+
+    def _rebuild(self):
+
+        self._dirty = False
+        self._columns = []
+
+        if not len(self._entities):
+            return
+
+        width = self._column_width
+        ranges = []
+        for uid in sorted(self._entities):
+            target = self._entities[uid]
+            hitbox = target.get_hitbox()
+            ranges.append((target, floor(hitbox.get_min_x() / width), floor(hitbox.get_max_x() / width)))
+
+        self._origin = origin = min(start for _, start, _ in ranges)
+        self._columns = columns = [[] for _ in range(max(end for _, _, end in ranges) - origin + 1)]
+
+        # Entities are iterated in UID order, so each column stays sorted.
+        for target, start, end in ranges:
+            for column in range(start - origin, end - origin + 1):
+                columns[column].append(target)
+
+    def query(self, box: Hitbox) -> List['entity.Entity']:
+
+        """
+        Return static entities in the columns crossed by the given box, sorted
+        by UID. This is a broadphase, hitboxes must be checked by the caller.
+        """
+
+        if self._dirty:
+            self._rebuild()
+
+        columns = self._columns
+        start = max(0, floor(box.get_min_x() / self._column_width) - self._origin)
+        end = min(len(columns) - 1, floor(box.get_max_x() / self._column_width) - self._origin)
+
+        if start > end:
+            return []
+        elif start == end:
+            return columns[start]
+
+        found: Dict[int, 'entity.Entity'] = {}
+        for column in range(start, end + 1):
+            for target in columns[column]:
+                found[target.get_uid()] = target
+
+        return [found[uid] for uid in sorted(found)]
+
+    def clear(self):
+        self._entities.clear()
+        self._columns = []
+        self._dirty = False
+        self._version += 1
+
+    def __len__(self) -> int:
+        return len(self._entities)
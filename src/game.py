@@ -1,9 +1,15 @@
 from typing import Optional, Dict
 from pygame.time import Clock
 from pygame import Surface
+from os import path
 import pygame
 import time
 
+from replay import Replay, ReplayRecorder, ReplayPlayer, save_replay
+from net.rollback import RollbackSession
+from net.spectator import SpectatorConnection
+from net.mirror import SnapshotMirror
+from stage_file import new_stage_from_source
 from stage import Stage
 from view import View, SharedViewData
 from view.kind import *
@@ -19,6 +25,13 @@ class Game:
 
     DEBUG_PERFS = False
 
+    # Nombre maximum d'images par seconde, 0 pour ne pas limiter.
+    MAX_FPS = 120
+    # Nombre maximum de ticks de simulation pour rattraper le retard en une frame.
+    MAX_CATCH_UP_TICKS = 5
+    # Vitesse maximale de lecture des replays, en multiple du temps réel.
+    MAX_REPLAY_SPEED = 16
+
     def __init__(self):
 
         self._surface: Optional[Surface] = None
@@ -30,7 +43,23 @@ class Game:
 
         self._stage: Optional[Stage] = None
 
+        # Replay en cours de lecture, ses commandes remplacent celles du clavier.
+        self._replay: Optional[ReplayPlayer] = None
+        self._replay_speed: int = 1
+        # Dossier d'enregistrement des replays des parties, None pour ne pas enregistrer.
+        self._record_dir: Optional[str] = None
+        self._recorder: Optional[ReplayRecorder] = None
+        # Session de la partie en ligne, qui met à jour le stage à la place du jeu.
+        self._session: Optional[RollbackSession] = None
+        # Connection au serveur d'une partie regardée en spectateur, ses états remplacent la simulation.
+        self._spectator: Optional[SpectatorConnection] = None
+        self._mirror: Optional[SnapshotMirror] = None
+
+        self._tick_accumulator: float = 0.0
+
         self._perf_update: float = 0
+        self._perf_update_max: float = 0
+        self._perf_update_steps: int = 0
         self._perf_draw: float = 0
         self._next_perf_print: float = 0
 
@@ -51,10 +80,15 @@ class Game:
         self._add_view("how_to_play", HowToPlayView())
         self._add_view("settings", SettingsView())
 
-    def start(self):
+    def start(self, replay: Optional[Replay] = None, replay_speed: int = 1, session: Optional[RollbackSession] = None,
+              spectator: Optional[SpectatorConnection] = None):
 
         """
         Point d'entrée pour le jeu.
+        :param replay: Replay à lire directement au lieu de démarrer le menu.
+        :param replay_speed: Vitesse de lecture du replay.
+        :param session: Session d'une partie en ligne à démarrer directement.
+        :param spectator: Connexion à une partie à regarder directement en spectateur.
         """
 
         print()
@@ -74,11 +108,19 @@ class Game:
         for view in self._views.values():
             view.init(self._view_data)
 
-        self.show_view("scenario")
+        if spectator is not None:
+            self.watch(spectator)
+        elif session is not None:
+            self.play_online(session)
+        elif replay is not None:
+            self.play_replay(replay, replay_speed)
+        else:
+            self.show_view("scenario")
 
         print("[GAME] Start loop...")
 
         clock = Clock()
+        last_time = time.perf_counter()
 
         while self._running:
 
@@ -88,13 +130,20 @@ class Game:
                 elif self._active_view is not None:
                     self._active_view.event(event)
 
+            now = time.perf_counter()
+            self._tick_accumulator += now - last_time
+            last_time = now
+
             self._update()
+            self._draw()
 
             pygame.display.flip()
-            clock.tick(60)
+            clock.tick(self.MAX_FPS)
 
         print("[GAME] Cleanup...")
 
+        self._stop_recording()
+        self._stop_watching()
         self._view_data.cleanup()
         self._surface = None
         self._stage = None
@@ -106,13 +155,50 @@ class Game:
     def _update(self):
 
         """
-        Appelé à chaque frame afin de mettre à jour l'affichage et la physique.
+        Appelé à chaque frame afin d'exécuter autant de ticks de simulation que
+        le temps écoulé le demande, à pas fixe et indépendamment de l'affichage.
         """
 
-        if self._stage is not None:
-            start = time.perf_counter_ns()
-            self._stage.update()
-            self._perf_update = time.perf_counter_ns() - start
+        # En lecture de replay, les ticks sont accélérés selon la vitesse.
+        speed = 1 if self._replay is None else self._replay_speed
+        tick_duration = 1.0 / (self.get_tick_rate() * speed)
+
+        steps = 0
+        while self._tick_accumulator >= tick_duration:
+
+            if steps >= self.MAX_CATCH_UP_TICKS * speed:
+                # Trop de retard, on abandonne les ticks restants pour ne pas bloquer l'affichage.
+                self._tick_accumulator = 0.0
+                break
+
+            if self._active_view is not None:
+                self._active_view.update()
+
+            if self._stage is not None:
+                start = time.perf_counter_ns()
+                if self._spectator is not None:
+                    # En spectateur, le stage n'est pas simulé, il reproduit le dernier état reçu.
+                    snapshot = self._spectator.poll()
+                    if snapshot is not None:
+                        self._mirror.apply(snapshot)
+                elif self._session is not None:
+                    # En ligne, le tick n'avance pas si les autres joueurs ont trop de retard.
+                    self._session.advance()
+                else:
+                    self._stage.update()
+                duration = time.perf_counter_ns() - start
+                self._perf_update = duration
+                self._perf_update_max = max(self._perf_update_max, duration)
+                self._perf_update_steps += 1
+
+            self._tick_accumulator -= tick_duration
+            steps += 1
+
+    def _draw(self):
+
+        """
+        Appelé à chaque frame afin de mettre à jour l'affichage.
+        """
 
         if self._active_view is not None:
             start = time.perf_counter_ns()
@@ -121,7 +207,11 @@ class Game:
 
         if self.DEBUG_PERFS and time.monotonic() >= self._next_perf_print:
             self._next_perf_print = time.monotonic() + 2.0
-            print("Timings: Update: {}ns, Draw: {}ns".format(self._perf_update, self._perf_draw))
+            print("Timings: Update: {}ns (max {}ns, {} steps), Draw: {}ns".format(
+                self._perf_update, self._perf_update_max, self._perf_update_steps, self._perf_draw
+            ))
+            self._perf_update_max = 0
+            self._perf_update_steps = 0
 
     def _add_view(self, name: str, view: View):
 
@@ -153,17 +243,93 @@ class Game:
         self._active_view = view
         view.on_enter()
 
+    def get_tick_rate(self) -> int:
+        """ Fréquence des ticks, celle du stage en cours, pour que son horloge suive le temps réel. """
+        return Stage.TICK_RATE if self._stage is None else self._stage.get_tick_rate()
+
     def get_surface(self) -> Optional[Surface]:
         return self._surface
 
     def get_stage(self) -> Stage:
         return self._stage
 
-    def set_stage(self, stage: Stage):
+    def set_stage(self, stage: Stage, stage_source: Optional[str] = None):
+
+        """
+        Défini le stage en cours d'exécution, il est enregistré si un dossier
+        d'enregistrement est défini et que sa source est donnée.
+        :param stage: Le stage, avec tous ses joueurs et pas encore mis à jour.
+        :param stage_source: Nom de fabrique ou chemin de ressource du fichier du stage.
+        """
+
+        self._stop_recording()
+        self._replay = None
+        self._session = None
+        self._stop_watching()
         self._stage = stage
+        if self._record_dir is not None and stage_source is not None:
+            self._recorder = ReplayRecorder(stage, stage_source)
 
     def remove_stage(self):
+        self._stop_recording()
+        self._replay = None
+        self._session = None
+        self._stop_watching()
         self._stage = None
 
+    def set_record_dir(self, record_dir: Optional[str]):
+        self._record_dir = record_dir
+
+    def _stop_recording(self):
+        if self._recorder is not None:
+            replay_path = path.join(self._record_dir, time.strftime("%Y%m%d-%H%M%S.replay"))
+            save_replay(self._recorder.stop(), replay_path)
+            self._recorder = None
+            print("[GAME] Replay saved to {}".format(replay_path))
+
+    def play_replay(self, replay: Replay, speed: int = 1):
+        """ Lance la lecture d'un replay dans la vue de jeu. """
+        player = ReplayPlayer(replay)
+        self.set_stage(player.get_stage())
+        self._replay = player
+        self.set_replay_speed(speed)
+        self.show_view("in_game")
+
+    def play_online(self, session: RollbackSession):
+        """ Lance une partie en ligne dans la vue de jeu, avec le stage de la session. """
+        self.set_stage(session.get_stage())
+        self._session = session
+        self.show_view("in_game")
+
+    def get_session(self) -> Optional[RollbackSession]:
+        return self._session
+
+    def watch(self, spectator: SpectatorConnection):
+        """ Regarde en spectateur la partie d'un serveur, le stage est un miroir des états reçus. """
+        _, seed, _, stage_source = spectator.wait_welcome()
+        mirror = SnapshotMirror(new_stage_from_source(stage_source, seed))
+        self.set_stage(mirror.get_stage())
+        self._mirror = mirror
+        self._spectator = spectator
+        self.show_view("in_game")
+
+    def _stop_watching(self):
+        if self._spectator is not None:
+            self._spectator.close()
+            self._spectator = None
+            self._mirror = None
+
+    def is_watching(self) -> bool:
+        return self._spectator is not None
+
+    def get_replay(self) -> Optional[ReplayPlayer]:
+        return self._replay
+
+    def get_replay_speed(self) -> int:
+        return self._replay_speed
+
+    def set_replay_speed(self, speed: int):
+        self._replay_speed = max(1, min(self.MAX_REPLAY_SPEED, speed))
+
     def stop_game(self):
         self._running = False
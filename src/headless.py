@@ -0,0 +1,187 @@
+"""
+Headless entry point, runs a stage without PyGame nor display, as fast as the
+CPU allows. Players are driven by scripts returning their commands for each
+tick instead of the keyboard.
+Players can also be driven by bots of a difficulty (see `bot`).
+Usage: `python headless.py --players 4 --ticks 10000 [--script brawl | --bot normal] [--stage example]`
+"""
+
+from typing import Callable, Dict, Optional
+import argparse
+import random
+import time
+
+from stage import Stage
+from entity.player import Player, PlayerColor, PlayerInput
+from replay import ReplayRecorder, save_replay
+from stage_file import new_stage_from_source, FACTORIES
+from bot import BotScript, DIFFICULTIES
+
+
+# Return the commands (`PlayerInput` flags) of a player for the next tick.
+PlayerScript = Callable[[Stage, Player], int]
+
+
+def script_idle(_stage: Stage, _player: Player) -> int:
+    return PlayerInput.NONE
+
+
+def script_walk(stage: Stage, player: Player) -> int:
+    """ Walk from one side of the stage to the other, jumping from time to time. """
+    commands = PlayerInput.NONE
+    width = stage.get_size()[0]
+    if (stage.get_tick() // 180 + player.get_player_index()) % 2:
+        if player.get_x() > width * 0.25:
+            commands |= PlayerInput.LEFT
+    elif player.get_x() < width * 0.75:
+        commands |= PlayerInput.RIGHT
+    if stage.get_tick() % 50 == player.get_player_index():
+        commands |= PlayerInput.UP
+    return commands
+
+
+def script_brawl(stage: Stage, player: Player) -> int:
+    """ Walk toward the nearest opponent and hit it, using every action. """
+
+    nearest: Optional[Player] = None
+    nearest_dist = 0.0
+    for other in stage.get_players().values():
+        if other is not player and not other.is_dead():
+            dist = abs(other.get_x() - player.get_x())
+            if nearest is None or dist < nearest_dist:
+                nearest, nearest_dist = other, dist
+
+    if nearest is None:
+        return PlayerInput.NONE
+
+    commands = PlayerInput.NONE
+    if nearest.is_sleeping() and nearest_dist < 1.0:
+        commands |= PlayerInput.DOWN
+    elif nearest_dist > 1.0:
+        if nearest.get_x() < player.get_x():
+            commands |= PlayerInput.LEFT
+        else:
+            commands |= PlayerInput.RIGHT
+        if nearest.get_y() > player.get_y() + 1.0:
+            commands |= PlayerInput.UP
+    else:
+        commands |= PlayerInput.ACTION
+
+    if random.random() < 0.02:
+        commands |= PlayerInput.HEAVY_ACTION
+    elif random.random() < 0.005:
+        commands |= PlayerInput.DOWN
+
+    return commands
+
+
+SCRIPTS: Dict[str, PlayerScript] = {
+    "idle": script_idle,
+    "walk": script_walk,
+    "brawl": script_brawl
+}
+
+
+def apply_script(stage: Stage, script: PlayerScript):
+    """ Set the commands of each living player for the next tick, given by the script. """
+    for player_idx, player in stage.get_players().items():
+        if not player.is_dead():
+            stage.set_input(player_idx, script(stage, player))
+
+
+class HeadlessRunner:
+
+    """
+    Runs a stage tick after tick, setting the commands given by the script for
+    each living player before each tick like the in-game view does with the keyboard.
+    """
+
+    __slots__ = "_stage", "_script", "_ticks", "_duration", "_peak_entities"
+
+    def __init__(self, stage: Stage, script: PlayerScript):
+        self._stage = stage
+        self._script = script
+        self._ticks = 0
+        self._duration = 0.0
+        self._peak_entities = 0
+
+    def get_stage(self) -> Stage:
+        return self._stage
+
+    def step(self):
+        stage = self._stage
+        apply_script(stage, self._script)
+        stage.update()
+        self._ticks += 1
+        self._peak_entities = max(self._peak_entities, len(stage.get_entities()))
+
+    def run(self, ticks: int, *, until_finished: bool = False):
+        start = time.perf_counter()
+        for _ in range(ticks):
+            self.step()
+            if until_finished and self._stage.is_finished():
+                break
+        self._duration += time.perf_counter() - start
+
+    def get_ticks(self) -> int:
+        return self._ticks
+
+    def get_duration(self) -> float:
+        return self._duration
+
+    def get_ticks_per_second(self) -> float:
+        return self._ticks / self._duration if self._duration > 0 else 0.0
+
+    def get_peak_entities(self) -> int:
+        return self._peak_entities
+
+
+def new_stage(players_count: int, seed: Optional[int] = None, stage_source: str = "example",
+              tick_rate: int = Stage.TICK_RATE) -> Stage:
+    stage = new_stage_from_source(stage_source, seed, tick_rate)
+    colors = list(PlayerColor)
+    for player_idx in range(players_count):
+        stage.add_player(player_idx, colors[player_idx % len(colors)])
+    return stage
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run a stage without display and report ticks per second.")
+    parser.add_argument("--players", type=int, default=4, help="number of players (default: 4)")
+    parser.add_argument("--stage", choices=FACTORIES.keys(), default="example", help="stage (default: example, "
+                        "crowd has spawn points for 16 players)")
+    parser.add_argument("--ticks", type=int, default=10000, help="number of ticks to run (default: 10000)")
+    parser.add_argument("--script", choices=SCRIPTS.keys(), default="brawl", help="players script (default: brawl)")
+    parser.add_argument("--bot", choices=DIFFICULTIES.keys(), default=None, help="drive players by bots of this difficulty instead of the script")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the stage and scripts random generators")
+    parser.add_argument("--until-finished", action="store_true", help="stop when only one player is alive")
+    parser.add_argument("--record", default=None, help="replay file to record the run to")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    script = SCRIPTS[args.script] if args.bot is None else BotScript(DIFFICULTIES[args.bot], args.seed)
+    runner = HeadlessRunner(new_stage(args.players, args.seed, args.stage), script)
+    recorder = None if args.record is None else ReplayRecorder(runner.get_stage(), args.stage)
+    runner.run(args.ticks, until_finished=args.until_finished)
+    if recorder is not None:
+        save_replay(recorder.stop(), args.record)
+
+    stage = runner.get_stage()
+    print("[HEADLESS] Seed: {}".format(stage.get_seed()))
+    print("[HEADLESS] Ran {} ticks in {:.3f}s: {:.0f} ticks/s ({:.1f}x real time)".format(
+        runner.get_ticks(), runner.get_duration(), runner.get_ticks_per_second(),
+        runner.get_ticks_per_second() / stage.get_tick_rate()
+    ))
+    print("[HEADLESS] Peak entities: {}, finished: {}".format(runner.get_peak_entities(), stage.is_finished()))
+    for kind_name, stats in stage.get_pool_stats().items():
+        print("[HEADLESS] {} pool: {reused} reused, {created} created, {free} free".format(kind_name, **stats))
+    winner = stage.get_winner()
+    if winner is not None:
+        print("[HEADLESS] Winner: P{}".format(winner.get_player_index() + 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,40 @@
 from game import Game
+from replay import load_replay
+from headless import new_stage
+from net.transport import UdpTransport, parse_address
+from net.rollback import RollbackSession
+from net.spectator import SpectatorConnection
+import argparse
 
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(description="Rutabagarre")
+    parser.add_argument("--replay", default=None, help="replay file to play instead of starting the menu")
+    parser.add_argument("--speed", type=int, default=1, help="replay speed, from 1 to {} (default: 1)".format(Game.MAX_REPLAY_SPEED))
+    parser.add_argument("--record", default=None, help="directory to record the replays of the matches to")
+    parser.add_argument("--online", type=int, default=None, metavar="INDEX", help="play online as the player of this index")
+    parser.add_argument("--port", type=int, default=7000, help="local UDP port of an online match (default: 7000)")
+    parser.add_argument("--peer", action="append", default=[], help="address host:port of a remote peer of an online "
+                        "match, remote players get the other indices in order")
+    parser.add_argument("--seed", type=int, default=1, help="seed of an online match, the same for all peers (default: 1)")
+    parser.add_argument("--watch", default=None, metavar="HOST:PORT", help="watch the match of a server as a spectator")
+    args = parser.parse_args()
+
+    session = None
+    if args.online is not None:
+        if not len(args.peer):
+            parser.error("an online match needs at least one --peer")
+        players_count = len(args.peer) + 1
+        remote_indices = [player_idx for player_idx in range(players_count) if player_idx != args.online]
+        transport = UdpTransport(("0.0.0.0", args.port))
+        session = RollbackSession(new_stage(players_count, args.seed), args.online, transport,
+                                  dict(zip(remote_indices, map(parse_address, args.peer))))
+
+    spectator = None
+    if args.watch is not None:
+        spectator = SpectatorConnection(parse_address(args.watch))
+
     game = Game()
-    game.start()
+    game.set_record_dir(args.record)
+    game.start(None if args.replay is None else load_replay(args.replay), args.speed, session, spectator)
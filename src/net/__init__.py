@@ -0,0 +1,4 @@
+"""
+Online play, without PyGame. Modules must be run from the `src` directory,
+for example: `python -m net.loopback`.
+"""
@@ -0,0 +1,226 @@
+"""
+Client of a match server (`net.server`). Run alone, it starts many clients in
+one process with random commands, or with the commands of bots playing on a
+mirror of the stage (see `bot`), to test the load of the server.
+Usage: `python -m net.client [--server 127.0.0.1:7500] [--clients 32] [--seconds 10] [--bot normal]`
+"""
+
+from typing import Dict, List, Optional, Tuple
+from time import perf_counter, perf_counter_ns
+import argparse
+import asyncio
+import random
+
+from net.protocol import MSG_WELCOME, MSG_SNAPSHOT, SNAPSHOT, ANY_PLAYER, NO_PLAYER, ProtocolError, \
+    pack_join, pack_command, unpack_welcome, unpack_snapshot_header
+from net.snapshot import Snapshot, decode_delta
+from net.mirror import SnapshotMirror
+from net.transport import Address, parse_address
+from entity.player import PlayerInput
+from stage_file import new_stage_from_source
+from bot import Bot, DIFFICULTIES
+from stage import Stage
+
+
+class MatchClient(asyncio.DatagramProtocol):
+
+    """
+    Datagram protocol of a client. Snapshots are decoded from the baseline
+    chosen by the server, received snapshots of the last `HISTORY` ticks are
+    kept for that. The client answers each snapshot with its commands and
+    the tick of its last snapshot as ack.
+    """
+
+    __slots__ = "_requested_idx", "_transport", "_welcome", "_player_idx", "_players_count", "_seed", \
+                "_stage_source", "_commands", "_snapshots", "_snapshot", \
+                "_decoded", "_received_bytes", "_decode_ns", "_missing_baselines"
+
+    HISTORY = 64
+
+    def __init__(self, player_idx: int = ANY_PLAYER):
+        self._requested_idx = player_idx
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._welcome = asyncio.get_running_loop().create_future()
+        self._player_idx = NO_PLAYER
+        self._players_count = 0
+        self._seed = 0
+        self._stage_source = ""
+        self._commands = 0
+        self._snapshots: Dict[int, Snapshot] = {}
+        self._snapshot: Optional[Snapshot] = None
+        self._decoded = 0
+        self._received_bytes = 0
+        self._decode_ns = 0
+        self._missing_baselines = 0
+
+    async def join(self, timeout: float = 5.0):
+        """ Send join messages until the server answers, raise `TimeoutError` after the timeout. """
+        deadline = perf_counter() + timeout
+        while not self._welcome.done():
+            if perf_counter() > deadline:
+                raise TimeoutError("No answer from the server.")
+            self._transport.sendto(pack_join(self._requested_idx))
+            await asyncio.wait([self._welcome], timeout=0.25)
+
+    def close(self):
+        self._transport.close()
+
+    def get_player_index(self) -> int:
+        """ Return the index of the player controlled by this client, `NO_PLAYER` if none. """
+        return self._player_idx
+
+    def get_players_count(self) -> int:
+        return self._players_count
+
+    def get_seed(self) -> int:
+        return self._seed
+
+    def get_stage_source(self) -> str:
+        return self._stage_source
+
+    def set_commands(self, commands: int):
+        """ Set the commands of the player, sent with the acks until changed. """
+        self._commands = commands
+
+    def get_snapshot(self) -> Optional[Snapshot]:
+        """ Return the last received snapshot, None if none yet. """
+        return self._snapshot
+
+    # Network
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, address: Address):
+        if not len(data):
+            return
+        try:
+            if data[0] == MSG_SNAPSHOT:
+                self._receive_snapshot(data)
+            elif data[0] == MSG_WELCOME and not self._welcome.done():
+                self._player_idx, self._players_count, self._seed, _, self._stage_source = unpack_welcome(data)
+                self._welcome.set_result(None)
+        except ProtocolError as e:
+            print("[CLIENT] Invalid message: {}".format(e))
+
+    def error_received(self, exc: Exception):
+        pass
+
+    def _receive_snapshot(self, data: bytes):
+
+        tick, baseline_tick = unpack_snapshot_header(data)
+        last = self._snapshot
+        if last is not None and tick <= last.tick:
+            return  # Late datagram.
+
+        baseline = None
+        if baseline_tick >= 0:
+            baseline = self._snapshots.get(baseline_tick)
+            if baseline is None:
+                # Our previous ack was not received yet, the next snapshots will use a known baseline.
+                self._missing_baselines += 1
+                return
+
+        start = perf_counter_ns()
+        snapshot, _ = decode_delta(data, SNAPSHOT.size, tick, baseline)
+        self._decode_ns += perf_counter_ns() - start
+        self._decoded += 1
+        self._received_bytes += len(data)
+
+        self._snapshot = snapshot
+        self._snapshots[tick] = snapshot
+        for old_tick in [old_tick for old_tick in self._snapshots if old_tick <= tick - self.HISTORY]:
+            del self._snapshots[old_tick]
+
+        self._transport.sendto(pack_command(tick, self._commands))
+
+    # Statistics
+
+    def get_decoded_count(self) -> int:
+        return self._decoded
+
+    def get_received_bytes(self) -> int:
+        return self._received_bytes
+
+    def get_decode_time(self) -> float:
+        """ Return the total time spent decoding snapshots, in seconds. """
+        return self._decode_ns / 1e9
+
+    def get_missing_baselines_count(self) -> int:
+        return self._missing_baselines
+
+
+# Random commands of the load test clients.
+_RANDOM_COMMANDS = (PlayerInput.NONE, PlayerInput.LEFT, PlayerInput.RIGHT, PlayerInput.LEFT | PlayerInput.UP,
+                    PlayerInput.RIGHT | PlayerInput.UP, PlayerInput.ACTION, PlayerInput.HEAVY_ACTION)
+
+
+async def _run_clients(args):
+
+    loop = asyncio.get_running_loop()
+    server = parse_address(args.server)
+    clients: List[MatchClient] = []
+    for _ in range(args.clients):
+        _, client = await loop.create_datagram_endpoint(MatchClient, remote_addr=server)
+        clients.append(client)
+    await asyncio.gather(*(client.join() for client in clients))
+
+    players = sum(client.get_player_index() != NO_PLAYER for client in clients)
+    print("[CLIENT] {} clients joined, {} with a player.".format(len(clients), players))
+
+    # Bots of the clients with a player, each one with a mirror of the stage built from the snapshots.
+    bots: List[Tuple[MatchClient, Bot, SnapshotMirror]] = []
+    if args.bot is not None:
+        for client in clients:
+            if client.get_player_index() != NO_PLAYER:
+                mirror = SnapshotMirror(new_stage_from_source(client.get_stage_source(), client.get_seed()))
+                bots.append((client, DIFFICULTIES[args.bot](args.seed), mirror))
+
+    rand = random.Random(args.seed)
+    end_time = perf_counter() + args.seconds
+    while perf_counter() < end_time:
+        if args.bot is None:
+            for client in clients:
+                if rand.random() < 0.1:
+                    client.set_commands(rand.choice(_RANDOM_COMMANDS))
+            await asyncio.sleep(0.1)
+        else:
+            for client, bot, mirror in bots:
+                snapshot = client.get_snapshot()
+                if snapshot is not None and snapshot.tick != mirror.get_tick():
+                    mirror.apply(snapshot)
+                    player = mirror.get_stage().get_player(client.get_player_index())
+                    if player is not None and not player.is_dead():
+                        client.set_commands(bot.get_commands(mirror.get_stage(), player))
+            await asyncio.sleep(1 / Stage.TICK_RATE)
+
+    for client in clients:
+        client.close()
+
+    snapshots = [client.get_snapshot() for client in clients]
+    ticks = [0 if snapshot is None else snapshot.tick for snapshot in snapshots]
+    total_bytes = sum(client.get_received_bytes() for client in clients)
+    decode_time = sum(client.get_decode_time() for client in clients)
+    decoded = sum(client.get_decoded_count() for client in clients)
+    missing = sum(client.get_missing_baselines_count() for client in clients)
+    print("[CLIENT] Last ticks from {} to {}, {:.1f} KB/s per client, decoding {:.1f} us/snapshot, "
+          "{} snapshots with a missing baseline".format(
+              min(ticks), max(ticks), total_bytes / len(clients) / args.seconds / 1000,
+              decode_time * 1e6 / max(1, decoded), missing))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Connect many clients with random commands to a match server.")
+    parser.add_argument("--server", default="127.0.0.1:7500", help="address of the server (default: 127.0.0.1:7500)")
+    parser.add_argument("--clients", type=int, default=32, help="number of clients (default: 32)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of the test (default: 10)")
+    parser.add_argument("--bot", choices=DIFFICULTIES.keys(), default=None,
+                        help="clients with a player send the commands of a bot of this difficulty (default: random commands)")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the random commands and bots")
+    args = parser.parse_args()
+    asyncio.run(_run_clients(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Run an online match between peer processes on localhost and check that all
+peers end with the same state.
+Usage: `python -m net.loopback [--peers 2] [--loss 0.1] [--latency 40]`
+"""
+
+from typing import List
+import subprocess
+import argparse
+import sys
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run peers of an online match on localhost and compare their states.")
+    parser.add_argument("--peers", type=int, default=2, help="number of peer processes (default: 2)")
+    parser.add_argument("--port", type=int, default=7400, help="port of the first peer (default: 7400)")
+    parser.add_argument("--ticks", type=int, default=1200, help="number of ticks to run (default: 1200)")
+    parser.add_argument("--tick-rate", type=int, default=60, help="ticks per second (default: 60)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the stage (default: 1)")
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated ratio of lost datagrams")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated latency in milliseconds")
+    args = parser.parse_args()
+
+    addresses = ["127.0.0.1:{}".format(args.port + i) for i in range(args.peers)]
+    processes: List[subprocess.Popen] = []
+    for i in range(args.peers):
+        command = [sys.executable, "-m", "net.peer", "--index", str(i), "--port", str(args.port + i),
+                   "--ticks", str(args.ticks), "--tick-rate", str(args.tick_rate), "--seed", str(args.seed),
+                   "--loss", str(args.loss), "--latency", str(args.latency)]
+        for j, address in enumerate(addresses):
+            if j != i:
+                command.extend(("--peer", address))
+        processes.append(subprocess.Popen(command, stdout=subprocess.PIPE, text=True))
+
+    checksums = []
+    for process in processes:
+        output, _ = process.communicate()
+        sys.stdout.write(output)
+        checksums.append(next((line.split()[-1] for line in output.splitlines() if line.startswith("[NET] Checksum")), None))
+
+    if None in checksums or any(process.returncode != 0 for process in processes):
+        print("[NET] A peer failed.")
+        raise SystemExit(1)
+    elif len(set(checksums)) != 1:
+        print("[NET] Desync, peers have different states.")
+        raise SystemExit(1)
+    else:
+        print("[NET] In sync.")
+
+
+if __name__ == '__main__':
+    main()
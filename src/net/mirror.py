@@ -0,0 +1,71 @@
+from typing import Dict
+
+from net.snapshot import Snapshot, POSITION_SCALE, PLAYER_TURNED_TO_LEFT, PLAYER_SLEEPING, PLAYER_ON_GROUND, \
+    PLAYER_MOVING, PLAYER_SPECIAL_ACTION
+from entity.player import Player, PlayerColor, IncarnationType
+from entity.effect import Effect, EffectType
+from entity.bullet import Bullet
+from entity.item import Item
+from entity import Entity
+from stage import Stage
+
+
+class SnapshotMirror:
+
+    """
+    Apply received snapshots to a local stage that is never updated, so that
+    it can be drawn by `InGameView` like a simulated stage. Entities of the
+    snapshots are added, moved and removed in the mirror stage, which has
+    UIDs of its own. Players removed from snapshots are removed from the
+    mirror stage, so it is finished with the same winner. One-shot player
+    animations (attacks, hits) are not part of snapshots and not shown.
+    """
+
+    __slots__ = "_stage", "_entities", "_tick"
+
+    def __init__(self, stage: Stage):
+        self._stage = stage
+        # Mirror entities by UID in snapshots.
+        self._entities: Dict[int, Entity] = {}
+        self._tick = -1
+
+    def get_stage(self) -> Stage:
+        return self._stage
+
+    def get_tick(self) -> int:
+        """ Return the tick of the last applied snapshot, -1 if none. """
+        return self._tick
+
+    def apply(self, snapshot: Snapshot):
+
+        stage = self._stage
+        entities = self._entities
+        kinds = stage.ENTITY_KINDS
+
+        for uid in [uid for uid in entities if uid not in snapshot.entities]:
+            entities.pop(uid).set_dead()
+
+        for uid, fields in snapshot.entities.items():
+            entity = entities.get(uid)
+            kind = kinds[fields[0]]
+            if entity is None:
+                if kind is Player:
+                    stage.add_player(fields[6], PlayerColor(fields[7]))
+                    entity = stage.get_player(fields[6])
+                elif kind is Item:
+                    entity = stage.add_entity(Item, IncarnationType(fields[3]))
+                elif kind is Effect:
+                    entity = stage.add_entity(Effect, EffectType(fields[3]), 0)
+                else:
+                    entity = stage.add_entity(Bullet, None, 0.0, 0.0)
+                entities[uid] = entity
+            entity.set_position(fields[1] / POSITION_SCALE, fields[2] / POSITION_SCALE)
+            if kind is Player:
+                flags = fields[5]
+                entity.set_mirrored_state(fields[3], None if fields[4] == 0 else IncarnationType(fields[4]),
+                                          fields[8] / 255, bool(flags & PLAYER_SLEEPING),
+                                          bool(flags & PLAYER_SPECIAL_ACTION), bool(flags & PLAYER_MOVING),
+                                          bool(flags & PLAYER_ON_GROUND), bool(flags & PLAYER_TURNED_TO_LEFT))
+
+        stage.remove_dead_entities()
+        self._tick = snapshot.tick
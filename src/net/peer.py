@@ -0,0 +1,87 @@
+"""
+Headless peer of an online match, its player is driven by a script like in
+`headless.py`. At the end, the peer waits for all commands to be confirmed and
+prints a checksum of the final state, identical on every peer if in sync.
+Usage: `python -m net.peer --index 0 --port 7000 --peer 127.0.0.1:7001 --ticks 1200`
+"""
+
+from typing import Dict
+import argparse
+import random
+import zlib
+import time
+
+from net.transport import Address, UdpTransport, parse_address
+from net.rollback import RollbackSession
+from headless import SCRIPTS, new_stage
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run a headless peer of an online match.")
+    parser.add_argument("--index", type=int, required=True, help="index of the local player")
+    parser.add_argument("--port", type=int, required=True, help="local UDP port")
+    parser.add_argument("--peer", action="append", required=True, help="address host:port of a remote peer, "
+                        "remote players get the other indices in order")
+    parser.add_argument("--ticks", type=int, default=1200, help="number of ticks to run (default: 1200)")
+    parser.add_argument("--tick-rate", type=int, default=60, help="ticks per second, the same for all peers (default: 60)")
+    parser.add_argument("--script", choices=SCRIPTS.keys(), default="brawl", help="local player script (default: brawl)")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the stage, the same for all peers (default: 1)")
+    parser.add_argument("--input-delay", type=int, default=0, help="ticks of delay of local commands (default: 0)")
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated ratio of lost datagrams")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated latency of datagrams in milliseconds")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for peers (default: 10)")
+    args = parser.parse_args()
+
+    players_count = len(args.peer) + 1
+    remote_indices = [player_idx for player_idx in range(players_count) if player_idx != args.index]
+    remotes: Dict[int, Address] = dict(zip(remote_indices, map(parse_address, args.peer)))
+
+    # The script only chooses the local commands, its randomness is not part of the match.
+    random.seed(args.seed * players_count + args.index)
+    script = SCRIPTS[args.script]
+
+    transport = UdpTransport(("0.0.0.0", args.port), loss=args.loss, delay=args.latency / 1000, seed=args.index)
+    stage = new_stage(players_count, args.seed, tick_rate=args.tick_rate)
+    session = RollbackSession(stage, args.index, transport, remotes, input_delay=args.input_delay)
+
+    tick_duration = 1.0 / stage.get_tick_rate()
+    deadline = time.perf_counter() + args.timeout
+    next_tick_time = time.perf_counter()
+    while stage.get_tick() < args.ticks:
+        now = time.perf_counter()
+        if now < next_tick_time:
+            time.sleep(next_tick_time - now)
+        next_tick_time += tick_duration
+        player = stage.get_player(args.index)
+        session.set_local_input(0 if player.is_dead() else script(stage, player))
+        if session.advance():
+            deadline = time.perf_counter() + args.timeout
+        elif time.perf_counter() > deadline:
+            raise SystemExit("[NET] Timeout, no commands received from peers.")
+
+    # Wait for the commands of all players until the last tick, and for ours to be received.
+    while session.get_confirmed_tick() < args.ticks - 1 or not session.is_acknowledged(args.ticks - 1):
+        if time.perf_counter() > deadline:
+            raise SystemExit("[NET] Timeout, commands of the last ticks not confirmed.")
+        session.poll()
+        time.sleep(0.001)
+
+    # Peers may still wait for our acknowledgment of their last commands.
+    linger_until = time.perf_counter() + 0.5
+    while time.perf_counter() < linger_until:
+        session.poll()
+        time.sleep(0.01)
+
+    state = stage.save_state()
+    print("[NET] Player {}: {} ticks, {} rollbacks, {} ticks resimulated, longest rollback {:.2f} ms, "
+          "{} stalls, {} of {} datagrams dropped".format(
+              args.index + 1, stage.get_tick(), session.get_rollbacks_count(), session.get_resimulated_ticks(),
+              session.get_rollback_max_duration() * 1000, session.get_stalls_count(),
+              transport.get_dropped_count(), transport.get_sent_count()))
+    print("[NET] Checksum: {:08x}".format(zlib.crc32(state.data, zlib.crc32(repr(state.random_state).encode()))))
+    transport.close()
+
+
+if __name__ == '__main__':
+    main()
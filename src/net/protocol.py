@@ -0,0 +1,122 @@
+"""
+Messages of online matches, all values are little-endian.
+
+Messages exchanged by peers of a rollback match (`net.rollback`):
+
+- hello: type (u8), player index (u8), players count (u8), stage seed (u64),
+  sent until the peer answers, the match starts at tick 0 once all peers did;
+- inputs: type (u8), player index (u8), ack (i32), start tick (u32), count (u8)
+  then the commands of the player (u8) for ticks from the start tick. The ack
+  is the last tick of contiguous inputs received from the destination peer,
+  inputs are sent again from the ack until they are acknowledged.
+
+Messages exchanged by clients and the server of a match (`net.server`):
+
+- join: type (u8), requested player index (u8, `ANY_PLAYER` for any free
+  player), sent by clients until they receive a welcome;
+- welcome: type (u8), player index (u8, `NO_PLAYER` if no player is free),
+  players count (u8), stage seed (u64), tick (u32), then the stage source;
+- command: type (u8), ack (i32), commands (u8), sent by clients at each tick.
+  The ack is the last tick of snapshot received by the client;
+- snapshot: type (u8), tick (u32), baseline tick (i32, -1 if none), then the
+  delta of entities from the baseline, see `net.snapshot`.
+"""
+
+from typing import Sequence, Tuple
+import struct
+
+
+MSG_HELLO = 0
+MSG_INPUTS = 1
+MSG_JOIN = 2
+MSG_WELCOME = 3
+MSG_COMMAND = 4
+MSG_SNAPSHOT = 5
+
+HELLO = struct.Struct("<BBBQ")
+INPUTS = struct.Struct("<BBiIB")
+JOIN = struct.Struct("<BB")
+WELCOME = struct.Struct("<BBBQI")
+COMMAND = struct.Struct("<BiB")
+SNAPSHOT = struct.Struct("<BIi")
+
+ANY_PLAYER = 0xFF
+NO_PLAYER = 0xFF
+
+# Maximum number of commands in an inputs message.
+MAX_INPUTS = 64
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def pack_hello(player_idx: int, players_count: int, seed: int) -> bytes:
+    return HELLO.pack(MSG_HELLO, player_idx, players_count, seed)
+
+
+def pack_inputs(player_idx: int, ack: int, start_tick: int, commands: Sequence[int]) -> bytes:
+    return INPUTS.pack(MSG_INPUTS, player_idx, ack, start_tick, len(commands)) + bytes(commands)
+
+
+def unpack_hello(data: bytes) -> Tuple[int, int, int]:
+    """ Return the player index, players count and seed of a hello message. """
+    if len(data) != HELLO.size:
+        raise ProtocolError("Invalid hello message size {}.".format(len(data)))
+    return HELLO.unpack(data)[1:]
+
+
+def unpack_inputs(data: bytes) -> Tuple[int, int, int, bytes]:
+    """ Return the player index, ack, start tick and commands of an inputs message. """
+    if len(data) < INPUTS.size:
+        raise ProtocolError("Truncated inputs message.")
+    _, player_idx, ack, start_tick, count = INPUTS.unpack_from(data)
+    commands = data[INPUTS.size:]
+    if len(commands) != count:
+        raise ProtocolError("Invalid inputs count {}, expected {}.".format(len(commands), count))
+    return player_idx, ack, start_tick, commands
+
+
+def pack_join(player_idx: int) -> bytes:
+    return JOIN.pack(MSG_JOIN, player_idx)
+
+
+def unpack_join(data: bytes) -> int:
+    """ Return the requested player index of a join message. """
+    if len(data) != JOIN.size:
+        raise ProtocolError("Invalid join message size {}.".format(len(data)))
+    return JOIN.unpack(data)[1]
+
+
+def pack_welcome(player_idx: int, players_count: int, seed: int, tick: int, stage_source: str) -> bytes:
+    return WELCOME.pack(MSG_WELCOME, player_idx, players_count, seed, tick) + stage_source.encode("utf-8")
+
+
+def unpack_welcome(data: bytes) -> Tuple[int, int, int, int, str]:
+    """ Return the player index, players count, seed, tick and stage source of a welcome message. """
+    if len(data) < WELCOME.size:
+        raise ProtocolError("Truncated welcome message.")
+    _, player_idx, players_count, seed, tick = WELCOME.unpack_from(data)
+    try:
+        stage_source = bytes(data[WELCOME.size:]).decode("utf-8")
+    except UnicodeDecodeError:
+        raise ProtocolError("Invalid stage source.")
+    return player_idx, players_count, seed, tick, stage_source
+
+
+def pack_command(ack: int, commands: int) -> bytes:
+    return COMMAND.pack(MSG_COMMAND, ack, commands)
+
+
+def unpack_command(data: bytes) -> Tuple[int, int]:
+    """ Return the ack and commands of a command message. """
+    if len(data) != COMMAND.size:
+        raise ProtocolError("Invalid command message size {}.".format(len(data)))
+    return COMMAND.unpack(data)[1:]
+
+
+def unpack_snapshot_header(data: bytes) -> Tuple[int, int]:
+    """ Return the tick and baseline tick of a snapshot message, the delta follows at `SNAPSHOT.size`. """
+    if len(data) < SNAPSHOT.size:
+        raise ProtocolError("Truncated snapshot message.")
+    return SNAPSHOT.unpack_from(data)[1:]
@@ -0,0 +1,229 @@
+from typing import Dict, List, Optional
+from time import perf_counter
+
+from net.protocol import MSG_HELLO, MSG_INPUTS, MAX_INPUTS, ProtocolError, \
+    pack_hello, pack_inputs, unpack_hello, unpack_inputs
+from net.transport import Address, UdpTransport
+from stage import Stage, StageState
+
+
+class RollbackSession:
+
+    """
+    Rollback session of an online match, one player per peer. The stage runs
+    immediately with the local commands, while the commands of remote players
+    that are not received yet are predicted (they keep their last commands).
+    When received commands differ from the prediction, the stage is restored
+    at the first mispredicted tick and ticks are simulated again up to the
+    current tick, within the same call. The stage never runs more than
+    `max_rollback` ticks ahead of received commands, so that a rollback never
+    resimulates more ticks than that.
+
+    Every peer must create the same stage, with the same seed and roster.
+    """
+
+    __slots__ = "_stage", "_local_idx", "_transport", "_remotes", "_input_delay", "_max_rollback", \
+                "_connected", "_inputs", "_acks", "_local_commands", "_predicted", "_states", "_rollback_tick", \
+                "_rollbacks", "_resimulated_ticks", "_rollback_max_duration", "_stalls"
+
+    def __init__(self, stage: Stage, local_idx: int, transport: UdpTransport, remotes: Dict[int, Address], *,
+                 input_delay: int = 0, max_rollback: int = 8):
+
+        if stage.get_tick() != 0:
+            raise ValueError("An online match must start at the first tick of the stage.")
+
+        self._stage = stage
+        self._local_idx = local_idx
+        self._transport = transport
+        self._remotes = remotes
+        self._input_delay = input_delay
+        self._max_rollback = max_rollback
+        self._connected = set()
+
+        # Commands of each player for each tick, received or local, contiguous from tick 0.
+        self._inputs: Dict[int, List[int]] = {player_idx: [] for player_idx in (local_idx, *remotes)}
+        self._inputs[local_idx].extend(0 for _ in range(input_delay))
+        # Last tick of local commands acknowledged by each remote player.
+        self._acks: Dict[int, int] = {player_idx: -1 for player_idx in remotes}
+        self._local_commands = 0
+
+        # Predicted commands (by player index) of each tick simulated with
+        # predictions, and the state at the beginning of these ticks.
+        self._predicted: Dict[int, Dict[int, int]] = {}
+        self._states: Dict[int, StageState] = {}
+        self._rollback_tick: Optional[int] = None
+
+        self._rollbacks = 0
+        self._resimulated_ticks = 0
+        self._rollback_max_duration = 0.0
+        self._stalls = 0
+
+    def get_stage(self) -> Stage:
+        return self._stage
+
+    def get_local_index(self) -> int:
+        return self._local_idx
+
+    def is_connected(self) -> bool:
+        return len(self._connected) == len(self._remotes)
+
+    def set_local_input(self, commands: int):
+        """ Set the commands of the local player, used for the next simulated tick (plus the input delay). """
+        self._local_commands = commands
+
+    def get_confirmed_tick(self) -> int:
+        """ Return the last tick for which the commands of all players are known. """
+        return min(len(commands) for commands in self._inputs.values()) - 1
+
+    def is_acknowledged(self, tick: int) -> bool:
+        """ Return True if all remote players received the local commands up to this tick. """
+        return all(ack >= tick for ack in self._acks.values())
+
+    # Network
+
+    def poll(self):
+
+        """
+        Receive messages, send the local commands not acknowledged yet, and
+        roll back if received commands contradict predictions.
+        """
+
+        players_count = len(self._remotes) + 1
+        seed = self._stage.get_seed()
+
+        for data, address in self._transport.receive():
+            if not len(data):
+                continue
+            if data[0] == MSG_HELLO:
+                player_idx, remote_players_count, remote_seed = unpack_hello(data)
+                if player_idx not in self._remotes:
+                    continue
+                if remote_players_count != players_count or remote_seed != seed:
+                    raise ProtocolError("Player {} has a different match ({} players, seed {}).".format(
+                        player_idx + 1, remote_players_count, remote_seed))
+                if player_idx in self._connected:
+                    # Our hello may have been lost, the peer is still waiting for it.
+                    self._transport.send(pack_hello(self._local_idx, players_count, seed), address)
+                self._connected.add(player_idx)
+            elif data[0] == MSG_INPUTS:
+                player_idx, ack, start_tick, commands = unpack_inputs(data)
+                if player_idx in self._remotes:
+                    self._connected.add(player_idx)
+                    self._acks[player_idx] = max(self._acks[player_idx], ack)
+                    self._receive_inputs(player_idx, start_tick, commands)
+
+        local_commands = self._inputs[self._local_idx]
+        for player_idx, address in self._remotes.items():
+            if player_idx not in self._connected:
+                self._transport.send(pack_hello(self._local_idx, players_count, seed), address)
+            else:
+                start_tick = self._acks[player_idx] + 1
+                self._transport.send(pack_inputs(
+                    self._local_idx, len(self._inputs[player_idx]) - 1, start_tick,
+                    local_commands[start_tick:start_tick + MAX_INPUTS]
+                ), address)
+
+        if self._rollback_tick is not None:
+            self._rollback()
+
+    def _receive_inputs(self, player_idx: int, start_tick: int, commands: bytes):
+
+        player_inputs = self._inputs[player_idx]
+        tick = len(player_inputs)
+        if start_tick > tick:
+            # Commands are missing before these ones, they will be sent again.
+            return
+
+        current_tick = self._stage.get_tick()
+        for tick_commands in commands[tick - start_tick:]:
+            player_inputs.append(tick_commands)
+            predicted = self._predicted.get(tick)
+            if predicted is not None and player_idx in predicted:
+                if predicted.pop(player_idx) != tick_commands and tick < current_tick:
+                    if self._rollback_tick is None or tick < self._rollback_tick:
+                        self._rollback_tick = tick
+                if not len(predicted) and tick != self._rollback_tick:
+                    del self._predicted[tick]
+                    self._states.pop(tick, None)
+            tick += 1
+
+    # Simulation
+
+    def advance(self) -> bool:
+
+        """
+        Simulate the next tick once all peers are connected, return False if
+        the stage is waiting for peers or too far ahead of remote commands.
+        """
+
+        self.poll()
+        if not self.is_connected():
+            return False
+
+        tick = self._stage.get_tick()
+        local_commands = self._inputs[self._local_idx]
+        if len(local_commands) <= tick + self._input_delay:
+            local_commands.append(self._local_commands)
+
+        if tick - self.get_confirmed_tick() > self._max_rollback:
+            self._stalls += 1
+            return False
+
+        self._simulate(tick)
+        return True
+
+    def _simulate(self, tick: int):
+
+        stage = self._stage
+        commands: Dict[int, int] = {}
+        predicted: Dict[int, int] = {}
+        for player_idx, player_inputs in self._inputs.items():
+            if tick < len(player_inputs):
+                commands[player_idx] = player_inputs[tick]
+            else:
+                commands[player_idx] = predicted[player_idx] = player_inputs[-1] if len(player_inputs) else 0
+
+        if len(predicted):
+            self._predicted[tick] = predicted
+            self._states[tick] = stage.save_state()
+
+        for player_idx, player_commands in commands.items():
+            if player_commands:
+                stage.set_input(player_idx, player_commands)
+        stage.update()
+
+    def _rollback(self):
+
+        """ Restore the stage at the first mispredicted tick and simulate again up to the current tick. """
+
+        start = perf_counter()
+        rollback_tick = self._rollback_tick
+        self._rollback_tick = None
+
+        stage = self._stage
+        current_tick = stage.get_tick()
+        stage.load_state(self._states[rollback_tick])
+        for tick in range(rollback_tick, current_tick):
+            self._predicted.pop(tick, None)
+            self._states.pop(tick, None)
+        for tick in range(rollback_tick, current_tick):
+            self._simulate(tick)
+
+        self._rollbacks += 1
+        self._resimulated_ticks += current_tick - rollback_tick
+        self._rollback_max_duration = max(self._rollback_max_duration, perf_counter() - start)
+
+    # Statistics
+
+    def get_rollbacks_count(self) -> int:
+        return self._rollbacks
+
+    def get_resimulated_ticks(self) -> int:
+        return self._resimulated_ticks
+
+    def get_rollback_max_duration(self) -> float:
+        """ Return the longest rollback (restore and resimulation) in seconds. """
+        return self._rollback_max_duration
+
+    def get_stalls_count(self) -> int:
+        return self._stalls
@@ -0,0 +1,304 @@
+"""
+Authoritative server of a match: it owns the stage, applies the commands
+received from its clients at each tick and sends them snapshots of the
+entities, as deltas from the last snapshot each client acknowledged.
+Clients without a free player only receive snapshots. Spectators can watch
+the match over TCP with `--spectator-port`, see `net.spectator`.
+Usage: `python -m net.server [--port 7500] [--players 4] [--stage example] [--spectator-port 7501]`
+"""
+
+from typing import Dict, Optional
+from time import perf_counter, perf_counter_ns
+import argparse
+import asyncio
+
+from net.protocol import MSG_JOIN, MSG_COMMAND, SNAPSHOT, MSG_SNAPSHOT, ANY_PLAYER, NO_PLAYER, ProtocolError, \
+    pack_welcome, unpack_join, unpack_command
+from net.snapshot import Snapshot, take_snapshot, encode_delta
+from net.spectator import SpectatorService
+from net.transport import Address
+from stage_file import new_stage_from_source, FACTORIES
+from entity.player import PlayerColor
+from stage import Stage
+
+
+class ServerClient:
+
+    """ A client known by the server. """
+
+    __slots__ = "address", "player_idx", "ack", "last_seen"
+
+    def __init__(self, address: Address, player_idx: int, now: float):
+        self.address = address
+        self.player_idx = player_idx
+        # Last tick of snapshot received by the client, -1 if none.
+        self.ack = -1
+        self.last_seen = now
+
+
+class MatchServer(asyncio.DatagramProtocol):
+
+    """
+    Datagram protocol of the server, with the tick loop in `run`. Snapshots
+    of the last `HISTORY` ticks are kept as baselines, a client whose ack is
+    older receives a full snapshot. Clients with the same ack share the same
+    encoded message, so the encoding cost grows with the number of distinct
+    acks rather than with the number of clients.
+    """
+
+    __slots__ = "_stage", "_stage_source", "_transport", "_clients", "_commands", "_snapshots", "_spectators", \
+                "_stats_ticks", "_stats_update_ns", "_stats_update_max_ns", "_stats_serialize_ns", "_stats_serialize_max_ns", "_stats_send_ns", "_stats_bytes", \
+                "_stats_messages", "_stats_encodings"
+
+    HISTORY = 64
+    CLIENT_TIMEOUT = 5.0
+
+    def __init__(self, stage: Stage, stage_source: str):
+        self._stage = stage
+        self._stage_source = stage_source
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._clients: Dict[Address, ServerClient] = {}
+        # Last commands received for each player controlled by a client.
+        self._commands: Dict[int, int] = {}
+        self._snapshots: Dict[int, Snapshot] = {}
+        self._spectators: Optional[SpectatorService] = None
+        self.reset_stats()
+
+    def get_stage(self) -> Stage:
+        return self._stage
+
+    def get_clients_count(self) -> int:
+        return len(self._clients)
+
+    def set_spectators(self, spectators: Optional[SpectatorService]):
+        """ Set the spectator service to publish the snapshots of each tick to. """
+        self._spectators = spectators
+
+    # Network
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, address: Address):
+        if not len(data):
+            return
+        try:
+            if data[0] == MSG_COMMAND:
+                client = self._clients.get(address)
+                if client is not None:
+                    ack, commands = unpack_command(data)
+                    client.ack = max(client.ack, min(ack, self._stage.get_tick()))
+                    client.last_seen = perf_counter()
+                    if client.player_idx != NO_PLAYER:
+                        self._commands[client.player_idx] = commands
+            elif data[0] == MSG_JOIN:
+                self._join(address, unpack_join(data))
+        except ProtocolError as e:
+            print("[SERVER] Invalid message from {}: {}".format(address, e))
+
+    def error_received(self, exc: Exception):
+        # Datagrams to a client that left (ICMP port unreachable), it will time out.
+        pass
+
+    def _join(self, address: Address, requested_idx: int):
+
+        client = self._clients.get(address)
+        if client is None:
+            taken = {other.player_idx for other in self._clients.values()}
+            free = [player_idx for player_idx in self._stage.get_players() if player_idx not in taken]
+            if requested_idx != ANY_PLAYER:
+                free = [player_idx for player_idx in free if player_idx == requested_idx]
+            client = ServerClient(address, free[0] if len(free) else NO_PLAYER, perf_counter())
+            self._clients[address] = client
+            print("[SERVER] Client {} joined as {}.".format(address, "observer" if client.player_idx == NO_PLAYER
+                                                            else "player {}".format(client.player_idx + 1)))
+
+        # Sent again if the previous welcome was lost.
+        self._transport.sendto(pack_welcome(client.player_idx, len(self._stage.get_players()), self._stage.get_seed(),
+                                            self._stage.get_tick(), self._stage_source), address)
+
+    def _remove_timed_out_clients(self):
+        limit = perf_counter() - self.CLIENT_TIMEOUT
+        for address, client in list(self._clients.items()):
+            if client.last_seen < limit:
+                del self._clients[address]
+                self._commands.pop(client.player_idx, None)
+                print("[SERVER] Client {} timed out.".format(address))
+
+    # Simulation
+
+    def update(self):
+
+        """ Simulate a tick with the last commands of the clients, then send them the new snapshot. """
+
+        stage = self._stage
+        for player_idx, commands in self._commands.items():
+            stage.set_input(player_idx, commands)
+        start = perf_counter_ns()
+        stage.update()
+        update_duration = perf_counter_ns() - start
+
+        start = perf_counter_ns()
+        snapshot = take_snapshot(stage)
+        tick = snapshot.tick
+        snapshots = self._snapshots
+        snapshots[tick] = snapshot
+        snapshots.pop(tick - self.HISTORY, None)
+
+        # Encoded messages by baseline tick.
+        messages: Dict[int, bytes] = {}
+        client_messages = []
+        for client in self._clients.values():
+            baseline = snapshots.get(client.ack)
+            baseline_tick = -1 if baseline is None else client.ack
+            message = messages.get(baseline_tick)
+            if message is None:
+                out = bytearray(SNAPSHOT.pack(MSG_SNAPSHOT, tick, baseline_tick))
+                encode_delta(out, snapshot, baseline)
+                message = messages[baseline_tick] = bytes(out)
+            client_messages.append((message, client.address))
+
+        send_start = perf_counter_ns()
+        sent_bytes = 0
+        for message, address in client_messages:
+            self._transport.sendto(message, address)
+            sent_bytes += len(message)
+        send_duration = perf_counter_ns() - send_start
+
+        if self._spectators is not None:
+            self._spectators.publish(snapshot)
+
+        duration = send_start - start
+        self._stats_ticks += 1
+        self._stats_update_ns += update_duration
+        self._stats_update_max_ns = max(self._stats_update_max_ns, update_duration)
+        self._stats_serialize_ns += duration
+        self._stats_serialize_max_ns = max(self._stats_serialize_max_ns, duration)
+        self._stats_send_ns += send_duration
+        self._stats_bytes += sent_bytes
+        self._stats_messages += len(self._clients)
+        self._stats_encodings += len(messages)
+
+    async def run(self, ticks: Optional[int] = None, report_interval: float = 5.0):
+
+        """ Run the tick loop at the tick rate of the stage, until the stage is finished or has run `ticks`. """
+
+        stage = self._stage
+        tick_duration = 1.0 / stage.get_tick_rate()
+        next_tick_time = perf_counter()
+        next_report_time = next_tick_time + report_interval
+
+        while not stage.is_finished() and (ticks is None or stage.get_tick() < ticks):
+            now = perf_counter()
+            if now < next_tick_time:
+                await asyncio.sleep(next_tick_time - now)
+            next_tick_time += tick_duration
+            # Running late (the process was suspended), don't try to catch up more than a second.
+            next_tick_time = max(next_tick_time, perf_counter() - 1.0)
+            self.update()
+            if perf_counter() >= next_report_time:
+                next_report_time += report_interval
+                self._remove_timed_out_clients()
+                self.print_stats()
+                self.reset_stats()
+
+        self.print_stats()
+
+    # Statistics
+
+    def reset_stats(self):
+        self._stats_ticks = 0
+        self._stats_update_ns = 0
+        self._stats_update_max_ns = 0
+        self._stats_serialize_ns = 0
+        self._stats_serialize_max_ns = 0
+        self._stats_send_ns = 0
+        self._stats_bytes = 0
+        self._stats_messages = 0
+        self._stats_encodings = 0
+        if self._spectators is not None:
+            self._spectators.reset_stats()
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Return statistics since the last reset: times by tick of simulation, of
+        serialization (snapshot and encodings) and of sending, and sizes of
+        snapshots.
+        """
+        ticks = max(1, self._stats_ticks)
+        messages = max(1, self._stats_messages)
+        return {
+            "ticks": self._stats_ticks,
+            "clients": len(self._clients),
+            "update_us": round(self._stats_update_ns / ticks / 1000, 1),
+            "update_max_us": round(self._stats_update_max_ns / 1000, 1),
+            "serialize_us": round(self._stats_serialize_ns / ticks / 1000, 1),
+            "serialize_max_us": round(self._stats_serialize_max_ns / 1000, 1),
+            "send_us": round(self._stats_send_ns / ticks / 1000, 1),
+            "encodings_per_tick": round(self._stats_encodings / ticks, 2),
+            "bytes_per_message": round(self._stats_bytes / messages, 1)
+        }
+
+    def print_stats(self):
+        print("[SERVER] Tick {}: {clients} clients, update {update_us} us/tick (max {update_max_us} us), serialization {serialize_us} us/tick (max {serialize_max_us} us), "
+              "{encodings_per_tick} encodings/tick, sending {send_us} us/tick, {bytes_per_message} bytes/snapshot".format(
+                  self._stage.get_tick(), **self.get_stats()))
+        if self._spectators is not None:
+            print("[SERVER] Spectators: {viewers} viewers, publish {publish_us} us/tick (max {publish_max_us} us), "
+                  "fan-out {fanout_us} us/tick, "
+                  "{drops} drops, {keyframes} keyframes".format(**self._spectators.get_stats()))
+
+
+async def _serve(args):
+
+    stage = new_stage_from_source(args.stage, args.seed)
+    colors = list(PlayerColor)
+    for player_idx in range(args.players):
+        stage.add_player(player_idx, colors[player_idx % len(colors)])
+
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(lambda: MatchServer(stage, args.stage),
+                                                            local_addr=("0.0.0.0", args.port))
+    print("[SERVER] Listening on port {}, {} players, stage '{}', seed {}.".format(
+        args.port, args.players, args.stage, stage.get_seed()))
+
+    spectators = None
+    if args.spectator_port is not None:
+        spectators = SpectatorService(stage, args.stage)
+        spectators.start(args.spectator_port)
+        server.set_spectators(spectators)
+        print("[SERVER] Spectators on TCP port {}.".format(args.spectator_port))
+
+    try:
+        await server.run(args.ticks, args.report)
+    finally:
+        transport.close()
+        if spectators is not None:
+            spectators.stop()
+
+    winner = stage.get_winner()
+    if winner is not None:
+        print("[SERVER] Winner: player {}".format(winner.get_player_index() + 1))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run the authoritative server of a match.")
+    parser.add_argument("--port", type=int, default=7500, help="UDP port (default: 7500)")
+    parser.add_argument("--players", type=int, default=4, help="number of players (default: 4)")
+    parser.add_argument("--stage", default="example", help="stage factory name ({}) or stage file resource path "
+                        "(default: example)".format(", ".join(FACTORIES.keys())))
+    parser.add_argument("--seed", type=int, default=None, help="seed of the stage")
+    parser.add_argument("--ticks", type=int, default=None, help="number of ticks to run (default: until finished)")
+    parser.add_argument("--spectator-port", type=int, default=None, help="TCP port of spectators (default: none)")
+    parser.add_argument("--report", type=float, default=5.0, help="seconds between statistics reports (default: 5)")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
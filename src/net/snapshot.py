@@ -0,0 +1,188 @@
+"""
+Quantized snapshots of the entities of a stage, and their delta encoding
+against a previous snapshot (the baseline) known by the receiver.
+
+Each entity is a tuple of integer fields, the first one is its kind code in
+`Stage.ENTITY_KINDS`, then its position in 1/64 of tile, then fields of its
+kind. Players: hp (rounded up), incarnation type value (0 if none), flags
+(`PLAYER_*`), player index, color value and incarnation duration ratio (in
+1/255). Items: incarnation type value. Effects: effect type value. Floors
+are static and not sent.
+
+A delta has the number of removed entities (varint) then their UIDs
+(varints), the number of changed entities (varint) then for each one its UID
+(varint), a mask of changed fields (varint) and the difference of each changed
+field with the baseline (zigzag varints). Fields of new entities are compared
+with zeros, their kind field is always sent first.
+"""
+
+from typing import Callable, Dict, Optional, Tuple
+from math import ceil
+
+from replay import ReplayError, write_varint, read_varint
+from net.protocol import ProtocolError
+from entity.player import Player
+from entity.bullet import Bullet
+from entity.effect import Effect
+from entity.item import Item
+from entity import Entity
+from stage import Stage
+
+
+# Positions are sent in 1/POSITION_SCALE of tile.
+POSITION_SCALE = 64
+
+PLAYER_TURNED_TO_LEFT = 1
+PLAYER_SLEEPING = 2
+PLAYER_INVINCIBLE = 4
+PLAYER_ON_GROUND = 8
+PLAYER_MOVING = 16
+PLAYER_SPECIAL_ACTION = 32
+
+
+def zigzag(value: int) -> int:
+    """ Map a signed integer to an unsigned one, small magnitudes to small values. """
+    return (value << 1) if value >= 0 else ((-value << 1) - 1)
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+def _player_fields(code: int, player: Player) -> Tuple[int, ...]:
+    incarnation_type = player.get_incarnation_type()
+    flags = (PLAYER_TURNED_TO_LEFT if player.get_turned_to_left() else 0) | \
+            (PLAYER_SLEEPING if player.is_sleeping() else 0) | \
+            (PLAYER_INVINCIBLE if player.is_invincible() else 0) | \
+            (PLAYER_ON_GROUND if player.is_on_ground() else 0) | \
+            (PLAYER_MOVING if player.get_vel_x() != 0 else 0) | \
+            (PLAYER_SPECIAL_ACTION if player.is_in_special_action() else 0)
+    incarnation_ratio = 0 if incarnation_type is None else round(min(1.0, player.get_incarnation_duration_ratio()) * 255)
+    return (code, round(player.get_x() * POSITION_SCALE), round(player.get_y() * POSITION_SCALE),
+            ceil(player.get_hp()), 0 if incarnation_type is None else incarnation_type.value,
+            flags, player.get_player_index(), player.get_color().value, incarnation_ratio)
+
+
+def _item_fields(code: int, item: Item) -> Tuple[int, ...]:
+    return (code, round(item.get_x() * POSITION_SCALE), round(item.get_y() * POSITION_SCALE),
+            item.get_incarnation_type().value)
+
+
+def _bullet_fields(code: int, bullet: Bullet) -> Tuple[int, ...]:
+    return code, round(bullet.get_x() * POSITION_SCALE), round(bullet.get_y() * POSITION_SCALE)
+
+
+def _effect_fields(code: int, effect: Effect) -> Tuple[int, ...]:
+    return (code, round(effect.get_x() * POSITION_SCALE), round(effect.get_y() * POSITION_SCALE),
+            effect.get_effect_type().value)
+
+
+# Fields of the entity kinds sent in snapshots.
+KIND_FIELDS: Dict[type, Callable[[int, Entity], Tuple[int, ...]]] = {
+    Player: _player_fields,
+    Item: _item_fields,
+    Bullet: _bullet_fields,
+    Effect: _effect_fields
+}
+
+# Number of fields of each kind code.
+FIELDS_COUNTS: Dict[int, int] = {
+    Stage.ENTITY_KINDS.index(Player): 9,
+    Stage.ENTITY_KINDS.index(Item): 4,
+    Stage.ENTITY_KINDS.index(Bullet): 3,
+    Stage.ENTITY_KINDS.index(Effect): 4
+}
+
+
+class Snapshot:
+
+    """ Quantized fields of the entities of a stage at a tick, by UID. """
+
+    __slots__ = "tick", "entities"
+
+    def __init__(self, tick: int, entities: Dict[int, Tuple[int, ...]]):
+        self.tick = tick
+        self.entities = entities
+
+
+def take_snapshot(stage: Stage) -> Snapshot:
+    entities: Dict[int, Tuple[int, ...]] = {}
+    for code, kind in enumerate(stage.ENTITY_KINDS):
+        fields = KIND_FIELDS.get(kind)
+        if fields is not None:
+            for entity in stage.get_entities_of(kind):
+                entities[entity.get_uid()] = fields(code, entity)
+    return Snapshot(stage.get_tick(), entities)
+
+
+def encode_delta(out: bytearray, snapshot: Snapshot, baseline: Optional[Snapshot]):
+
+    """ Append the delta from the baseline (or from nothing if None) to the snapshot. """
+
+    entities = snapshot.entities
+    base_entities = {} if baseline is None else baseline.entities
+
+    removed = [uid for uid in base_entities if uid not in entities]
+    write_varint(out, len(removed))
+    for uid in removed:
+        write_varint(out, uid)
+
+    changes = bytearray()
+    changes_count = 0
+    for uid, fields in entities.items():
+        base_fields = base_entities.get(uid)
+        if base_fields == fields:
+            continue
+        if base_fields is None:
+            base_fields = (0,) * len(fields)
+        mask = 0
+        for i, (value, base_value) in enumerate(zip(fields, base_fields)):
+            if value != base_value:
+                mask |= 1 << i
+        write_varint(changes, uid)
+        write_varint(changes, mask)
+        for i, (value, base_value) in enumerate(zip(fields, base_fields)):
+            if mask & (1 << i):
+                write_varint(changes, zigzag(value - base_value))
+        changes_count += 1
+
+    write_varint(out, changes_count)
+    out += changes
+
+
+def decode_delta(data, offset: int, tick: int, baseline: Optional[Snapshot]) -> Tuple[Snapshot, int]:
+
+    """ Decode a delta from the baseline, return the snapshot with the offset following the delta. """
+
+    entities = {} if baseline is None else dict(baseline.entities)
+    try:
+        removed_count, offset = read_varint(data, offset)
+        for _ in range(removed_count):
+            uid, offset = read_varint(data, offset)
+            entities.pop(uid, None)
+        changes_count, offset = read_varint(data, offset)
+        for _ in range(changes_count):
+            uid, offset = read_varint(data, offset)
+            mask, offset = read_varint(data, offset)
+            base_fields = entities.get(uid)
+            if base_fields is None:
+                if not mask & 1:
+                    raise ProtocolError("Kind of new entity {} is missing.".format(uid))
+                code, offset = read_varint(data, offset)
+                code = unzigzag(code)
+                if code not in FIELDS_COUNTS:
+                    raise ProtocolError("Invalid entity kind {}.".format(code))
+                fields = [0] * FIELDS_COUNTS[code]
+                fields[0] = code
+                first_field = 1
+            else:
+                fields = list(base_fields)
+                first_field = 0
+            for i in range(first_field, len(fields)):
+                if mask & (1 << i):
+                    delta, offset = read_varint(data, offset)
+                    fields[i] += unzigzag(delta)
+            entities[uid] = tuple(fields)
+    except ReplayError as e:
+        raise ProtocolError(str(e))
+    return Snapshot(tick, entities), offset
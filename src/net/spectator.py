@@ -0,0 +1,640 @@
+"""
+Spectators of a match server (`net.server`): the server encodes each tick
+once and fans it out to read-only viewers over TCP. Each message is framed
+by its length (u32) and is either a welcome or a snapshot (see
+`net.protocol`). Snapshots are deltas from the previous tick, or keyframes
+(no baseline) for viewers that just joined or were too slow.
+
+Viewers are served by a child process of the server. Each viewer has its
+own bounded queue of messages. When a viewer does not read fast enough and
+its queue is full, its queued messages are dropped and it waits for the next
+keyframe, the simulation never waits for viewers.
+Run alone, this module starts many viewers in one process, to test the load
+of the server.
+Usage: `python -m net.spectator [--server 127.0.0.1:7501] [--viewers 200] [--stalled 10] [--seconds 10]`
+"""
+
+from typing import Deque, List, Optional, Tuple
+from time import perf_counter, perf_counter_ns
+from collections import deque
+import multiprocessing
+import selectors
+import os
+import argparse
+import socket
+import struct
+
+from net.protocol import MSG_WELCOME, MSG_SNAPSHOT, SNAPSHOT, NO_PLAYER, ProtocolError, \
+    pack_welcome, unpack_welcome, unpack_snapshot_header
+from net.snapshot import Snapshot, encode_delta, decode_delta
+from net.transport import Address, parse_address
+from stage import Stage
+
+
+FRAME = struct.Struct("<I")
+
+# Maximum size of a received message.
+MAX_MESSAGE = 1 << 20
+
+
+# Statistics of the fan-out process sent to the service: viewers, drops, keyframes and fan-out time (ns).
+FAN_OUT_STATS = struct.Struct("<IIIQ")
+
+
+def _pack_frame(message: bytes) -> bytes:
+    return FRAME.pack(len(message)) + message
+
+
+class SpectatorViewer:
+
+    """
+    A viewer connected to the spectator service, with its non-blocking socket.
+    Data that the socket does not accept immediately (the viewer does not
+    read fast enough) is kept in a bounded queue, sent when it is writable.
+    The service feeds its fan-out process through one too.
+    """
+
+    __slots__ = "socket", "address", "waiting_keyframe", "closed", "_queue", "_first_sent"
+
+    def __init__(self, sock: socket.socket, address: Address):
+        self.socket = sock
+        self.address = address
+        self.waiting_keyframe = True
+        self.closed = False
+        # Chunks of whole messages not sent yet, the first one may be partially sent.
+        self._queue: Deque[memoryview] = deque()
+        self._first_sent = False
+
+    def has_queued(self) -> bool:
+        return len(self._queue) != 0
+
+    def write(self, data: bytes, queue_size: int) -> bool:
+        """ Send or queue whole messages, return False if the queue is full. """
+        if len(self._queue) >= queue_size:
+            return False
+        self._queue.append(memoryview(data))
+        if len(self._queue) == 1:
+            self.flush()
+        return True
+
+    def flush(self):
+        """ Send queued data until the socket buffer is full. """
+        queue = self._queue
+        try:
+            while len(queue):
+                chunk = queue[0]
+                sent = self.socket.send(chunk)
+                if sent < len(chunk):
+                    queue[0] = chunk[sent:]
+                    self._first_sent = True
+                    return
+                queue.popleft()
+                self._first_sent = False
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.closed = True
+
+    def drop(self):
+        """ Drop queued messages, except a partially sent one, the viewer will restart from a keyframe. """
+        first = self._queue[0] if self._first_sent else None
+        self._queue.clear()
+        if first is not None:
+            self._queue.append(first)
+        self.waiting_keyframe = True
+
+
+class SpectatorService:
+
+    """
+    Fan-out of the snapshots of a stage to viewers. `publish` is called by the
+    server after each tick: it encodes the delta from the previous tick, and
+    deltas are written together to a local socket every `SEND_INTERVAL`. This
+    is all the tick pays whatever the number of viewers, and nothing is
+    encoded while no viewer is connected. Viewers are served by a child
+    process (see `SpectatorFanOut`), so that encoding keyframes and writing to
+    viewers never compete with the tick for the interpreter. The process
+    reports its statistics through the same socket.
+    """
+
+    __slots__ = "_stage", "_stage_source", "_listener", "_link", "_process", "_previous", "_pending", \
+                "_next_send_ns", "_stats_buffer", "_fan_out_stats", "_fan_out_stats_base", \
+                "_stats_ticks", "_stats_publish_ns", "_stats_publish_max_ns"
+
+    # Seconds between two writes to the fan-out process, it does not fan out more often.
+    SEND_INTERVAL = 1 / 30
+    # Writes queued for the fan-out process when it does not read fast enough.
+    LINK_QUEUE_SIZE = 60
+    # Seconds given to the fan-out process to stop before it is terminated.
+    STOP_TIMEOUT = 2.0
+
+    def __init__(self, stage: Stage, stage_source: str):
+        self._stage = stage
+        self._stage_source = stage_source
+        self._listener: Optional[socket.socket] = None
+        # The fan-out process is fed like a viewer: when it is too slow, it restarts from a keyframe.
+        self._link: Optional[SpectatorViewer] = None
+        self._process: Optional[multiprocessing.Process] = None
+        self._previous: Optional[Snapshot] = None
+        # Messages encoded since the last write to the fan-out process.
+        self._pending: List[bytes] = []
+        self._next_send_ns = 0
+        self._stats_buffer = bytearray()
+        # Last statistics received from the fan-out process (see `FAN_OUT_STATS`), and their values at the last reset.
+        self._fan_out_stats: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self._fan_out_stats_base: Tuple[int, int, int, int] = (0, 0, 0, 0)
+        self.reset_stats()
+
+    def start(self, port: int):
+        """ Listen for viewers on a TCP port and start the fan-out process. """
+        self._listener = socket.create_server(("0.0.0.0", port))
+        link, process_link = socket.socketpair()
+        link.setblocking(False)
+        self._link = SpectatorViewer(link, ("", 0))
+        stage = self._stage
+        # Spawned rather than forked, the server process runs an event loop.
+        context = multiprocessing.get_context("spawn")
+        self._process = context.Process(target=_run_fan_out, name="spectators", daemon=True, args=(
+            self._listener, process_link, len(stage.get_players()), stage.get_seed(), stage.get_tick(),
+            self._stage_source))
+        self._process.start()
+        process_link.close()
+
+    def stop(self):
+        # The last deltas are sent, then the fan-out process stops when its link is closed.
+        link = self._link
+        self._send_pending()
+        link.socket.settimeout(self.STOP_TIMEOUT)
+        link.flush()
+        link.socket.close()
+        self._process.join(self.STOP_TIMEOUT)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._listener.close()
+
+    def get_viewers_count(self) -> int:
+        self._receive_stats()
+        return self._fan_out_stats[0]
+
+    def publish(self, snapshot: Snapshot):
+
+        """ Encode the delta of the tick, deltas are handed to the fan-out process every `SEND_INTERVAL`. """
+
+        start = perf_counter_ns()
+
+        link = self._link
+        if not self._fan_out_stats[0] or link.closed:
+            # No viewer, the fan-out process will restart from a keyframe.
+            link.waiting_keyframe = True
+        else:
+            baseline = None if link.waiting_keyframe else self._previous
+            out = bytearray(SNAPSHOT.pack(MSG_SNAPSHOT, snapshot.tick, -1 if baseline is None else baseline.tick))
+            encode_delta(out, snapshot, baseline)
+            self._pending.append(_pack_frame(out))
+            link.waiting_keyframe = False
+        self._previous = snapshot
+
+        if start >= self._next_send_ns:
+            self._next_send_ns = start + int(self.SEND_INTERVAL * 1e9)
+            self._receive_stats()
+            self._send_pending()
+
+        duration = perf_counter_ns() - start
+        self._stats_ticks += 1
+        self._stats_publish_ns += duration
+        self._stats_publish_max_ns = max(self._stats_publish_max_ns, duration)
+
+    def _send_pending(self):
+        link = self._link
+        if len(self._pending) and not link.closed:
+            link.flush()
+            if not link.write(b"".join(self._pending), self.LINK_QUEUE_SIZE):
+                # The process does not keep up, like a slow viewer it restarts from a keyframe.
+                link.drop()
+        self._pending.clear()
+
+    def _receive_stats(self):
+        link = self._link
+        if link is None or link.closed:
+            return
+        buffer = self._stats_buffer
+        try:
+            while True:
+                data = link.socket.recv(4096)
+                if not len(data):
+                    link.closed = True
+                    break
+                buffer += data
+        except BlockingIOError:
+            pass
+        except OSError:
+            link.closed = True
+        count = len(buffer) // FAN_OUT_STATS.size
+        if count:
+            self._fan_out_stats = FAN_OUT_STATS.unpack_from(buffer, (count - 1) * FAN_OUT_STATS.size)
+            del buffer[:count * FAN_OUT_STATS.size]
+
+    # Statistics
+
+    def reset_stats(self):
+        self._stats_ticks = 0
+        self._stats_publish_ns = 0
+        self._stats_publish_max_ns = 0
+        self._fan_out_stats_base = self._fan_out_stats
+
+    def get_stats(self) -> dict:
+        """
+        Return statistics since the last reset: publish times by tick (in the
+        tick), fan-out times by tick (in the fan-out process), drops and keyframes.
+        """
+        self._receive_stats()
+        ticks = max(1, self._stats_ticks)
+        viewers, drops, keyframes, fan_out_ns = self._fan_out_stats
+        _, base_drops, base_keyframes, base_fan_out_ns = self._fan_out_stats_base
+        return {
+            "viewers": viewers,
+            "publish_us": round(self._stats_publish_ns / ticks / 1000, 1),
+            "publish_max_us": round(self._stats_publish_max_ns / 1000, 1),
+            "fanout_us": round((fan_out_ns - base_fan_out_ns) / ticks / 1000, 1),
+            "drops": drops - base_drops,
+            "keyframes": keyframes - base_keyframes
+        }
+
+
+class SpectatorFanOut:
+
+    """
+    Fan-out process of a spectator service, it accepts viewers and writes to
+    their sockets. Snapshots received from the service are decoded, so that
+    keyframes are encoded here, only when viewers are waiting for one and at
+    most every `KEYFRAME_INTERVAL` ticks. Messages received since the last
+    fan-out are sent together, with one send by viewer, and fan-outs are at
+    most every `FAN_OUT_INTERVAL`.
+    """
+
+    __slots__ = "_listener", "_link", "_players_count", "_seed", "_stage_source", "_running", \
+                "_buffer", "_messages", "_viewers", "_snapshot", "_tick", "_last_keyframe_tick", "_keyframe_wanted", \
+                "_stats_out", "_stats_sent", "_stats_drops", "_stats_keyframes", "_stats_fanout_ns"
+
+    # Chunks of messages queued for a viewer whose socket buffer is full.
+    QUEUE_SIZE = 30
+    KEYFRAME_INTERVAL = 15
+    # Seconds between fan-outs, viewers don't need every tick as soon as it is simulated.
+    FAN_OUT_INTERVAL = 1 / 30
+    # Send buffer of viewer sockets, small so that slow viewers are detected early.
+    SEND_BUFFER_SIZE = 16384
+    # Viewers can wait but the tick can't, the process gives way to the server when they share a CPU.
+    NICENESS = 10
+
+    def __init__(self, listener: socket.socket, link: socket.socket,
+                 players_count: int, seed: int, tick: int, stage_source: str):
+        self._listener = listener
+        self._listener.setblocking(False)
+        self._link = link
+        self._link.setblocking(False)
+        self._players_count = players_count
+        self._seed = seed
+        self._stage_source = stage_source
+        self._running = True
+        self._buffer = bytearray()
+        # Messages received and not sent yet: (delta or keyframe from the service, keyframe or None).
+        self._messages: List[Tuple[bytes, Optional[bytes]]] = []
+        self._viewers: List[SpectatorViewer] = []
+        self._snapshot: Optional[Snapshot] = None
+        self._tick = tick
+        self._last_keyframe_tick = -self.KEYFRAME_INTERVAL
+        self._keyframe_wanted = False
+        self._stats_out = bytearray()
+        self._stats_sent = b""
+        self._stats_drops = 0
+        self._stats_keyframes = 0
+        self._stats_fanout_ns = 0
+
+    def run(self):
+
+        with selectors.DefaultSelector() as selector:
+
+            selector.register(self._listener, selectors.EVENT_READ)
+            selector.register(self._link, selectors.EVENT_READ)
+            # Viewers waiting for their socket to be writable.
+            waiting_write: List[SpectatorViewer] = []
+            next_fan_out = 0.0
+
+            while self._running:
+
+                timeout = 1.0 if not len(self._messages) else max(0.0, next_fan_out - perf_counter())
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is self._listener:
+                        self._accept()
+                    elif key.fileobj is self._link:
+                        self._receive()
+                    else:
+                        key.data.flush()
+
+                if perf_counter() >= next_fan_out:
+
+                    start = perf_counter_ns()
+                    batch = self._messages
+                    if len(batch):
+                        self._messages = []
+                        self._fan_out(batch)
+                        next_fan_out = perf_counter() + self.FAN_OUT_INTERVAL
+
+                    for viewer in waiting_write:
+                        selector.unregister(viewer.socket)
+                    for viewer in [viewer for viewer in self._viewers if viewer.closed]:
+                        self._viewers.remove(viewer)
+                        viewer.socket.close()
+                    waiting_write = [viewer for viewer in self._viewers if viewer.has_queued()]
+                    for viewer in waiting_write:
+                        selector.register(viewer.socket, selectors.EVENT_WRITE, viewer)
+
+                    self._keyframe_wanted = any(viewer.waiting_keyframe for viewer in self._viewers)
+                    if len(batch):
+                        self._stats_fanout_ns += perf_counter_ns() - start
+
+                self._send_stats()
+
+        # Messages received before the service stopped.
+        if len(self._messages):
+            self._fan_out(self._messages)
+        for viewer in self._viewers:
+            viewer.socket.close()
+        self._listener.close()
+        self._link.close()
+
+    def _accept(self):
+        welcome = _pack_frame(pack_welcome(NO_PLAYER, self._players_count, self._seed, self._tick, self._stage_source))
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except BlockingIOError:
+                return
+            sock.setblocking(False)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER_SIZE)
+            viewer = SpectatorViewer(sock, address)
+            viewer.write(welcome, self.QUEUE_SIZE)
+            self._viewers.append(viewer)
+
+    def _receive(self):
+
+        buffer = self._buffer
+        try:
+            while True:
+                data = self._link.recv(65536)
+                if not len(data):
+                    self._running = False  # The service stopped.
+                    break
+                buffer += data
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._running = False
+
+        offset = 0
+        while len(buffer) - offset >= FRAME.size:
+            (length,) = FRAME.unpack_from(buffer, offset)
+            end = offset + FRAME.size + length
+            if len(buffer) < end:
+                break
+            self._receive_snapshot(bytes(buffer[offset:end]))
+            offset = end
+        del buffer[:offset]
+
+    def _receive_snapshot(self, frame: bytes):
+
+        message = frame[FRAME.size:]
+        tick, baseline_tick = unpack_snapshot_header(message)
+        if baseline_tick < 0:
+            baseline = None
+        elif self._snapshot is not None and self._snapshot.tick == baseline_tick:
+            baseline = self._snapshot
+        else:
+            return  # Never happens, the service restarts from a keyframe when messages are dropped.
+        self._snapshot, _ = decode_delta(message, SNAPSHOT.size, tick, baseline)
+        self._tick = tick
+
+        keyframe = frame if baseline is None else None
+        if keyframe is None and self._keyframe_wanted and tick - self._last_keyframe_tick >= self.KEYFRAME_INTERVAL:
+            out = bytearray(SNAPSHOT.pack(MSG_SNAPSHOT, tick, -1))
+            encode_delta(out, self._snapshot, None)
+            keyframe = _pack_frame(out)
+        if keyframe is not None:
+            self._keyframe_wanted = False
+            self._last_keyframe_tick = tick
+            self._stats_keyframes += 1
+
+        # A keyframe from the service also follows any delta, it is sent to all viewers.
+        self._messages.append((frame, keyframe))
+
+    def _fan_out(self, batch: List[Tuple[bytes, Optional[bytes]]]):
+
+        # Messages of the batch for up-to-date viewers, and from the last keyframe for waiting viewers.
+        deltas = b"".join(delta for delta, _ in batch)
+        keyframe_data = None
+        for i in range(len(batch) - 1, -1, -1):
+            if batch[i][1] is not None:
+                keyframe_data = batch[i][1] + b"".join(delta for delta, _ in batch[i + 1:])
+                break
+
+        for viewer in self._viewers:
+            if viewer.waiting_keyframe:
+                if keyframe_data is not None and viewer.write(keyframe_data, self.QUEUE_SIZE):
+                    viewer.waiting_keyframe = False
+            elif not viewer.write(deltas, self.QUEUE_SIZE):
+                # Queued deltas are useless without the next ones, the viewer restarts from a keyframe.
+                viewer.drop()
+                self._stats_drops += 1
+
+    def _send_stats(self):
+        """ Send the statistics to the service when they changed, without blocking. """
+        out = self._stats_out
+        if not len(out):
+            stats = FAN_OUT_STATS.pack(len(self._viewers), self._stats_drops, self._stats_keyframes,
+                                       self._stats_fanout_ns)
+            if stats == self._stats_sent:
+                return
+            out += stats
+            self._stats_sent = stats
+        try:
+            del out[:self._link.send(out)]
+        except BlockingIOError:
+            pass
+        except OSError:
+            self._running = False
+
+
+def _run_fan_out(listener: socket.socket, link: socket.socket,
+                 players_count: int, seed: int, tick: int, stage_source: str):
+    """ Entry point of the fan-out process of a spectator service. """
+    if hasattr(os, "nice"):
+        os.nice(SpectatorFanOut.NICENESS)
+    try:
+        SpectatorFanOut(listener, link, players_count, seed, tick, stage_source).run()
+    except KeyboardInterrupt:
+        pass  # Interrupted with the server, which stops the process.
+
+
+class SpectatorConnection:
+
+    """
+    Non-blocking connection of a viewer to the spectator service, polled by
+    the game loop. Snapshots are decoded as they are received, only the last
+    one is returned by `poll`.
+    """
+
+    __slots__ = "_socket", "_buffer", "_welcome", "_snapshot", "_closed", "_received_bytes", "_keyframes"
+
+    def __init__(self, address: Address, timeout: float = 5.0, receive_buffer_size: Optional[int] = None):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if receive_buffer_size is not None:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer_size)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._socket.setblocking(False)
+        self._buffer = bytearray()
+        self._welcome: Optional[Tuple[int, int, int, int, str]] = None
+        self._snapshot: Optional[Snapshot] = None
+        self._closed = False
+        self._received_bytes = 0
+        self._keyframes = 0
+
+    def fileno(self) -> int:
+        return self._socket.fileno()
+
+    def close(self):
+        self._closed = True
+        self._socket.close()
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def wait_welcome(self, timeout: float = 5.0) -> Tuple[int, int, int, int, str]:
+        """ Wait for the welcome message, return its players count, seed, tick and stage source. """
+        deadline = perf_counter() + timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._socket, selectors.EVENT_READ)
+            while self._welcome is None:
+                remaining = deadline - perf_counter()
+                if remaining <= 0 or self._closed:
+                    raise TimeoutError("No welcome from the spectator service.")
+                selector.select(remaining)
+                self.poll()
+        return self._welcome[1:]
+
+    def poll(self, max_bytes: Optional[int] = None) -> Optional[Snapshot]:
+
+        """
+        Receive available data (at most `max_bytes` if given) without blocking,
+        return the last new snapshot or None.
+        """
+
+        received = 0
+        while not self._closed and (max_bytes is None or received < max_bytes):
+            try:
+                data = self._socket.recv(65536 if max_bytes is None else min(65536, max_bytes - received))
+            except BlockingIOError:
+                break
+            except ConnectionError:
+                data = b""
+            if not len(data):
+                self.close()
+                break
+            self._buffer += data
+            received += len(data)
+        self._received_bytes += received
+
+        new_snapshot = None
+        buffer = self._buffer
+        offset = 0
+        while len(buffer) - offset >= FRAME.size:
+            (length,) = FRAME.unpack_from(buffer, offset)
+            if length > MAX_MESSAGE:
+                raise ProtocolError("Message too large ({} bytes).".format(length))
+            if len(buffer) - offset - FRAME.size < length:
+                break
+            message = bytes(buffer[offset + FRAME.size:offset + FRAME.size + length])
+            offset += FRAME.size + length
+            if message[0] == MSG_WELCOME:
+                self._welcome = unpack_welcome(message)
+            elif message[0] == MSG_SNAPSHOT:
+                snapshot = self._receive_snapshot(message)
+                if snapshot is not None:
+                    new_snapshot = snapshot
+        del buffer[:offset]
+
+        return new_snapshot
+
+    def _receive_snapshot(self, message: bytes) -> Optional[Snapshot]:
+        tick, baseline_tick = unpack_snapshot_header(message)
+        if baseline_tick < 0:
+            self._keyframes += 1
+            baseline = None
+        elif self._snapshot is not None and self._snapshot.tick == baseline_tick:
+            baseline = self._snapshot
+        else:
+            return None  # Waiting for a keyframe.
+        self._snapshot, _ = decode_delta(message, SNAPSHOT.size, tick, baseline)
+        return self._snapshot
+
+    def get_snapshot(self) -> Optional[Snapshot]:
+        return self._snapshot
+
+    def get_received_bytes(self) -> int:
+        return self._received_bytes
+
+    def get_keyframes_count(self) -> int:
+        return self._keyframes
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Connect many viewers to the spectator service of a match server.")
+    parser.add_argument("--server", default="127.0.0.1:7501", help="address of the spectator service (default: 127.0.0.1:7501)")
+    parser.add_argument("--viewers", type=int, default=200, help="number of viewers (default: 200)")
+    parser.add_argument("--stalled", type=int, default=0, help="number of viewers that stop reading for a while")
+    parser.add_argument("--seconds", type=float, default=10.0, help="duration of the test (default: 10)")
+    args = parser.parse_args()
+
+    address = parse_address(args.server)
+    connections: List[SpectatorConnection] = []
+    for i in range(args.viewers):
+        # Stalled viewers have a small receive buffer, so that the server notices them sooner.
+        connection = SpectatorConnection(address, receive_buffer_size=4096 if i < args.stalled else None)
+        connection.wait_welcome()
+        connections.append(connection)
+    stalled = connections[:args.stalled]
+    print("[VIEWER] {} viewers connected, {} stalled.".format(len(connections), len(stalled)))
+
+    selector = selectors.DefaultSelector()
+    for connection in connections[args.stalled:]:
+        selector.register(connection, selectors.EVENT_READ)
+
+    # Stalled viewers stop reading during the first half of the test, then catch up.
+    start = perf_counter()
+    end_time = start + args.seconds
+    resume_time = start + args.seconds / 2
+    while perf_counter() < end_time:
+        if len(stalled) and perf_counter() >= resume_time:
+            for connection in stalled:
+                selector.register(connection, selectors.EVENT_READ)
+            stalled = []
+        for key, _ in selector.select(0.05):
+            connection = key.fileobj
+            connection.poll()
+            if connection.is_closed():
+                selector.unregister(connection)
+
+    ticks = [0 if connection.get_snapshot() is None else connection.get_snapshot().tick for connection in connections]
+    stalled_keyframes = [connection.get_keyframes_count() for connection in connections[:args.stalled]]
+    print("[VIEWER] Last ticks from {} to {}, {:.1f} KB/s per viewer, {} keyframes per stalled viewer".format(
+        min(ticks), max(ticks), sum(connection.get_received_bytes() for connection in connections)
+        / len(connections) / args.seconds / 1000, "-" if not len(stalled_keyframes) else
+        "{}-{}".format(min(stalled_keyframes), max(stalled_keyframes))))
+    for connection in connections:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+from typing import Iterator, List, Optional, Tuple
+import random
+import socket
+import heapq
+import time
+
+
+Address = Tuple[str, int]
+
+
+def parse_address(address: str) -> Address:
+    """ Parse an address `host:port`. """
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class UdpTransport:
+
+    """
+    Non-blocking UDP socket. For tests, outgoing datagrams can be randomly
+    dropped and delayed to simulate a bad network, with a generator of its own.
+    """
+
+    __slots__ = "_socket", "_loss", "_delay", "_random", "_pending", "_sent", "_dropped"
+
+    # Maximum size of a received datagram.
+    MAX_DATAGRAM = 2048
+
+    def __init__(self, bind: Address, *, loss: float = 0.0, delay: float = 0.0, seed: Optional[int] = None):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind(bind)
+        self._socket.setblocking(False)
+        self._loss = loss
+        self._delay = delay
+        self._random = random.Random(seed)
+        # Delayed datagrams: (send time, sequence, data, address)
+        self._pending: List[Tuple[float, int, bytes, Address]] = []
+        self._sent = 0
+        self._dropped = 0
+
+    def get_address(self) -> Address:
+        return self._socket.getsockname()
+
+    def send(self, data: bytes, address: Address):
+        self._sent += 1
+        if self._loss > 0 and self._random.random() < self._loss:
+            self._dropped += 1
+        elif self._delay > 0:
+            heapq.heappush(self._pending, (time.perf_counter() + self._delay, self._sent, data, address))
+        else:
+            self._send_now(data, address)
+
+    def _send_now(self, data: bytes, address: Address):
+        try:
+            self._socket.sendto(data, address)
+        except OSError:  # Peer not listening yet (ICMP port unreachable) or buffer full, like a lost datagram.
+            self._dropped += 1
+
+    def flush(self):
+        """ Send the delayed datagrams whose delay has elapsed. """
+        pending = self._pending
+        now = time.perf_counter()
+        while len(pending) and pending[0][0] <= now:
+            _, _, data, address = heapq.heappop(pending)
+            self._send_now(data, address)
+
+    def receive(self) -> Iterator[Tuple[bytes, Address]]:
+        """ Iterate over received datagrams without blocking, after sending delayed ones. """
+        self.flush()
+        while True:
+            try:
+                yield self._socket.recvfrom(self.MAX_DATAGRAM)
+            except (BlockingIOError, ConnectionResetError):
+                return
+
+    def get_sent_count(self) -> int:
+        return self._sent
+
+    def get_dropped_count(self) -> int:
+        return self._dropped
+
+    def close(self):
+        self._socket.close()
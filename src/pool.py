@@ -0,0 +1,56 @@
+from typing import Dict, Generic, List, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class Pool(Generic[T]):
+
+    """
+    Free list of reusable objects. The owner takes an object from the pool
+    before constructing a new one, and gives it back once it is no longer
+    referenced. Objects are not reset by the pool, this is the owner's job.
+    """
+
+    __slots__ = "_free", "_capacity", "_reused", "_created", "_released", "_discarded"
+
+    def __init__(self, capacity: int = 256):
+        self._free: List[T] = []
+        self._capacity = capacity
+        self._reused = 0
+        self._created = 0
+        self._released = 0
+        self._discarded = 0
+
+    def take(self) -> Optional[T]:
+        """ Return a free object, or None if the pool is empty and a new object must be created. """
+        if len(self._free):
+            self._reused += 1
+            return self._free.pop()
+        self._created += 1
+        return None
+
+    def give(self, obj: T) -> bool:
+        """ Give back an object to the pool, return False if the pool is full and the object is discarded. """
+        if len(self._free) >= self._capacity:
+            self._discarded += 1
+            return False
+        self._released += 1
+        self._free.append(obj)
+        return True
+
+    def clear(self):
+        self._free.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "free": len(self._free),
+            "capacity": self._capacity,
+            "reused": self._reused,
+            "created": self._created,
+            "released": self._released,
+            "discarded": self._discarded
+        }
+
+    def __len__(self) -> int:
+        return len(self._free)
@@ -0,0 +1,295 @@
+"""
+Replay file format, holding everything needed to simulate a match again: the
+stage source and seed, the roster and the commands of the players at each
+tick. All values are little-endian:
+
+- header: magic `RRPL`, version (u16), players count (u16), seed (u64),
+  ticks count (u32), stage source length (u16) then the stage source (utf-8),
+  a stage factory name of `stage_file.FACTORIES` or a stage file resource path;
+- roster: player index and color value (u8) for each player, in adding order;
+- commands: for each tick where commands of some players changed, the ticks
+  elapsed since the previous change (varint), the number of changes (varint),
+  then the player index and its new commands (varints) for each change.
+
+Commands are held for many ticks, so only their changes are stored.
+Usage: `python replay.py play match.replay` or `python replay.py info match.replay`
+"""
+
+from typing import Dict, List, Tuple
+import argparse
+import struct
+import time
+
+from stage import Stage
+from stage_file import new_stage_from_source
+from entity.player import PlayerColor
+
+
+MAGIC = b"RRPL"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHQIH")
+ROSTER_ENTRY = struct.Struct("<BB")
+
+
+class ReplayError(ValueError):
+    pass
+
+
+def write_varint(out: bytearray, value: int):
+    """ Append an unsigned integer in LEB128 (7 bits per byte, least significant first). """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset: int) -> Tuple[int, int]:
+    """ Read an unsigned LEB128 integer, return it with the offset of the next value. """
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ReplayError("Truncated varint at offset {}.".format(offset))
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class Replay:
+
+    """ A recorded match, see the module documentation for the format. """
+
+    __slots__ = "stage_source", "seed", "roster", "ticks", "commands"
+
+    def __init__(self, stage_source: str, seed: int, roster: List[Tuple[int, PlayerColor]], ticks: int, commands: bytes):
+        self.stage_source = stage_source
+        self.seed = seed
+        self.roster = roster
+        self.ticks = ticks
+        self.commands = commands
+
+    def new_stage(self) -> Stage:
+        """ Create the stage of the replay, with its seed and roster, ready for the first tick. """
+        stage = new_stage_from_source(self.stage_source, self.seed)
+        for player_idx, color in self.roster:
+            stage.add_player(player_idx, color)
+        return stage
+
+
+def save_replay(replay: Replay, path: str):
+    source = replay.stage_source.encode("utf-8")
+    with open(path, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, len(replay.roster), replay.seed, replay.ticks, len(source)))
+        fp.write(source)
+        for player_idx, color in replay.roster:
+            fp.write(ROSTER_ENTRY.pack(player_idx, color.value))
+        fp.write(replay.commands)
+
+
+def load_replay(path: str) -> Replay:
+
+    with open(path, "rb") as fp:
+        data = fp.read()
+
+    if len(data) < HEADER.size:
+        raise ReplayError("Truncated replay header.")
+
+    magic, version, players_count, seed, ticks, source_length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ReplayError("Not a replay file.")
+    if version != VERSION:
+        raise ReplayError("Unsupported replay version {}.".format(version))
+
+    offset = HEADER.size
+    if len(data) < offset + source_length + players_count * ROSTER_ENTRY.size:
+        raise ReplayError("Truncated replay roster.")
+    stage_source = data[offset:offset + source_length].decode("utf-8")
+    offset += source_length
+
+    roster: List[Tuple[int, PlayerColor]] = []
+    for _ in range(players_count):
+        player_idx, color_value = ROSTER_ENTRY.unpack_from(data, offset)
+        try:
+            roster.append((player_idx, PlayerColor(color_value)))
+        except ValueError:
+            raise ReplayError("Invalid player color {}.".format(color_value))
+        offset += ROSTER_ENTRY.size
+
+    return Replay(stage_source, seed, roster, ticks, data[offset:])
+
+
+class ReplayRecorder:
+
+    """
+    Record a stage from its first tick, through its input callback. The stage
+    must be created from the given source and have all its players added.
+    """
+
+    __slots__ = "_stage", "_stage_source", "_seed", "_roster", "_commands", "_last", "_last_tick", "_ticks"
+
+    def __init__(self, stage: Stage, stage_source: str):
+
+        if stage.get_tick() != 0:
+            raise ValueError("A stage can only be recorded from its first tick.")
+        if not 0 <= stage.get_seed() < (1 << 64):
+            raise ValueError("The stage seed must fit in an unsigned 64 bits integer.")
+
+        self._stage = stage
+        self._stage_source = stage_source
+        self._seed = stage.get_seed()
+        self._roster = [(player_idx, player.get_color()) for player_idx, player in stage.get_players().items()]
+        self._commands = bytearray()
+        # Last commands recorded for each player index, and tick of the last change.
+        self._last: Dict[int, int] = {}
+        self._last_tick = 0
+        self._ticks = 0
+
+        stage.set_input_callback(self._on_input)
+
+    def _on_input(self, tick: int, inputs: Dict[int, int]):
+
+        changes = [(player_idx, commands) for player_idx, commands in sorted(inputs.items())
+                   if self._last.get(player_idx, 0) != commands]
+        changes.extend((player_idx, 0) for player_idx, commands in sorted(self._last.items())
+                       if commands != 0 and player_idx not in inputs)
+
+        if len(changes):
+            out = self._commands
+            write_varint(out, tick - self._last_tick)
+            write_varint(out, len(changes))
+            for player_idx, commands in changes:
+                write_varint(out, player_idx)
+                write_varint(out, commands)
+                self._last[player_idx] = commands
+            self._last_tick = tick
+
+        self._ticks = tick + 1
+
+    def stop(self) -> Replay:
+        """ Stop recording, the stage can continue without being recorded. """
+        self._stage.set_input_callback(None)
+        return self.get_replay()
+
+    def get_replay(self) -> Replay:
+        return Replay(self._stage_source, self._seed, list(self._roster), self._ticks, bytes(self._commands))
+
+
+class ReplayPlayer:
+
+    """
+    Play a replay by setting the recorded commands on its stage before each
+    tick, the stage itself is updated by the owner (or by `step`).
+    """
+
+    __slots__ = "_replay", "_stage", "_offset", "_next_tick", "_current", "_tick"
+
+    def __init__(self, replay: Replay):
+        self._replay = replay
+        self._stage = replay.new_stage()
+        self._offset = 0
+        self._next_tick = -1
+        # Commands currently held by each player index.
+        self._current: Dict[int, int] = {}
+        self._tick = 0
+        self._read_next_tick(0)
+
+    def get_replay(self) -> Replay:
+        return self._replay
+
+    def get_stage(self) -> Stage:
+        return self._stage
+
+    def get_tick(self) -> int:
+        return self._tick
+
+    def is_done(self) -> bool:
+        return self._tick >= self._replay.ticks
+
+    def _read_next_tick(self, from_tick: int):
+        commands = self._replay.commands
+        if self._offset < len(commands):
+            delta, self._offset = read_varint(commands, self._offset)
+            self._next_tick = from_tick + delta
+        else:
+            self._next_tick = -1
+
+    def apply_inputs(self) -> bool:
+
+        """
+        Set the commands of the next tick on the stage, return False once all
+        recorded ticks have been played.
+        """
+
+        if self.is_done():
+            return False
+
+        if self._tick == self._next_tick:
+            commands = self._replay.commands
+            count, self._offset = read_varint(commands, self._offset)
+            for _ in range(count):
+                player_idx, self._offset = read_varint(commands, self._offset)
+                self._current[player_idx], self._offset = read_varint(commands, self._offset)
+            self._read_next_tick(self._tick)
+
+        for player_idx, commands in self._current.items():
+            if commands:
+                self._stage.set_input(player_idx, commands)
+
+        self._tick += 1
+        return True
+
+    def step(self) -> bool:
+        """ Apply the commands of the next tick and update the stage, return False once done. """
+        if self.apply_inputs():
+            self._stage.update()
+            return True
+        return False
+
+    def run(self) -> float:
+        """ Play all the remaining ticks as fast as possible, return the duration in seconds. """
+        start = time.perf_counter()
+        while self.step():
+            pass
+        return time.perf_counter() - start
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Play and inspect replay files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    play_parser = commands.add_parser("play", help="play a replay without display, as fast as possible")
+    play_parser.add_argument("path")
+    info_parser = commands.add_parser("info", help="print the header of replay files")
+    info_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "play":
+        player = ReplayPlayer(load_replay(args.path))
+        duration = player.run()
+        stage = player.get_stage()
+        print("[REPLAY] Played {} ticks in {:.3f}s: {:.0f} ticks/s".format(
+            player.get_tick(), duration, player.get_tick() / duration if duration > 0 else 0.0))
+        winner = stage.get_winner()
+        print("[REPLAY] Finished: {}, winner: {}".format(
+            stage.is_finished(), "-" if winner is None else "P{}".format(winner.get_player_index() + 1)))
+    else:
+        failed: List[str] = []
+        for path in args.paths:
+            try:
+                replay = load_replay(path)
+                print("{}: stage '{}', seed {}, {} players, {} ticks ({:.1f}s), {} bytes of commands".format(
+                    path, replay.stage_source, replay.seed, len(replay.roster), replay.ticks,
+                    replay.ticks / Stage.TICK_RATE, len(replay.commands)))
+            except (OSError, ReplayError) as e:
+                print("{}: {}".format(path, e))
+                failed.append(path)
+        if len(failed):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,47 @@
-from typing import List, Union, Tuple, Generator, Dict, TypeVar, Callable, Any, Optional
+from typing import List, Union, Tuple, Generator, Dict, TypeVar, Callable, Any, Optional, Type, Collection, Set, cast
+from bisect import bisect_left
+import heapq
 import random
-import time
+import struct
+import math
+import re
 
-from entity.player import Player, PlayerColor, IncarnationType
+from entity.player import Player, PlayerColor, IncarnationType, HitRequest
 from entity.effect import Effect, EffectType
+from entity.motion import MotionEngine
+from entity.static import StaticWorld
+from entity.grid import SpatialGrid
+from entity.bullet import Bullet
 from entity.hitbox import Hitbox
 from entity.floor import Floor
 from entity.item import Item
-from entity import Entity
+from entity import Entity, MotionEntity
+from pool import Pool
 
 
 E = TypeVar("E", bound=Entity)
 AddEntityCallback = Optional[Callable[[Entity], None]]
-RemoveEntityCallback = Optional[Callable[[int], None]]
+RemoveEntityCallback = Optional[Callable[[List[int]], None]]
+# Called with the tick and the commands of each player index, before they are applied.
+InputCallback = Optional[Callable[[int, Dict[int, int]], None]]
+# A bytearray, or a writable memoryview of bytes (memory-mapped terrain).
+TerrainBuffer = Union[bytearray, memoryview]
+
+# Tiles that are neither air nor unset.
+_NON_AIR_TILE = re.compile(rb"[^\x00 ]")
+# Runs of solid tiles, in terrain translated with `Tile.SOLID_TRANSLATION`.
+_SOLID_RUN = re.compile(rb"#+")
+
+# Layouts of the state buffer of `StageState`, see `Stage.save_state`.
+# tick, next uid, running, finished, winner uid (0 if none), living players count, next item spawn,
+# counts of players, spawn points, suspended entities and entities records.
+_STATE_HEADER = struct.Struct("<QQ??QHdHHII")
+# player index, spawn point index, uid, in the stage
+_STATE_PLAYER = struct.Struct("<HHQ?")
+# uid, resume tick (-1 if never)
+_STATE_SUSPENDED = struct.Struct("<Qq")
+# The uid is the first field of every entity state.
+_STATE_UID = struct.Struct("<Q")
 
 
 class Tile:
@@ -174,22 +203,269 @@ class Tile:
 
     VALID_TILES = {chr(i) for i in VALID_TILES_IDS}
 
+    # Tiles with collision, everything drawn except decorations.
+    SOLID_TILES_IDS = VALID_TILES_IDS - {TILE_WHEAT}
+
+    # Translation of solid tile ids to `#`, other tiles are kept (`#` is itself solid).
+    SOLID_TRANSLATION = bytes.maketrans(bytes(sorted(SOLID_TILES_IDS)), b"#" * len(SOLID_TILES_IDS))
+
+
+class StageState:
+
+    """
+    State of a stage returned by `Stage.save_state`: the packed entities and
+    stage values, the random generator state and the shared terrain copy.
+    """
+
+    __slots__ = "data", "random_state", "seed", "terrain_version", "terrain"
+
+    def __init__(self, data: bytes, random_state: tuple, seed: int, terrain_version: int, terrain: bytes):
+        self.data = data
+        self.random_state = random_state
+        self.seed = seed
+        self.terrain_version = terrain_version
+        self.terrain = terrain
+
+    def get_tick(self) -> int:
+        return _STATE_HEADER.unpack_from(self.data)[0]
+
+
+def _partition_rectangles(solid: bytes, width: int, height: int) -> List[Tuple[int, int, int, int]]:
+
+    """
+    Partition the cells marked `#` of a grid (row by row from the bottom) in
+    the minimum number of rectangles (min x, min y, max x, max y), the max
+    bounds being excluded. The grid is cut along a maximum set of chords
+    joining two concave corners that do not cross, found from a maximum
+    matching in the bipartite graph of crossing horizontal and vertical
+    chords (König's theorem), then along a horizontal cut from each concave
+    corner left. Each cut from a corner adds one rectangle, the chords
+    resolve two corners with a single cut.
+    """
+
+    solid_id = ord("#")
+
+    def is_solid(x: int, y: int) -> bool:
+        return 0 <= x < width and 0 <= y < height and solid[y * width + x] == solid_id
+
+    # Concave corners (grid points with 3 solid cells around) with the directions of their chords: the
+    # horizontal chord goes away from the missing cell column, the vertical one from its row.
+    corners: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    for y in range(height):
+        for match in _SOLID_RUN.finditer(solid, y * width, (y + 1) * width):
+            for x in range(match.start() - y * width, match.end() - y * width):
+                for px, py in ((x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)):
+                    if (px, py) not in corners:
+                        around = (is_solid(px - 1, py - 1), is_solid(px, py - 1), is_solid(px - 1, py), is_solid(px, py))
+                        if sum(around) == 3:
+                            missing = around.index(False)
+                            corners[(px, py)] = (1 if missing in (0, 2) else -1, 1 if missing in (0, 1) else -1)
+                        else:
+                            corners[(px, py)] = (0, 0)
+    corners = {point: dirs for point, dirs in corners.items() if dirs != (0, 0)}
+
+    # Cut edges: horizontal ones by the cell above them, vertical ones by the cell at their right.
+    h_cuts: Set[Tuple[int, int]] = set()
+    v_cuts: Set[Tuple[int, int]] = set()
+
+    def cut_horizontal(px: int, py: int, dx: int, stop_on_cuts: bool) -> int:
+        """ Cut from a point toward dx until the boundary (or a cut if requested), return the end x. """
+        while is_solid(px if dx > 0 else px - 1, py - 1) and is_solid(px if dx > 0 else px - 1, py):
+            edge = (px if dx > 0 else px - 1, py)
+            if stop_on_cuts and edge in h_cuts:
+                break
+            h_cuts.add(edge)
+            px += dx
+            if stop_on_cuts and ((px, py) in v_cuts or (px, py - 1) in v_cuts):
+                break
+        return px
+
+    def cut_vertical(px: int, py: int, dy: int):
+        while is_solid(px - 1, py if dy > 0 else py - 1) and is_solid(px, py if dy > 0 else py - 1):
+            v_cuts.add((px, py if dy > 0 else py - 1))
+            py += dy
+
+    def chord_end(px: int, py: int, dx: int, dy: int) -> Tuple[int, int]:
+        """ Return the point where a chord from a point toward (dx, dy) meets the boundary. """
+        if dx:
+            while is_solid(px if dx > 0 else px - 1, py - 1) and is_solid(px if dx > 0 else px - 1, py):
+                px += dx
+        else:
+            while is_solid(px - 1, py if dy > 0 else py - 1) and is_solid(px, py if dy > 0 else py - 1):
+                py += dy
+        return px, py
+
+    # Chords joining two concave corners: horizontal ones (y, min x, max x), vertical ones (x, min y, max y).
+    h_chords = set()
+    v_chords = set()
+    for (px, py), (dx, dy) in corners.items():
+        qx, qy = chord_end(px, py, dx, 0)
+        if (qx, qy) in corners:
+            h_chords.add((py, min(px, qx), max(px, qx)))
+        qx, qy = chord_end(px, py, 0, dy)
+        if (qx, qy) in corners:
+            v_chords.add((px, min(py, qy), max(py, qy)))
+    h_chords = sorted(h_chords)
+    v_chords = sorted(v_chords)
+
+    # Crossing chords, sharing a corner counts as crossing.
+    v_chords_by_x: Dict[int, List[int]] = {}
+    for i, (x, _, _) in enumerate(v_chords):
+        v_chords_by_x.setdefault(x, []).append(i)
+    crossings: List[List[int]] = []
+    for y, min_x, max_x in h_chords:
+        crossings.append([i for x in range(min_x, max_x + 1) for i in v_chords_by_x.get(x, ())
+                          if v_chords[i][1] <= y <= v_chords[i][2]])
+
+    # Maximum matching with augmenting paths.
+    h_match = [-1] * len(h_chords)
+    v_match = [-1] * len(v_chords)
+    for start in range(len(h_chords)):
+        # Iterative search of an augmenting path, with the parent horizontal chord of each visited vertical chord.
+        parents: Dict[int, int] = {}
+        stack = [start]
+        found = -1
+        while len(stack) and found < 0:
+            h = stack.pop()
+            for v in crossings[h]:
+                if v not in parents:
+                    parents[v] = h
+                    if v_match[v] < 0:
+                        found = v
+                        break
+                    stack.append(v_match[v])
+        while found >= 0:
+            h = parents[found]
+            next_found = h_match[h]
+            h_match[h], v_match[found] = found, h
+            found = next_found
+
+    # Maximum set of non crossing chords (König): horizontal chords reachable from unmatched ones by
+    # alternating paths, and vertical chords not reachable.
+    h_reached = [h_match[h] < 0 for h in range(len(h_chords))]
+    v_reached = [False] * len(v_chords)
+    stack = [h for h in range(len(h_chords)) if h_reached[h]]
+    while len(stack):
+        h = stack.pop()
+        for v in crossings[h]:
+            if not v_reached[v]:
+                v_reached[v] = True
+                matched = v_match[v]
+                if matched >= 0 and not h_reached[matched]:
+                    h_reached[matched] = True
+                    stack.append(matched)
+
+    for h, (y, min_x, _) in enumerate(h_chords):
+        if h_reached[h]:
+            cut_horizontal(min_x, y, 1, False)
+    for v, (x, min_y, _) in enumerate(v_chords):
+        if not v_reached[v]:
+            cut_vertical(x, min_y, 1)
+
+    # Corners left, not touched by a cut in the directions of their chords.
+    for (px, py), (dx, dy) in sorted(corners.items(), key=lambda corner: (corner[0][1], corner[0][0])):
+        if (px if dx > 0 else px - 1, py) not in h_cuts and (px, py if dy > 0 else py - 1) not in v_cuts:
+            cut_horizontal(px, py, dx, True)
+
+    # Each cell of the first row and column of a rectangle not yet found is its min corner.
+    rectangles = []
+    found_cells = bytearray(width * height)
+    for y in range(height):
+        for match in _SOLID_RUN.finditer(solid, y * width, (y + 1) * width):
+            for x in range(match.start() - y * width, match.end() - y * width):
+                if found_cells[y * width + x]:
+                    continue
+                max_x = x + 1
+                while is_solid(max_x, y) and (max_x, y) not in v_cuts:
+                    max_x += 1
+                max_y = y + 1
+                while is_solid(x, max_y) and (x, max_y) not in h_cuts:
+                    max_y += 1
+                for cell_y in range(y, max_y):
+                    found_cells[cell_y * width + x:cell_y * width + max_x] = b"\x01" * (max_x - x)
+                rectangles.append((x, y, max_x, max_y))
+
+    return rectangles
+
 
 class Stage:
 
-    __slots__ = "_entities", "_size", "_terrain", \
-                "_running", "_finished", "_winner", \
+    __slots__ = "_entities", "_kinds", "_grids", "_motion_engine", "_pools", \
+                "_active", "_active_uids", "_active_set", "_active_cursor", "_active_dirty", \
+                "_suspended", "_timers", "_hit_requests", "_inputs", \
+                "_size", "_terrain", "_terrain_version", "_terrain_edits", "_terrain_copy", "_kill_bounds", \
+                "_tick_rate", "_random", "_seed", "_next_uid", "_tick", "_running", "_finished", "_winner", \
                 "_spawn_points", "_players", "_living_players_count", \
-                "_items_count", "_next_item_spawn", \
-                "_add_entity_cb", "_remove_entity_cb"
+                "_next_item_spawn", "_exposed_floors", "_exposed_floors_version", \
+                "_add_entity_cb", "_remove_entity_cb", "_input_cb"
+
+    # Entities are stored in a bucket for each of these kinds, in addition to
+    # the main list. Entities that are not of one of these kinds are stored in
+    # the generic `Entity` bucket.
+    ENTITY_KINDS: Tuple[Type[Entity], ...] = (Floor, Player, Item, Bullet, Effect)
+    HARD_KINDS: Tuple[Type[Entity], ...] = tuple(kind for kind in ENTITY_KINDS if kind.has_hard_hitbox())
+    ITEM_KIND: Type[Entity] = Item
+    # Kinds of entities that never move, stored in a static collision world instead of a dynamic grid.
+    STATIC_KINDS: Tuple[Type[Entity], ...] = (Floor,)
+
+    _KINDS_CACHE: Dict[Type[Entity], Type[Entity]] = {}
+    # Code of each entity kind in saved states, only entities of exactly these kinds can be saved.
+    _STATE_CODES: Dict[Type[Entity], int] = dict(zip(ENTITY_KINDS, range(len(ENTITY_KINDS))))
+
+    # Default number of ticks in a second of simulation time.
+    TICK_RATE = 60
+
+    def __init__(self, width: int, height: int, seed: Optional[int] = None, tick_rate: int = TICK_RATE):
 
-    def __init__(self, width: int, height: int):
+        # UIDs are given by the stage so that they are the same each time the stage is simulated.
+        self._next_uid = 1
 
         self._entities: List[Entity] = []
+        # Buckets are dict (uid -> entity) to keep insertion order with O(1) removal.
+        self._kinds: Dict[Type[Entity], Dict[int, Entity]] = {kind: {} for kind in (*self.ENTITY_KINDS, Entity)}
+        self._grids: Dict[Type[Entity], Union[SpatialGrid, StaticWorld]] = {
+            kind: StaticWorld() if kind in self.STATIC_KINDS else SpatialGrid() for kind in self._kinds
+        }
+        self._motion_engine: Optional[MotionEngine] = None
+        # Dead entities of pooled kinds are recycled by `add_entity`.
+        self._pools: Dict[Type[Entity], Pool[Entity]] = {kind: Pool() for kind in self.ENTITY_KINDS if kind.POOLED}
+
+        # Scheduler: only active entities are updated each tick, they are kept
+        # sorted by UID (the insertion order). Suspended entities are mapped to
+        # the tick they must be resumed at (-1 if never), through a heap of timers.
+        # Suspended and removed entities leave the active list at the end of the tick.
+        self._active: List[Entity] = []
+        self._active_uids: List[int] = []
+        self._active_set: Set[int] = set()
+        self._active_cursor: int = -1
+        self._active_dirty: bool = False
+        self._suspended: Dict[int, int] = {}
+        self._timers: List[Tuple[int, int, Entity]] = []
+
+        # Attacks registered during the tick, resolved together after all updates.
+        self._hit_requests: List[HitRequest] = []
+
+        # Commands (`PlayerInput` flags) of each player index for the next tick.
+        self._inputs: Dict[int, int] = {}
 
         self._size = (width, height)
-        self._terrain = bytearray(width * height)
-
+        self._terrain: TerrainBuffer = bytearray(width * height)
+        # Each modification of the terrain gives it a new version, the copy
+        # of the terrain is only made again by `save_state` if it changed.
+        self._terrain_version = 0
+        self._terrain_edits = 0
+        self._terrain_copy: Optional[Tuple[int, bytes]] = None
+        # Players out of these bounds are killed: (min x, min y, max x).
+        self._kill_bounds: Tuple[float, float, float] = (1.0, -10.0, width - 1.0)
+
+        # Ticks in a second of simulation time, the stage must be stepped at this rate to run in real time.
+        self._tick_rate = tick_rate
+
+        # All gameplay randomness must come from this generator, see `get_random`.
+        self._seed = random.getrandbits(64) if seed is None else seed
+        self._random = random.Random(self._seed)
+
+        self._tick: int = 0
         self._running = True
         self._finished = False
         self._winner: Optional[Player] = None
@@ -198,57 +474,180 @@ class Stage:
         self._players: Dict[int, Tuple[Player, int]] = {}
         self._living_players_count: int = 0
 
-        self._items_count: int = 0
         self._next_item_spawn: float = 0
+        # Floors where items spawn, rebuilt when the version of the floors static world changes.
+        self._exposed_floors: List[Floor] = []
+        self._exposed_floors_version = -1
 
         self._add_entity_cb: AddEntityCallback = None
         self._remove_entity_cb: RemoveEntityCallback = None
+        self._input_cb: InputCallback = None
 
     def update(self):
 
         if self._running:
 
-            i = 0
-            while i < len(self._entities):
-
-                entity = self._entities[i]
-
-                if entity.is_dead():
-
-                    euid = self._entities.pop(i).get_uid()
-
-                    if isinstance(entity, Player):
+            self._apply_inputs()
 
-                        player_data = self._players.get(entity.get_player_index())
-                        if player_data is not None:
-                            self._spawn_points[player_data[1]][2] = False
-                            self._living_players_count -= 1
-                            if self._living_players_count == 1:
-                                # S'il ne reste qu'un joueur après en avoir tué un, l'autre gagne.
-                                self._finished = True
-                                for player, _ in self._players.values():
-                                    if not player.is_dead():
-                                        self._winner = player
+            if self._motion_engine is not None:
+                self._motion_engine.integrate()
 
-                    elif isinstance(entity, Item):
-                        self._items_count -= 1
+            # Resume suspended entities whose deadline has arrived.
+            timers = self._timers
+            while len(timers) and timers[0][0] <= self._tick:
+                deadline, uid, entity = heapq.heappop(timers)
+                if self._suspended.get(uid) == deadline:
+                    self.resume_entity(entity)
 
-                    if self._remove_entity_cb is not None:
-                        self._remove_entity_cb(euid)
+            # Dead entities are only tombstoned while iterating, they are
+            # removed from the entities list in a single pass at the end.
+            removed_entities: List[Entity] = []
 
-                else:
-                    
+            # Entities added or resumed during the update are also updated in
+            # this tick if they come after the current one.
+            active = self._active
+            self._active_cursor = 0
+            while self._active_cursor < len(active):
+                entity = active[self._active_cursor]
+                if entity.is_dead():
+                    removed_entities.append(entity)
+                    self._remove_entity_data(entity)
+                elif entity.get_uid() not in self._suspended:
                     entity.update()
-                    i += 1
+                self._active_cursor += 1
+            self._active_cursor = -1
+
+            self._resolve_hit_requests()
+            self._remove_entities(removed_entities)
 
-            if self._next_item_spawn == 0 or time.monotonic() >= self._next_item_spawn:
+            if self._next_item_spawn == 0 or self.get_time() >= self._next_item_spawn:
                 self._try_spawn_random_item()
 
+            self._tick += 1
+
+    def _remove_entities(self, removed_entities: List[Entity]):
+
+        """ Remove entities whose data was already removed from the entities list, then rebuild the active list. """
+
+        removed_uids = [entity.get_uid() for entity in removed_entities]
+        removed = set(removed_uids)
+        if len(removed):
+            self._entities[:] = [entity for entity in self._entities if entity.get_uid() not in removed]
+            if self._remove_entity_cb is not None:
+                self._remove_entity_cb(removed_uids)
+            # Only given back once the callback released its references.
+            for entity in removed_entities:
+                pool = self._pools.get(type(entity))
+                if pool is not None:
+                    pool.give(entity)
+
+        if self._active_dirty:
+            self._active_dirty = False
+            active = self._active
+            suspended = self._suspended
+            active[:] = [entity for entity in active if entity.get_uid() not in removed and entity.get_uid() not in suspended]
+            self._active_uids[:] = [entity.get_uid() for entity in active]
+            self._active_set = set(self._active_uids)
+
+    def remove_dead_entities(self):
+        """ Remove dead entities without updating the stage, for stages that are not simulated (like mirrors). """
+        removed_entities = [entity for entity in self._entities if entity.is_dead()]
+        for entity in removed_entities:
+            self._remove_entity_data(entity)
+        self._remove_entities(removed_entities)
+
+    def set_input(self, player_idx: int, commands: int):
+        """ Set the commands (`PlayerInput` flags) of a player for the next tick, replacing previous ones. """
+        self._inputs[player_idx] = commands
+
+    def get_input(self, player_idx: int) -> int:
+        """ Return the commands of a player for the next tick. """
+        return self._inputs.get(player_idx, 0)
+
+    def _apply_inputs(self):
+        """ Apply the commands of living players by player index, they are only valid for one tick. """
+        inputs = self._inputs
+        if self._input_cb is not None:
+            self._input_cb(self._tick, inputs)
+        for player_idx in sorted(inputs):
+            commands = inputs[player_idx]
+            player_data = self._players.get(player_idx)
+            if commands and player_data is not None and not player_data[0].is_dead():
+                player_data[0].apply_input(commands)
+        inputs.clear()
+
+    def add_hit_request(self, request: HitRequest):
+        self._hit_requests.append(request)
+
+    def _resolve_hit_requests(self):
+
+        """
+        Resolve all attacks of the tick in registration order, targets of each
+        attack in UID order. Players are queried once, with the union of all boxes.
+        Attacks of players dead at resolution (out of the stage during the tick,
+        or killed by an earlier attack) are dropped: there are no same-tick trades.
+        """
+
+        requests = self._hit_requests
+        if not len(requests):
+            return
+
+        union = requests[0].box.copy()
+        for request in requests[1:]:
+            union.union(request.box)
+
+        candidates = cast(List[Player], list(self.foreach_colliding_entity(union, kinds=(Player,))))
+        for request in requests:
+            if request.attacker.is_dead():
+                continue
+            box = request.box
+            request.attacker.apply_hit_request(request, (target for target in candidates if target.get_hitbox().intersects(box)))
+
+        requests.clear()
+
+    def _remove_entity_data(self, entity: Entity):
+
+        """ Remove the entity from its bucket and broadphase, and update players bookkeeping. """
+
+        kind = self.get_entity_kind(type(entity))
+        del self._kinds[kind][entity.get_uid()]
+        self._grids[kind].remove(entity)
+
+        self._suspended.pop(entity.get_uid(), None)
+        self._active_dirty = True
+
+        if self._motion_engine is not None and isinstance(entity, MotionEntity):
+            self._motion_engine.unregister(entity)
+
+        if kind is Player:
+            player_data = self._players.get(entity.get_player_index())
+            if player_data is not None:
+                self._spawn_points[player_data[1]][2] = False
+                self._living_players_count -= 1
+                if self._living_players_count == 1:
+                    # S'il ne reste qu'un joueur après en avoir tué un, l'autre gagne.
+                    self._finished = True
+                    for player, _ in self._players.values():
+                        if not player.is_dead():
+                            self._winner = player
+
     def add_entity(self, constructor: Callable[['Stage', Any], E], *args, **kwargs) -> E:
-        entity = constructor(self, *args, **kwargs)
+        pool = self._pools.get(constructor)
+        entity = None if pool is None else pool.take()
+        if entity is None:
+            entity = constructor(self, *args, **kwargs)
+        else:
+            entity.recycle(*args, **kwargs)
         self._entities.append(entity)
-        if isinstance(entity, Item):
-            self._items_count += 1
+        kind = self.get_entity_kind(type(entity))
+        self._kinds[kind][entity.get_uid()] = entity
+        self._grids[kind].update(entity)
+        if kind not in self.STATIC_KINDS:
+            self._active.append(entity)
+            self._active_uids.append(entity.get_uid())
+            self._active_set.add(entity.get_uid())
+        if self._motion_engine is not None and isinstance(entity, MotionEntity) and entity.NATURAL_MOTION:
+            self._motion_engine.register(entity)
         if self._add_entity_cb is not None:
             self._add_entity_cb(entity)
         return entity
@@ -272,30 +671,154 @@ class Stage:
     def add_effect(self, effect_type: EffectType, duration: float, x: float, y: float):
         self.add_entity(Effect, effect_type, duration).set_position(x, y)
 
+    def is_floor_exposed(self, floor: Floor) -> bool:
+        """ Return True if no other floor is directly on top of this floor. """
+        hitbox = floor.get_hitbox()
+        above = Hitbox(hitbox.get_min_x(), hitbox.get_max_y(), hitbox.get_max_x(), hitbox.get_max_y() + 0.5)
+        return next(self.foreach_colliding_entity(above, kinds=(Floor,)), None) is None
+
+    def get_exposed_floors(self) -> List[Floor]:
+        """ Return floors with no other floor directly on top, in insertion order, cached until floors change. """
+        version = self._grids[Floor].get_version()
+        if version != self._exposed_floors_version:
+            self._exposed_floors = [floor for floor in self._kinds[Floor].values() if self.is_floor_exposed(floor)]
+            self._exposed_floors_version = version
+        return self._exposed_floors
+
     def _try_spawn_random_item(self):
-        floors = [entity for entity in self._entities if isinstance(entity, Floor)]
+        # Items only spawn on top of floors, not under terrain.
+        floors = self.get_exposed_floors()
         floors_count = len(floors)
+        items_count = len(self._kinds[Item])
         items_limit = floors_count * self._living_players_count
-        if floors_count and self._items_count < items_limit:
-            floor = random.choice(floors)
+        if floors_count and items_count < items_limit:
+            floor = self._random.choice(floors)
             hitbox = floor.get_hitbox()
-            x_pos = random.uniform(hitbox.get_min_x(), hitbox.get_max_x())
+            x_pos = self._random.uniform(hitbox.get_min_x(), hitbox.get_max_x())
             y_pos = hitbox.get_max_y() + 1.0
-            incarnation_type = random.choice(list(IncarnationType))
+            incarnation_type = self._random.choice(list(IncarnationType))
             self.add_entity(Item, incarnation_type).set_position(x_pos, y_pos)
-            if self._items_count < self._living_players_count:
+            if items_count + 1 < self._living_players_count:
                 next_in = 1
             else:
                 next_in = 8
         else:
             next_in = 5
-        self._next_item_spawn = time.monotonic() + random.uniform(next_in, next_in + 3.0)
+        self._next_item_spawn = self.get_time() + self._random.uniform(next_in, next_in + 3.0)
 
     def get_entities(self) -> List[Entity]:
         return self._entities
 
-    def foreach_colliding_entity(self, box: Hitbox, *, predicate: Optional[Callable[[Entity], bool]] = None) -> Generator[Entity, None, None]:
-        for entity in self._entities:
+    def get_entities_of(self, kind: Type[E]) -> Collection[E]:
+        """ Return entities of a kind from `ENTITY_KINDS` (or `Entity` for others), in insertion order. """
+        return self._kinds[kind].values()
+
+    @classmethod
+    def get_entity_kind(cls, entity_type: Type[Entity]) -> Type[Entity]:
+        kind = cls._KINDS_CACHE.get(entity_type)
+        if kind is None:
+            kind = next((kind for kind in cls.ENTITY_KINDS if issubclass(entity_type, kind)), Entity)
+            cls._KINDS_CACHE[entity_type] = kind
+        return kind
+
+    # Scheduling
+
+    def suspend_entity(self, entity: Entity, until: Optional[float] = None):
+
+        """
+        Stop updating an entity until the given simulation time, or until it is
+        resumed if no time is given. The entity is resumed as soon as it dies,
+        so suspending an entity is only valid if its update has nothing to do
+        until then.
+        """
+
+        if until is None:
+            deadline = -1
+        else:
+            # First tick where `get_time() >= until`, like entities check it.
+            deadline = max(self._tick + 1, math.ceil(until * self._tick_rate) - 1)
+            while deadline / self._tick_rate < until:
+                deadline += 1
+
+        uid = entity.get_uid()
+        self._suspended[uid] = deadline
+        self._active_dirty = True
+        if deadline >= 0:
+            heapq.heappush(self._timers, (deadline, uid, entity))
+
+        # The motion engine must not integrate the velocity of suspended entities.
+        if self._motion_engine is not None and isinstance(entity, MotionEntity):
+            self._motion_engine.unregister(entity)
+
+    def resume_entity(self, entity: Entity):
+
+        """ Resume a suspended entity, it is updated in this tick if it comes after the current entity. """
+
+        uid = entity.get_uid()
+        suspended = self._suspended.pop(uid, None) is not None
+
+        if suspended and self._motion_engine is not None and isinstance(entity, MotionEntity) \
+                and entity.NATURAL_MOTION and not entity.is_dead():
+            self._motion_engine.register(entity)
+
+        if uid not in self._active_set and uid in self._kinds[self.get_entity_kind(type(entity))]:
+            index = bisect_left(self._active_uids, uid)
+            self._active.insert(index, entity)
+            self._active_uids.insert(index, uid)
+            self._active_set.add(uid)
+            if 0 <= index <= self._active_cursor:
+                self._active_cursor += 1
+
+    def is_entity_suspended(self, entity: Entity) -> bool:
+        return entity.get_uid() in self._suspended
+
+    def get_active_count(self) -> int:
+        """ Return the number of entities updated each tick. """
+        return len(self._active) - len(self._suspended.keys() & self._active_set)
+
+    def set_motion_engine(self, engine: Optional[MotionEngine]):
+        """ Set the optional motion engine integrating all motion entities at once, or None for per-entity integration. """
+        self._motion_engine = engine
+        if engine is not None:
+            for entity in self._entities:
+                if isinstance(entity, MotionEntity) and entity.NATURAL_MOTION and not entity.is_dead() \
+                        and entity.get_uid() not in self._suspended:
+                    engine.register(entity)
+
+    def get_motion_engine(self) -> Optional[MotionEngine]:
+        return self._motion_engine
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """ Return the statistics of the pool of each pooled entity kind, by kind name. """
+        return {kind.__name__: pool.get_stats() for kind, pool in self._pools.items()}
+
+    def update_entity_cell(self, entity: Entity):
+        """ Must be called when the hitbox of an entity has moved, to keep the broadphase up to date. """
+        self._grids[self.get_entity_kind(type(entity))].update(entity)
+
+    def foreach_colliding_entity(self, box: Hitbox, *,
+                                 kinds: Optional[Tuple[Type[Entity], ...]] = None,
+                                 predicate: Optional[Callable[[Entity], bool]] = None) -> Generator[Entity, None, None]:
+
+        """
+        Iterate over entities colliding the given box, in insertion order.
+        :param box: The box to check.
+        :param kinds: If specified, only entities of these kinds (from `ENTITY_KINDS`) are checked.
+        :param predicate: Optional predicate entities must validate.
+        """
+
+        if kinds is None:
+            kinds = self._grids.keys()
+
+        if len(kinds) == 1:
+            candidates = self._grids[kinds[0]].query(box)
+        else:
+            candidates = []
+            for kind in kinds:
+                candidates.extend(self._grids[kind].query(box))
+            candidates.sort(key=Entity.get_uid)
+
+        for entity in candidates:
             if predicate is None or predicate(entity):
                 if entity.get_hitbox().intersects(box):
                     yield entity
@@ -307,6 +830,44 @@ class Stage:
     def get_players(self) -> Dict[int, Player]:
         return {idx: player for idx, (player, _) in self._players.items()}
 
+    def get_tick(self) -> int:
+        """ Return the number of ticks simulated since the creation of the stage. """
+        return self._tick
+
+    def new_entity_uid(self) -> int:
+        """ Return a new UID for an entity of this stage, UIDs are given in increasing order. """
+        uid = self._next_uid
+        self._next_uid += 1
+        return uid
+
+    def get_random(self) -> random.Random:
+        """
+        Return the random generator of the stage. Gameplay code must use it
+        instead of the global `random` module, so that a stage simulated again
+        with the same seed and inputs gives the same result. Cosmetic
+        randomness (views) must not use it.
+        """
+        return self._random
+
+    def get_seed(self) -> int:
+        return self._seed
+
+    def set_seed(self, seed: int):
+        """ Reset the random generator of the stage with a new seed. """
+        self._seed = seed
+        self._random.seed(seed)
+
+    def get_time(self) -> float:
+        """
+        Return the simulation time in seconds, computed from the current tick.
+        Gameplay code must use this instead of the wall clock, so that the
+        stage can run faster than real time, be paused or be resimulated.
+        """
+        return self._tick / self._tick_rate
+
+    def get_tick_rate(self) -> int:
+        return self._tick_rate
+
     def stop_running(self):
         self._running = False
 
@@ -316,22 +877,234 @@ class Stage:
     def get_winner(self) -> Optional[Player]:
         return self._winner
 
+    # State
+
+    def save_state(self) -> 'StageState':
+
+        """
+        Capture the state of the stage between two ticks: entities, players,
+        scheduler, random generator and terrain. Entities are packed into one
+        buffer with their `save_state`, references between them are saved as
+        UIDs. Dead players removed from the stage are saved too, since other
+        entities may still reference them. The terrain is only copied if it
+        was modified since the last saved state, otherwise the copy is shared.
+        Pending inputs, pools and callbacks are not part of the state.
+        """
+
+        out = bytearray(_STATE_HEADER.size)
+
+        stage_players = self._kinds[Player]
+        for player_idx, (player, spawn_index) in self._players.items():
+            out += _STATE_PLAYER.pack(player_idx, spawn_index, player.get_uid(), player.get_uid() in stage_players)
+
+        for _, _, used in self._spawn_points:
+            out.append(used)
+
+        for uid, deadline in self._suspended.items():
+            out += _STATE_SUSPENDED.pack(uid, deadline)
+
+        codes = self._STATE_CODES
+        records = [*self._entities, *(player for player, _ in self._players.values() if player.get_uid() not in stage_players)]
+        for entity in records:
+            code = codes.get(type(entity))
+            if code is None:
+                raise ValueError("Entities of type {} can't be saved.".format(type(entity).__name__))
+            out.append(code)
+            entity.save_state(out)
+
+        _STATE_HEADER.pack_into(out, 0, self._tick, self._next_uid, self._running, self._finished,
+                                0 if self._winner is None else self._winner.get_uid(),
+                                self._living_players_count, self._next_item_spawn,
+                                len(self._players), len(self._spawn_points), len(self._suspended), len(records))
+
+        if self._terrain_copy is None or self._terrain_copy[0] != self._terrain_version:
+            self._terrain_copy = (self._terrain_version, bytes(self._terrain))
+
+        return StageState(bytes(out), self._random.getstate(), self._seed, *self._terrain_copy)
+
+    def load_state(self, state: 'StageState'):
+
+        """
+        Restore a state returned by `save_state` of this stage, between two
+        ticks. Entities that are both in the stage and in the state (same UID
+        and type) are updated in place, others are removed or created (taken
+        from pools if possible), and callbacks are called for them like for
+        any added or removed entity. Pending inputs are discarded.
+        """
+
+        data = state.data
+        tick, next_uid, running, finished, winner_uid, living_players_count, next_item_spawn, \
+            players_count, spawn_points_count, suspended_count, records_count = _STATE_HEADER.unpack_from(data)
+        offset = _STATE_HEADER.size
+
+        # Entities currently in the stage, and all objects that can be reused by UID.
+        previous = {entity.get_uid(): entity for entity in self._entities}
+        reusable = previous.copy()
+        for player, _ in self._players.values():
+            reusable[player.get_uid()] = player
+
+        # Entities of the state by UID, players first as other entities may reference them.
+        entities: Dict[int, Entity] = {}
+        out_players: Set[int] = set()
+        self._players.clear()
+        for _ in range(players_count):
+            player_idx, spawn_index, uid, in_stage = _STATE_PLAYER.unpack_from(data, offset)
+            offset += _STATE_PLAYER.size
+            player = reusable.pop(uid, None)
+            if type(player) is not Player:
+                player = Player.new_for_state(self)
+            entities[uid] = player
+            self._players[player_idx] = (player, spawn_index)
+            if not in_stage:
+                out_players.add(uid)
+
+        for spawn_point in self._spawn_points[:spawn_points_count]:
+            spawn_point[2] = bool(data[offset])
+            offset += 1
+
+        self._suspended.clear()
+        for _ in range(suspended_count):
+            uid, deadline = _STATE_SUSPENDED.unpack_from(data, offset)
+            offset += _STATE_SUSPENDED.size
+            self._suspended[uid] = deadline
+
+        kinds = self.ENTITY_KINDS
+        static_kinds = self.STATIC_KINDS
+        moved_statics: List[Entity] = []
+        self._entities.clear()
+        for _ in range(records_count):
+            kind = kinds[data[offset]]
+            uid = _STATE_UID.unpack_from(data, offset + 1)[0]
+            entity = entities.get(uid)
+            if entity is None:
+                entity = reusable.pop(uid, None)
+                if type(entity) is not kind:
+                    pool = self._pools.get(kind)
+                    entity = None if pool is None else pool.take()
+                    if entity is None:
+                        entity = kind.new_for_state(self)
+                entities[uid] = entity
+            if kind in static_kinds:
+                hitbox = entity.get_hitbox()
+                box = hitbox.get_min_x(), hitbox.get_min_y(), hitbox.get_max_x(), hitbox.get_max_y()
+                offset = entity.load_state(data, offset + 1, entities)
+                if previous.get(uid) is not entity or box != (hitbox.get_min_x(), hitbox.get_min_y(), hitbox.get_max_x(), hitbox.get_max_y()):
+                    moved_statics.append(entity)
+            else:
+                offset = entity.load_state(data, offset + 1, entities)
+            if uid not in out_players:
+                self._entities.append(entity)
+
+        # Broadphase and buckets.
+        removed_entities = [entity for uid, entity in previous.items() if entities.get(uid) is not entity]
+        for entity in removed_entities:
+            self._grids[self.get_entity_kind(type(entity))].remove(entity)
+        for bucket in self._kinds.values():
+            bucket.clear()
+        added_entities: List[Entity] = []
+        for entity in self._entities:
+            uid = entity.get_uid()
+            kind = self.get_entity_kind(type(entity))
+            self._kinds[kind][uid] = entity
+            if kind not in static_kinds:
+                self._grids[kind].update(entity)
+            if previous.get(uid) is not entity:
+                added_entities.append(entity)
+        for entity in moved_statics:
+            self._grids[self.get_entity_kind(type(entity))].update(entity)
+
+        # Scheduler, timers are only kept for suspended entities.
+        suspended = self._suspended
+        self._active[:] = [entity for entity in self._entities
+                           if self.get_entity_kind(type(entity)) not in static_kinds and entity.get_uid() not in suspended]
+        self._active_uids[:] = [entity.get_uid() for entity in self._active]
+        self._active_set = set(self._active_uids)
+        self._active_cursor = -1
+        self._active_dirty = False
+        self._timers[:] = [(deadline, uid, entities[uid]) for uid, deadline in suspended.items() if deadline >= 0]
+        heapq.heapify(self._timers)
+
+        if self._motion_engine is not None:
+            self._motion_engine.clear()
+            for entity in self._active:
+                if isinstance(entity, MotionEntity) and entity.NATURAL_MOTION and not entity.is_dead():
+                    self._motion_engine.register(entity)
+
+        self._hit_requests.clear()
+        self._inputs.clear()
+
+        self._tick = tick
+        self._next_uid = next_uid
+        self._running = running
+        self._finished = finished
+        self._winner = None if winner_uid == 0 else cast(Player, entities[winner_uid])
+        self._living_players_count = living_players_count
+        self._next_item_spawn = next_item_spawn
+        self._random.setstate(state.random_state)
+        self._seed = state.seed
+
+        if state.terrain_version != self._terrain_version:
+            self._terrain[:] = state.terrain
+            self._terrain_version = state.terrain_version
+            self._terrain_copy = (state.terrain_version, state.terrain)
+
+        if len(removed_entities):
+            if self._remove_entity_cb is not None:
+                self._remove_entity_cb([entity.get_uid() for entity in removed_entities])
+            for entity in removed_entities:
+                pool = self._pools.get(type(entity))
+                if pool is not None:
+                    pool.give(entity)
+
+        if self._add_entity_cb is not None:
+            for entity in added_entities:
+                self._add_entity_cb(entity)
+
     # Terrain
 
     def set_terrain(self, left: int, bottom: int, *terrain: Union[bytes, bytearray]):
+        width, height = self._size
+        if left < 0 or bottom < 0 or bottom + len(terrain) > height:
+            raise ValueError("Terrain out of the stage.")
         for row in reversed(terrain):
-            if left + len(row) >= self._size[0]:
+            if left + len(row) > width:
                 raise ValueError("Row too long.")
             index = self.get_tile_index(left, bottom)
             self._terrain[index:index + len(row)] = row
             bottom += 1
+        self._on_terrain_modified()
 
-    def get_terrain(self) -> bytearray:
+    def get_terrain(self) -> TerrainBuffer:
+        """ Return the terrain buffer, it must only be modified through `set_terrain` and `set_tile`. """
         return self._terrain
 
+    def set_terrain_buffer(self, terrain: TerrainBuffer):
+        """ Replace the whole terrain by the given writable buffer, without copying it. """
+        if len(terrain) != len(self._terrain):
+            raise ValueError("Terrain buffer size must be {}.".format(len(self._terrain)))
+        if isinstance(terrain, memoryview) and terrain.readonly:
+            raise ValueError("Terrain buffer must be writable.")
+        self._terrain = terrain
+        self._on_terrain_modified()
+
+    def _on_terrain_modified(self):
+        self._terrain_edits += 1
+        self._terrain_version = self._terrain_edits
+
     def add_spawn_point(self, x: float, y: float) -> None:
         self._spawn_points.append([x, y, False])
 
+    def get_spawn_points(self) -> List[Tuple[float, float]]:
+        return [(x, y) for x, y, _ in self._spawn_points]
+
+    def set_kill_bounds(self, min_x: float, min_y: float, max_x: float):
+        """ Set the bounds out of which players are killed, by default 1 tile from the sides and 10 under the stage. """
+        self._kill_bounds = (min_x, min_y, max_x)
+
+    def get_kill_bounds(self) -> Tuple[float, float, float]:
+        """ Return the bounds out of which players are killed: (min x, min y, max x). """
+        return self._kill_bounds
+
     # Tiles
 
     def get_tile_index(self, x: int, y: int) -> int:
@@ -354,6 +1127,7 @@ class Stage:
         width, height = self._size
         if 0 <= x < width and 0 <= y < height:
             self._terrain[self.get_tile_index(x, y)] = ord(tile)
+            self._on_terrain_modified()
 
     def for_each_tile(self) -> Generator[Tuple[int, int, int], None, None]:
         i = 0
@@ -362,6 +1136,49 @@ class Stage:
                 yield x, y, self._terrain[i]
                 i += 1
 
+    def for_each_solid_tile(self, min_x: int = 0, max_x: Optional[int] = None) -> Generator[Tuple[int, int, int], None, None]:
+
+        """
+        Iterate over tiles that are not air, optionally only in the columns
+        from `min_x` to `max_x` excluded. Air is skipped row by row without
+        visiting each tile, so sparse terrains of wide stages stay cheap.
+        """
+
+        width, height = self._size
+        min_x = max(0, min_x)
+        max_x = width if max_x is None else min(width, max_x)
+        terrain = self._terrain
+        for y in range(height):
+            row_start = y * width
+            for match in _NON_AIR_TILE.finditer(terrain, row_start + min_x, row_start + max_x):
+                index = match.start()
+                yield index - row_start, y, terrain[index]
+
+    def extract_floor_boxes(self) -> List[Tuple[int, int, int, int]]:
+
+        """
+        Return merged boxes (min x, min y, max x, max y) covering exactly the
+        solid tiles of the terrain, the tile row y covers [y - 1, y] in the world.
+        The boxes are the minimum partition of the solid tiles in rectangles,
+        see `_partition_rectangles`. Boxes are sorted from top to bottom, then
+        from left to right.
+        """
+
+        width, height = self._size
+        solid = bytes(self._terrain).translate(Tile.SOLID_TRANSLATION)
+        boxes = [(min_x, min_y - 1, max_x, max_y - 1) for min_x, min_y, max_x, max_y in _partition_rectangles(solid, width, height)]
+        boxes.sort(key=lambda box: (-box[3], box[0]))
+        return boxes
+
+    def add_terrain_floors(self) -> List[Floor]:
+        """ Add floors matching the solid tiles of the terrain, see `extract_floor_boxes`. """
+        floors = []
+        for box in self.extract_floor_boxes():
+            floor = self.add_entity(Floor)
+            floor.set_box(*box)
+            floors.append(floor)
+        return floors
+
     # Callbacks
 
     def set_add_entity_callback(self, callback: AddEntityCallback):
@@ -370,12 +1187,15 @@ class Stage:
     def set_remove_entity_callback(self, callback: RemoveEntityCallback):
         self._remove_entity_cb = callback
 
+    def set_input_callback(self, callback: InputCallback):
+        self._input_cb = callback
+
     # Factory
 
     @classmethod
-    def new_example_stage(cls) -> 'Stage':
+    def new_example_stage(cls, seed: Optional[int] = None, tick_rate: int = TICK_RATE) -> 'Stage':
 
-        stage = cls(30, 13)
+        stage = cls(30, 13, seed, tick_rate)
 
         stage.set_terrain(
             4, 0,
@@ -386,31 +1206,25 @@ class Stage:
             b"     mnkkko 8   mno",
             b"       mno  9"
         )
-        floor = stage.add_entity(Floor)
-        floor.get_hitbox().set_positions(4, 2, 26, 4)
 
         stage.set_terrain(
             7, 8,
             b"b",
             b"yzzz",
         )
-        floor = stage.add_entity(Floor)
-        floor.get_hitbox().set_positions(7, 7, 11, 8)
 
         stage.set_terrain(
             13, 12,
             b"yzz1",
         )
-        floor = stage.add_entity(Floor)
-        floor.get_hitbox().set_positions(13, 11, 17, 12)
 
         stage.set_terrain(
             19, 8,
             b"  b",
             b"yzz1",
         )
-        floor = stage.add_entity(Floor)
-        floor.get_hitbox().set_positions(19, 7, 23, 8)
+
+        stage.add_terrain_floors()
 
         stage.add_spawn_point(12, 5)
         stage.add_spawn_point(18, 5)
@@ -418,3 +1232,11 @@ class Stage:
         stage.add_spawn_point(24, 5)
 
         return stage
+
+    @classmethod
+    def new_crowd_stage(cls, seed: Optional[int] = None, tick_rate: int = TICK_RATE) -> 'Stage':
+        """ The example stage with 16 spawn points, its first 4 are the ones of the example stage. """
+        stage = cls.new_example_stage(seed, tick_rate)
+        for i in range(12):
+            stage.add_spawn_point(6.75 + i * 1.5, 5)
+        return stage
@@ -0,0 +1,191 @@
+"""
+Binary stage file format, holding the terrain, floors, spawn points and kill
+bounds of a stage. All values are little-endian:
+
+- header: magic `RSTG`, version (u16), reserved (u16), width and height (u32),
+  floors and spawn points counts (u32), kill bounds min x, min y, max x (f64);
+- floors: min x, min y, max x, max y (f64) for each floor;
+- spawn points: x, y (f64) for each spawn point;
+- terrain: width * height tile ids, row by row from the bottom.
+
+The terrain is the tail of the file, it is memory-mapped (copy-on-write) and
+used as the terrain buffer of the stage without being read nor copied.
+Usage: `python stage_file.py export example ../res/stages/example.stage`
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import struct
+import mmap
+import re
+
+from stage import Stage, Tile
+from entity.floor import Floor
+from res import get_res
+
+
+MAGIC = b"RSTG"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIIII3d")
+FLOOR = struct.Struct("<4d")
+SPAWN_POINT = struct.Struct("<2d")
+
+# Any tile that is not a valid tile id, air or unset.
+_INVALID_TILE = re.compile(b"[^" + b"".join(re.escape(bytes((tile_id,))) for tile_id in (*Tile.VALID_TILES_IDS, 0, Tile.TILE_AIR)) + b"]")
+
+
+class StageFileError(ValueError):
+    pass
+
+
+class StageFileInfo:
+
+    """ Header of a stage file, readable without loading the stage. """
+
+    __slots__ = "width", "height", "floors_count", "spawn_points_count", "kill_bounds"
+
+    def __init__(self, width: int, height: int, floors_count: int, spawn_points_count: int, kill_bounds: Tuple[float, float, float]):
+        self.width = width
+        self.height = height
+        self.floors_count = floors_count
+        self.spawn_points_count = spawn_points_count
+        self.kill_bounds = kill_bounds
+
+    def get_terrain_offset(self) -> int:
+        return HEADER.size + self.floors_count * FLOOR.size + self.spawn_points_count * SPAWN_POINT.size
+
+    def get_file_size(self) -> int:
+        return self.get_terrain_offset() + self.width * self.height
+
+
+def _unpack_info(data) -> StageFileInfo:
+
+    if len(data) < HEADER.size:
+        raise StageFileError("Truncated stage file header.")
+
+    magic, version, _, width, height, floors_count, spawn_points_count, *kill_bounds = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise StageFileError("Not a stage file.")
+    if version != VERSION:
+        raise StageFileError("Unsupported stage file version {}.".format(version))
+
+    return StageFileInfo(width, height, floors_count, spawn_points_count, tuple(kill_bounds))
+
+
+def read_stage_info(path: str) -> StageFileInfo:
+    """ Read only the header of a stage file. """
+    with open(path, "rb") as fp:
+        return _unpack_info(fp.read(HEADER.size))
+
+
+def validate_terrain(terrain) -> None:
+    """ Raise a `StageFileError` if the terrain contains a tile that is not in `Tile.VALID_TILES`, air or unset. """
+    invalid = _INVALID_TILE.search(terrain)
+    if invalid is not None:
+        raise StageFileError("Invalid tile {!r} at index {}.".format(invalid.group(), invalid.start()))
+
+
+def load_stage(path: str, *, validate: bool = True, seed: Optional[int] = None,
+               tick_rate: int = Stage.TICK_RATE) -> Stage:
+
+    """
+    Load a stage from a stage file. The terrain is memory-mapped in copy-on-write
+    mode: the stage can modify it without modifying the file.
+    """
+
+    with open(path, "rb") as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_COPY)
+        except ValueError:  # Empty file
+            raise StageFileError("Truncated stage file header.")
+
+    info = _unpack_info(data)
+    terrain_offset = info.get_terrain_offset()
+    if len(data) != info.get_file_size():
+        raise StageFileError("Invalid stage file size {}, expected {}.".format(len(data), info.get_file_size()))
+
+    terrain = memoryview(data)[terrain_offset:]
+    if validate:
+        validate_terrain(terrain)
+
+    stage = Stage(info.width, info.height, seed, tick_rate)
+    stage.set_terrain_buffer(terrain)
+    stage.set_kill_bounds(*info.kill_bounds)
+
+    offset = HEADER.size
+    for _ in range(info.floors_count):
+        stage.add_entity(Floor).set_box(*FLOOR.unpack_from(data, offset))
+        offset += FLOOR.size
+
+    for _ in range(info.spawn_points_count):
+        stage.add_spawn_point(*SPAWN_POINT.unpack_from(data, offset))
+        offset += SPAWN_POINT.size
+
+    return stage
+
+
+def save_stage(stage: Stage, path: str):
+
+    """ Save the terrain, floors, spawn points and kill bounds of a stage. """
+
+    width, height = stage.get_size()
+    floors = list(stage.get_entities_of(Floor))
+    spawn_points = stage.get_spawn_points()
+
+    with open(path, "wb") as fp:
+        fp.write(HEADER.pack(MAGIC, VERSION, 0, width, height, len(floors), len(spawn_points), *stage.get_kill_bounds()))
+        for floor in floors:
+            hitbox = floor.get_hitbox()
+            fp.write(FLOOR.pack(hitbox.get_min_x(), hitbox.get_min_y(), hitbox.get_max_x(), hitbox.get_max_y()))
+        for x, y in spawn_points:
+            fp.write(SPAWN_POINT.pack(x, y))
+        fp.write(stage.get_terrain())
+
+
+# Stages that can be exported by the command line, constructed with an optional seed and tick rate.
+FACTORIES: Dict[str, Callable[..., Stage]] = {
+    "example": Stage.new_example_stage,
+    "crowd": Stage.new_crowd_stage
+}
+
+
+def new_stage_from_source(stage_source: str, seed: Optional[int] = None, tick_rate: int = Stage.TICK_RATE) -> Stage:
+    """ Create a stage from a factory name of `FACTORIES` or a stage file resource path. """
+    factory = FACTORIES.get(stage_source)
+    if factory is not None:
+        return factory(seed, tick_rate)
+    return load_stage(get_res(stage_source), seed=seed, tick_rate=tick_rate)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export and check stage files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="export a built-in stage to a stage file")
+    export_parser.add_argument("name", choices=FACTORIES.keys())
+    export_parser.add_argument("path")
+    check_parser = commands.add_parser("check", help="load stage files and print their header")
+    check_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        save_stage(FACTORIES[args.name](), args.path)
+        print("Stage '{}' exported to {}".format(args.name, args.path))
+    else:
+        failed: List[str] = []
+        for path in args.paths:
+            try:
+                info = read_stage_info(path)
+                load_stage(path)
+                print("{}: {}x{}, {} floors, {} spawn points".format(
+                    path, info.width, info.height, info.floors_count, info.spawn_points_count))
+            except (OSError, StageFileError) as e:
+                print("{}: {}".format(path, e))
+                failed.append(path)
+        if len(failed):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -52,6 +52,9 @@ class View(ABC):
     def on_enter(self): ...
     def on_quit(self): ...
 
+    def update(self):
+        """ Appelée avant chaque tick de simulation, à pas fixe contrairement à `draw`. """
+
     @abstractmethod
     def _inner_init(self): ...
 
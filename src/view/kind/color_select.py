@@ -9,7 +9,9 @@ from pygame import Surface
 import pygame
 
 from entity.player import PlayerColor
+from stage_file import load_stage, StageFileError
 from stage import Stage
+from res import get_res
 import time
 
 
@@ -20,6 +22,9 @@ class ColorSelectView(View):
 
     BACKGROUND_COLOR = 133, 43, 24
 
+    # Fichier du stage chargé au lancement de la partie, relatif au dossier des ressources.
+    STAGE_FILE = "stages/example.stage"
+
     def __init__(self):
 
         super().__init__()
@@ -86,10 +91,16 @@ class ColorSelectView(View):
         self._start_button.set_visible(self._color_grid.get_selections_count() > 1)
 
     def _on_start_action(self, _button):
-        stage = Stage.new_example_stage()
+        try:
+            stage = load_stage(get_res(self.STAGE_FILE))
+            stage_source = self.STAGE_FILE
+        except (OSError, StageFileError) as e:
+            print("[STAGE] Failed to load stage file {}, using the example stage: {}".format(self.STAGE_FILE, e))
+            stage = Stage.new_example_stage()
+            stage_source = "example"
         for player_idx, player_color in self._color_grid.get_selections().items():
             stage.add_player(player_idx, player_color)
-        self._shared_data.get_game().set_stage(stage)
+        self._shared_data.get_game().set_stage(stage, stage_source)
         self._shared_data.get_game().show_view("in_game")
 
 
@@ -5,14 +5,15 @@ from view.player import get_player_color
 from view.controls import KEYS_PLAYERS
 from stage import Stage, Tile
 from view import View
+from pool import Pool
 
-from entity.player import Player, IncarnationType
+from entity.player import Player, PlayerInput, IncarnationType
 from entity.effect import Effect, EffectType
 from entity.bullet import Bullet
 from entity.item import Item
 from entity import Entity
 
-from typing import Optional, Dict, Type, Callable, Tuple, cast
+from typing import Optional, Dict, Type, Callable, Tuple, List, cast
 from pygame.event import Event
 from pygame import Surface
 import traceback
@@ -27,12 +28,18 @@ class EntityDrawer:
     __slots__ = "entity", "view", "offsets"
 
     DEBUG_HITBOXES = False
+    # True for drawers of pooled entities, reused through `recycle`.
+    POOLED = False
 
     def __init__(self, entity: Entity, view: 'InGameView', size: Tuple[int, int]):
         self.entity = entity
         self.view = view
         self.offsets = self._calc_offsets(size)
 
+    def recycle(self, entity: Entity):
+        """ Reset a pooled drawer for a new entity of the same type. """
+        self.entity = entity
+
     @classmethod
     def undefined_drawer(cls, entity: Entity, view: 'InGameView'):
         return cls(entity, view, (0, 0))
@@ -238,6 +245,7 @@ class EffectDrawer(EntityDrawer):
     __slots__ = "anim_surface", "tracker", "effect_type"
 
     DEBUG_HITBOXES = False
+    POOLED = True
 
     EFFECT_ANIMS = {
         EffectType.SMOKE: (("smoke", 6, 1),),
@@ -254,18 +262,34 @@ class EffectDrawer(EntityDrawer):
         if self.effect_type in self.EFFECT_ANIMS:
             self.tracker.set_anim(*self.EFFECT_ANIMS[self.effect_type])
 
+    def recycle(self, entity: Effect):
+        super().recycle(entity)
+        self.effect_type = entity.get_effect_type()
+        if self.effect_type in self.EFFECT_ANIMS:
+            self.tracker.set_anim(*self.EFFECT_ANIMS[self.effect_type])
+        else:
+            self.tracker.set_anim()
+
     def draw(self, surface: Surface):
         self.anim_surface.blit_on(surface, self._get_draw_pos(), self.tracker)
 
 
 class BulletDrawer(EntityDrawer):
 
+    __slots__ = "anim_surface", "tracker"
+
+    POOLED = True
+
     def __init__(self, entity: Entity, view: 'InGameView'):
         super().__init__(entity, view, (InGameView.EFFECT_SIZE, InGameView.EFFECT_SIZE))
         self.anim_surface = view.get_effect_anim_surface()
         self.tracker = AnimTracker()
         self.tracker.set_anim(("corn_bullet", 14, -1))
 
+    def recycle(self, entity: Entity):
+        super().recycle(entity)
+        self.tracker.set_anim(("corn_bullet", 14, -1))
+
     def _calc_offsets(self, size: Tuple[int, int]) -> Tuple[int, int]:
         return -int(size[0] / 2), -int(size[1] / 2)
 
@@ -361,13 +385,26 @@ class InGameView(View):
         Bullet: BulletDrawer
     }
 
+    ACTIONS_INPUTS = {
+        "up": PlayerInput.UP,
+        "down": PlayerInput.DOWN,
+        "left": PlayerInput.LEFT,
+        "right": PlayerInput.RIGHT,
+        "action": PlayerInput.ACTION,
+        "heavy_action": PlayerInput.HEAVY_ACTION
+    }
+
     TILE_SIZE = 48
     PLAYER_SIZE = 96
     ITEM_SIZE = 96
     EFFECT_SIZE = 96
 
     CAMERA_WIDTH_MIN = 20
+    CAMERA_WIDTH_MAX = 32
     CAMERA_WIDTH_MARGIN = 8
+    # Largeur (en tuiles) de la fenêtre de colonnes pré-rendue autour de la caméra, la taille des
+    # surfaces ne dépend donc pas de la largeur du stage.
+    TERRAIN_WINDOW_WIDTH = 48
 
     CAMERA_UPDATE_THRESHOLD = 0.02
 
@@ -388,6 +425,9 @@ class InGameView(View):
         self._stage: Optional[Stage] = None
         self._stage_size = (0, 0)
         self._stage_ratio = 0
+        # Première colonne et largeur de la fenêtre de terrain pré-rendue.
+        self._window_x = 0
+        self._window_width = 0
 
         # Surfaces "not-scaled"
         self._terrain_surface: Optional[Surface] = None
@@ -402,6 +442,11 @@ class InGameView(View):
         self._scaled_surface_pos = (0, 0)
 
         self._entities: Dict[int, EntityDrawer] = {}
+        # Drawers of removed pooled entities, by entity type.
+        self._drawer_pools: Dict[Type[Entity], Pool[EntityDrawer]] = {
+            entity_type: Pool() for entity_type, constructor in self.ENTITY_DRAWERS.items()
+            if getattr(constructor, "POOLED", False)
+        }
 
         self._stop_running_at: Optional[float] = None
 
@@ -411,6 +456,8 @@ class InGameView(View):
 
         self._stop_running_at = None
         self._entities.clear()
+        for pool in self._drawer_pools.values():
+            pool.clear()
 
         self._background_surface = self._shared_data.get_image("fightbackground.png")
 
@@ -429,7 +476,7 @@ class InGameView(View):
             for entity in self._stage.get_entities():
                 self._on_entity_added(entity)
 
-            self._redraw_terrain()
+            self._init_terrain()
 
             print("[DRAW] Stage loaded.")
 
@@ -458,22 +505,23 @@ class InGameView(View):
         return self._effect_anim_surface
 
     def get_screen_pos(self, x: float, y: float) -> Tuple[int, int]:
-        return int(x * self.TILE_SIZE), self._y_offset - int(y * self.TILE_SIZE)
+        return int((x - self._window_x) * self.TILE_SIZE), self._y_offset - int(y * self.TILE_SIZE)
 
     # Private #
 
-    def _redraw_terrain(self):
+    def _init_terrain(self):
 
         print("[DRAW] Drawing stage terrain...")
 
         width, height = self._stage.get_size()
+        window_width = min(width, self.TERRAIN_WINDOW_WIDTH)
 
-        height_factor = math.ceil(width / height)
+        height_factor = math.ceil(window_width / height)
         old_height = height
         height *= height_factor
 
         unscaled_size = (
-            width * self.TILE_SIZE,
+            window_width * self.TILE_SIZE,
             height * self.TILE_SIZE
         )
 
@@ -482,28 +530,49 @@ class InGameView(View):
         self._terrain_surface = Surface(unscaled_size, pygame.HWSURFACE, self._background_surface)
         self._final_surface = Surface(unscaled_size, pygame.HWSURFACE)
 
-        pygame.transform.scale(self._background_surface, unscaled_size, self._terrain_surface)
+        self._stage_size = (width, height)
+        self._stage_ratio = height / window_width
+        self._window_width = window_width
+
+        self._redraw_terrain(0)
+
+        print("[DRAW] Stage terrain drawn!")
+
+    def _redraw_terrain(self, window_x: int):
 
-        for x, y, tile_id in self._stage.for_each_tile():
+        """ Dessine les colonnes du terrain de la fenêtre commençant à la colonne donnée. """
+
+        self._window_x = window_x
+        self._camera_dirty_pos = True
+
+        pygame.transform.scale(self._background_surface, self._terrain_surface.get_size(), self._terrain_surface)
+
+        for x, y, tile_id in self._stage.for_each_solid_tile(window_x, window_x + self._window_width):
             tile_name = self.TILES_NAMES.get(tile_id)
             if tile_name is not None:
                 tile_surface = self._terrain_tilemap.get_tile(tile_name)
                 if tile_surface is not None:
-                    self._terrain_surface.blit(tile_surface, (x * self.TILE_SIZE, self._y_offset - y * self.TILE_SIZE))
+                    self._terrain_surface.blit(tile_surface, ((x - window_x) * self.TILE_SIZE, self._y_offset - y * self.TILE_SIZE))
 
-        self._stage_size = (width, height)
-        self._stage_ratio = height / width
+    def _update_terrain_window(self):
 
-        print("[DRAW] Stage terrain drawn!")
+        """ Déplace la fenêtre de terrain si la caméra en sort, elle est alors centrée sur la caméra. """
+
+        start, width, mid = self._camera_range
+        window_x, window_width = self._window_x, self._window_width
+        if window_width < self._stage_size[0] and (start < window_x or start + width > window_x + window_width):
+            new_window_x = min(self._stage_size[0] - window_width, max(0, int(mid - window_width / 2)))
+            if new_window_x != window_x:
+                self._redraw_terrain(new_window_x)
 
     def _recompute_camera_scale(self, surface: Surface):
 
         if self._camera_dirty_pos:
 
             range_width = self._camera_range[1]
-            range_invert_ratio = self._stage_size[0] / range_width
+            range_invert_ratio = self._window_width / range_width
 
-            start_ratio = self._camera_range[0] / self._stage_size[0]
+            start_ratio = (self._camera_range[0] - self._window_x) / self._window_width
 
             surface_width, surface_height = surface.get_size()
 
@@ -524,16 +593,29 @@ class InGameView(View):
             print("[DRAW] This entity has no drawer constructor, using undefined drawer.")
             constructor = EntityDrawer.undefined_drawer
         try:
-            drawer = constructor(entity, self)
+            pool = self._drawer_pools.get(type(entity))
+            drawer = None if pool is None else pool.take()
+            if drawer is None:
+                drawer = constructor(entity, self)
+            else:
+                drawer.recycle(entity)
             self._entities[entity.get_uid()] = drawer
         except (Exception,) as e:
             print("[DRAW] Failed to construct {}: {}".format(constructor, e))
             traceback.print_exc()
 
-    def _on_entity_removed(self, euid: int):
-        # print("Entity removed from view: {}".format(euid))
-        if euid in self._entities:
-            del self._entities[euid]
+    def _on_entity_removed(self, euids: List[int]):
+        # print("Entities removed from view: {}".format(euids))
+        for euid in euids:
+            drawer = self._entities.pop(euid, None)
+            if drawer is not None and drawer.POOLED:
+                pool = self._drawer_pools.get(type(drawer.entity))
+                if pool is not None:
+                    pool.give(drawer)
+
+    def get_drawer_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """ Return the statistics of the drawers pool of each pooled entity type, by type name. """
+        return {entity_type.__name__: pool.get_stats() for entity_type, pool in self._drawer_pools.items()}
 
     def _inner_init(self):
 
@@ -565,6 +647,7 @@ class InGameView(View):
             surface.fill((0, 0, 0))
             return
 
+        self._update_terrain_window()
         self._final_surface.blit(self._terrain_surface, (0, 0))
 
         # Camera
@@ -589,7 +672,7 @@ class InGameView(View):
             camera_range_mid = self._stage_size[0]
         else:
             camera_range_width = max(cast(float, self.CAMERA_WIDTH_MIN), min(
-                cast(float, self._stage_size[0]),
+                cast(float, self._stage_size[0]), cast(float, self.CAMERA_WIDTH_MAX),
                 camera_range_max - camera_range_min + self.CAMERA_WIDTH_MARGIN
             ))
             camera_range_mid = min(cast(float, self._stage_size[0]), max(
@@ -610,25 +693,6 @@ class InGameView(View):
         pygame.transform.scale(self._final_surface, self._scaled_surface.get_size(), self._scaled_surface)
         surface.blit(self._scaled_surface, self._scaled_surface_pos)
 
-        # Actions keys
-        pressed_keys = pygame.key.get_pressed()
-        for (key, (player_idx, action)) in KEYS_PLAYERS.items():
-            if pressed_keys[key]:
-                player_entity = self._stage.get_player(player_idx)
-                if player_entity is not None:
-                    if action == "left":
-                        player_entity.move_left()
-                    elif action == "right":
-                        player_entity.move_right()
-                    elif action == "up":
-                        player_entity.move_jump()
-                    elif action == "down":
-                        player_entity.do_down_action()
-                    elif action == "action":
-                        player_entity.do_action()
-                    elif action == "heavy_action":
-                        player_entity.do_heavy_action()
-
         # Stop running
         if self._stop_running_at is None:
             if self._stage.is_finished():
@@ -637,8 +701,47 @@ class InGameView(View):
         elif time.monotonic() >= self._stop_running_at:
             self._shared_data.get_game().show_view("end")
 
+    def update(self):
+
+        if self._stage is None:
+            return
+
+        # En lecture de replay, les commandes enregistrées remplacent le clavier.
+        replay = self._shared_data.get_game().get_replay()
+        if replay is not None:
+            if not replay.apply_inputs():
+                self._stage.stop_running()
+            return
+
+        # En spectateur, le stage reproduit la partie du serveur.
+        if self._shared_data.get_game().is_watching():
+            return
+
+        # Les touches pressées sont converties en commandes, appliquées par le stage au début du tick.
+        pressed_keys = pygame.key.get_pressed()
+        inputs: Dict[int, int] = {}
+        for (key, (player_idx, action)) in KEYS_PLAYERS.items():
+            if pressed_keys[key]:
+                inputs[player_idx] = inputs.get(player_idx, 0) | self.ACTIONS_INPUTS[action]
+
+        session = self._shared_data.get_game().get_session()
+        if session is not None:
+            # En ligne, le joueur local est contrôlé avec les touches du premier joueur.
+            session.set_local_input(inputs.get(0, 0))
+            return
+
+        for player_idx, commands in inputs.items():
+            self._stage.set_input(player_idx, commands)
+
     def event(self, event: Event):
         super().event(event)
+        game = self._shared_data.get_game()
+        if game.get_replay() is not None and event.type == pygame.KEYDOWN:
+            # Page haut/bas pour doubler/diviser par deux la vitesse de lecture.
+            if event.key == pygame.K_PAGEUP:
+                game.set_replay_speed(game.get_replay_speed() * 2)
+            elif event.key == pygame.K_PAGEDOWN:
+                game.set_replay_speed(game.get_replay_speed() // 2)
 
 
 def _lerp_color(from_color: Tuple[int, int, int], to_color: Tuple[int, int, int], ratio: float) -> Tuple[int, int, int]: